@@ -26,7 +26,7 @@ import fnmatch
 import logging
 import os
 import shutil
-from typing import Any, Dict, List, Optional, cast
+from typing import Any, Dict, List, Optional, Set, cast
 
 import git  # type: ignore
 from pkg_resources import parse_version
@@ -43,6 +43,7 @@ from rebasehelper.plugins.checkers import CheckerCategory
 from rebasehelper.exceptions import RebaseHelperError, CheckerNotFoundError
 from rebasehelper.exceptions import SourcePackageBuildError, BinaryPackageBuildError
 from rebasehelper.results_store import results_store
+from rebasehelper.artifact_store import ArtifactStore
 from rebasehelper.helpers.path_helper import PathHelper
 from rebasehelper.helpers.input_helper import InputHelper
 from rebasehelper.helpers.git_helper import GitHelper
@@ -55,6 +56,9 @@ logger: CustomLogger = cast(CustomLogger, logging.getLogger(__name__))
 
 class Application:
 
+    # sections that can change without building packages from scratch again
+    INCREMENTAL_REBUILD_SECTIONS: Set[str] = {'files', 'changelog'}
+
     def __init__(self, cli_conf: Config, start_dir: str, execution_dir: str, results_dir: str,
                  create_logs: bool = True) -> None:
         """Initializes the application.
@@ -76,6 +80,7 @@ class Application:
         self.new_rest_sources: List[str] = []
         self.rebased_patches: Dict[str, List[str]] = {}
         self.rebased_repo: Optional[git.Repo] = None
+        self.incremental_rebuild = False
 
         self.handlers = LoggerHelper.create_file_handlers(results_dir) if create_logs else []
 
@@ -174,31 +179,38 @@ class Application:
             logger.verbose("argument passed as a new source is a version")
             version_string = self.conf.sources
         version, extra_version = SpecFile.split_version_string(version_string, self.spec_file.spec.expanded_version)
-        self.rebase_spec_file.set_version(version)
-        self.rebase_spec_file.set_extra_version(extra_version, version != self.spec_file.spec.expanded_version)
-
-        oldver = parse_version(self.spec_file.spec.expanded_version)
-        newver = parse_version(self.rebase_spec_file.spec.expanded_version)
-        oldex = self.spec_file.parse_release()[2]
-        newex = extra_version
-
-        if not self.conf.skip_version_check and (newver < oldver or (newver == oldver and newex == oldex)):
-            raise RebaseHelperError("Current version is equal to or newer than the requested version, nothing to do.")
-
-        if not self.conf.no_changelog_entry:
-            self.rebase_spec_file.update_changelog(self.conf.changelog_entry)
-
-        # run spec hooks
-        plugin_manager.spec_hooks.run(self.spec_file, self.rebase_spec_file, **self.kwargs)
+        # write the rebased SPEC file only once after all the changes
+        with self.rebase_spec_file.transaction():
+            self.rebase_spec_file.set_version(version)
+            self.rebase_spec_file.set_extra_version(extra_version, version != self.spec_file.spec.expanded_version)
+
+            oldver = parse_version(self.spec_file.spec.expanded_version)
+            newver = parse_version(self.rebase_spec_file.spec.expanded_version)
+            oldex = self.spec_file.parse_release()[2]
+            newex = extra_version
+
+            if not self.conf.skip_version_check and (newver < oldver or (newver == oldver and newex == oldex)):
+                raise RebaseHelperError("Current version is equal to or newer than the requested version, "
+                                        "nothing to do.")
+
+            if not self.conf.no_changelog_entry:
+                self.rebase_spec_file.update_changelog(self.conf.changelog_entry)
+
+            # run spec hooks
+            plugin_manager.spec_hooks.run(self.spec_file, self.rebase_spec_file, **self.kwargs)
+
+            # spec file object has been sanitized downloading can proceed
+            if not self.conf.not_download_sources:
+                SpecFile.download_remote_sources_of([self.spec_file, self.rebase_spec_file],
+                                                    self.conf.max_connections_per_host)
+                # parse spec again with sources downloaded to properly expand %prep section
+                self.spec_file.update()
+            # all local sources have been downloaded; we can check for name changes
+            self._sanitize_sources()
 
-        # spec file object has been sanitized downloading can proceed
         if not self.conf.not_download_sources:
-            for spec_file in [self.spec_file, self.rebase_spec_file]:
-                spec_file.download_remote_sources()
-                # parse spec again with sources downloaded to properly expand %prep section
-                spec_file.update()
-        # all local sources have been downloaded; we can check for name changes
-        self._sanitize_sources()
+            # the rebased spec file can be parsed again only after the transaction is committed
+            self.rebase_spec_file.update()
 
     def _sanitize_sources(self) -> None:
         """Renames local sources whose name changed after version bump.
@@ -217,12 +229,7 @@ class Application:
             if os.path.exists(os.path.join(self.execution_dir, source.expanded_filename)):
                 continue
             # Find matching source in the old spec
-            old_source = next(iter(
-                s
-                for s in self.spec_file.all_sources
-                if type(s) == type(source)
-                and s.number == source.number
-            ), None)
+            old_source = self.spec_file.get_corresponding_source(source)
             if not old_source:
                 logger.error(
                     'Failed to find the source corresponding to %s in old version spec',
@@ -449,6 +456,8 @@ class Application:
         self.rebase_spec_file.write_updated_patches(self.rebased_patches,
                                                     self.conf.disable_inapplicable_patches)
         results_store.set_patches_results(self.rebased_patches)
+        if Patcher.strategy_results:
+            results_store.set_conflict_strategy_results(Patcher.strategy_results)
 
     def generate_patch(self):
         """
@@ -511,18 +520,19 @@ class Application:
             if not source.remote:
                 source_path = os.path.join(self.execution_dir, source.filename)
                 if os.path.isfile(source_path):
-                    shutil.copy(source_path, self.rebased_sources_dir)
+                    # files in rebased sources are modified, they must not share data with the originals
+                    PathHelper.stage_file(source_path, self.rebased_sources_dir)
 
         for patch in self.spec_file.get_applied_patches() + self.spec_file.get_not_used_patches():
-            shutil.copy(patch.path, self.rebased_sources_dir)
+            PathHelper.stage_file(patch.path, self.rebased_sources_dir)
 
         sources = os.path.join(self.execution_dir, 'sources')
         if os.path.isfile(sources):
-            shutil.copy(sources, self.rebased_sources_dir)
+            PathHelper.stage_file(sources, self.rebased_sources_dir)
 
         gitignore = os.path.join(self.execution_dir, '.gitignore')
         if os.path.isfile(gitignore):
-            shutil.copy(gitignore, self.rebased_sources_dir)
+            PathHelper.stage_file(gitignore, self.rebased_sources_dir)
 
         repo = git.Repo.init(self.rebased_sources_dir)
         repo.git.config('user.name', GitHelper.get_user(), local=True)
@@ -538,18 +548,49 @@ class Application:
             'build_tasks',
             'builder_options',
             'srpm_builder_options',
+            'incremental',
             'app_kwargs',
         ]
         return {k: v for k, v in build_dict.items() if k not in blacklist}
 
-    def build_source_packages(self):
+    def _build_package(self, builder, spec, version, results_dir, build_dict, kind, tool, options):
+        """Builds a package, using a stored build of the old version if the artifact store is enabled.
+
+        Args:
+            builder: Build tool.
+            spec: SpecFile object.
+            version: "old" or "new" string.
+            results_dir: Path to directory where results should be stored.
+            build_dict: Build data.
+            kind: Kind of the build, 'srpm' or 'rpm'.
+            tool: Name of the build tool.
+            options: Additional options of the build tool.
+
+        Returns:
+            dict: Build results.
+
+        """
+        # remote builds are not stored, their packages are not available until their tasks finish
+        if not self.conf.artifact_store or getattr(builder, 'CREATES_TASKS', False):
+            return builder.build(spec, results_dir, **build_dict)
+        key = ArtifactStore.get_key(spec, kind, tool, options, self.kwargs['rpmmacros'])
+        if version == 'old':
+            stored = ArtifactStore.retrieve(key, results_dir)
+            if stored:
+                logger.info('Using stored %s build of %s version', kind.upper(), version)
+                return stored
+        result = builder.build(spec, results_dir, **build_dict)
+        ArtifactStore.store(key, result)
+        return result
+
+    def build_source_packages(self, versions=('old', 'new')):
         try:
             builder = plugin_manager.srpm_build_tools.get_plugin(self.conf.srpm_buildtool)
         except NotImplementedError as e:
             raise RebaseHelperError('{}. Supported SRPM build tools are {}'.format(
                 str(e), ', '.join(plugin_manager.srpm_build_tools.get_supported_plugins()))) from e
 
-        for version in ['old', 'new']:
+        for version in versions:
             koji_build_id = None
             results_dir = os.path.join(self.results_dir, '{}-build'.format(version), 'SRPM')
             spec = self.spec_file if version == 'old' else self.rebase_spec_file
@@ -578,7 +619,8 @@ class Application:
                                                             arches=['src'])
                     build_dict['srpm'], build_dict['logs'] = srpms[0], logs
                 else:
-                    build_dict.update(builder.build(spec, results_dir, **build_dict))
+                    build_dict.update(self._build_package(builder, spec, version, results_dir, build_dict, 'srpm',
+                                                          self.conf.srpm_buildtool, self.conf.srpm_builder_options))
                 build_dict = self._sanitize_build_dict(build_dict)
                 results_store.set_build_data(version, build_dict)
             except RebaseHelperError:  # pylint: disable=try-except-raise
@@ -598,15 +640,21 @@ class Application:
                 raise RebaseHelperError('Building package failed with unknown reason. '
                                         'Check all available log files.') from e
 
-    def build_binary_packages(self):
-        """Function calls build class for building packages"""
+    def build_binary_packages(self, versions=('old', 'new'), incremental=False):
+        """Function calls build class for building packages
+
+        Args:
+            versions: Versions to build.
+            incremental: Whether to rebuild the new version incrementally after changes in %files sections.
+
+        """
         try:
             builder = plugin_manager.build_tools.get_plugin(self.conf.buildtool)
         except NotImplementedError as e:
             raise RebaseHelperError('{}. Supported build tools are {}'.format(
                 str(e), ', '.join(plugin_manager.build_tools.get_supported_plugins()))) from e
 
-        for version in ['old', 'new']:
+        for version in versions:
             results_dir = os.path.join(self.results_dir, '{}-build'.format(version), 'RPM')
             spec = None
             task_id = None
@@ -631,6 +679,7 @@ class Application:
                     builder_options=self.conf.builder_options,
                     srpm=results_store.get_build(version).get('srpm'),
                     srpm_logs=results_store.get_build(version).get('logs'),
+                    incremental=incremental and version == 'new',
                     app_kwargs=self.kwargs)
 
                 # prepare for building
@@ -650,7 +699,8 @@ class Application:
                                                                                           results_dir,
                                                                                           arches=['noarch', 'x86_64'])
                     else:
-                        build_dict.update(builder.build(spec, results_dir, **build_dict))
+                        build_dict.update(self._build_package(builder, spec, version, results_dir, build_dict, 'rpm',
+                                                              self.conf.buildtool, self.conf.builder_options))
                 if builder.CREATES_TASKS and task_id and not koji_build_id:
                     if not self.conf.builds_nowait:
                         build_dict['rpm'], build_dict['logs'] = builder.wait_for_task(build_dict,
@@ -762,11 +812,14 @@ class Application:
                            '\nThe error message is: %s', constants.CHANGES_PATCH, str(e))
 
     def prepare_next_run(self, results_dir):
+        snapshot = self.rebase_spec_file.get_sections_snapshot()
+        self.incremental_rebuild = False
         # Running build log hooks only makes sense after a failed build
         # of new RPM packages. The folder results_dir/new-build/RPM
         # doesn't exist unless the build of new RPM packages has been run.
         changes_made = False
-        if os.path.exists(os.path.join(results_dir, constants.NEW_BUILD_DIR, 'RPM')):
+        new_rpm_build_failed = os.path.exists(os.path.join(results_dir, constants.NEW_BUILD_DIR, 'RPM'))
+        if new_rpm_build_failed:
             changes_made = plugin_manager.build_log_hooks.run(self.spec_file, self.rebase_spec_file, **self.kwargs)
         # Save current rebase spec file content
         self.rebase_spec_file.save()
@@ -782,8 +835,17 @@ class Application:
             return False
         # Update rebase spec file content after potential manual modifications
         self.rebase_spec_file.reload()
+        # Packages of the old version are still valid and the new ones can be just packaged again
+        # from the build tree of the failed build if only the lists of files have changed
+        self.incremental_rebuild = bool(
+            self.conf.incremental_rebuild and new_rpm_build_failed and
+            plugin_manager.build_tools.get_plugin(self.conf.buildtool).INCREMENTAL and
+            results_store.get_build('old').get('rpm') and
+            not self.rebase_spec_file.get_changed_sections(snapshot) - self.INCREMENTAL_REBUILD_SECTIONS)
         # clear current version output directories
-        if os.path.exists(os.path.join(results_dir, constants.OLD_BUILD_DIR)):
+        if self.incremental_rebuild:
+            logger.info('Only %%files sections have changed, rebuilding new RPM packages incrementally.')
+        elif os.path.exists(os.path.join(results_dir, constants.OLD_BUILD_DIR)):
             shutil.rmtree(os.path.join(results_dir, constants.OLD_BUILD_DIR))
         if os.path.exists(os.path.join(results_dir, constants.NEW_BUILD_DIR)):
             shutil.rmtree(os.path.join(results_dir, constants.NEW_BUILD_DIR))
@@ -822,25 +884,31 @@ class Application:
                                         ", ".join(tools_accepting_options)))
 
         if self.conf.build_tasks is None:
-            old_sources, new_sources = self.prepare_sources()
-            self.run_package_checkers(self.results_dir,
-                                      category=CheckerCategory.SOURCE,
-                                      old_dir=old_sources,
-                                      new_dir=new_sources)
-            try:
-                self.patch_sources([old_sources, new_sources])
-            except RebaseHelperError as e:
+            patching_error = None
+            # write changes of the rebased SPEC file made while preparing and patching sources at once
+            with self.rebase_spec_file.transaction():
+                old_sources, new_sources = self.prepare_sources()
+                self.run_package_checkers(self.results_dir,
+                                          category=CheckerCategory.SOURCE,
+                                          old_dir=old_sources,
+                                          new_dir=new_sources)
+                try:
+                    self.patch_sources([old_sources, new_sources])
+                except RebaseHelperError as e:
+                    patching_error = e
+            if patching_error:
                 # Print summary and return error
-                self.print_summary(e)
-                raise
+                self.print_summary(patching_error)
+                raise patching_error
 
         # Build packages
         while True:
+            versions = ('new',) if self.incremental_rebuild else ('old', 'new')
             try:
                 if self.conf.build_tasks is None:
-                    self.build_source_packages()
+                    self.build_source_packages(versions)
                 self.run_package_checkers(self.results_dir, category=CheckerCategory.SRPM)
-                self.build_binary_packages()
+                self.build_binary_packages(versions, incremental=self.incremental_rebuild)
                 if self.conf.builds_nowait and not self.conf.build_tasks:
                     return
                 self.run_package_checkers(self.results_dir, category=CheckerCategory.RPM)
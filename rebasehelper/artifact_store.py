@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you rebase your package to the latest version
+# Copyright (C) 2013-2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hráček <phracek@redhat.com>
+#          Tomáš Hozza <thozza@redhat.com>
+#          Nikola Forró <nforro@redhat.com>
+#          František Nečas <fifinecas@seznam.cz>
+
+import hashlib
+import json
+import logging
+import os
+import platform
+import shlex
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Tuple, cast
+
+from rebasehelper.constants import ENCODING
+from rebasehelper.helpers.path_helper import PathHelper
+from rebasehelper.plugins.build_tools import MockRootCache
+from rebasehelper.logger import CustomLogger
+
+
+logger: CustomLogger = cast(CustomLogger, logging.getLogger(__name__))
+
+
+class ArtifactStore:
+    """Class representing a local content-addressed store of built packages.
+
+    Builds are keyed by everything they are made of, i.e. the content
+    of the SPEC file, sources and patches, the build tool and its options,
+    macros defined on the command line, the host architecture and in case
+    of mock the content of the used configuration, so a stored build can be
+    used instead of building the same package again.
+
+    """
+
+    METADATA_FILE: str = 'metadata.json'
+    MOCK_CONFIG_DIR: str = '/etc/mock'
+
+    # hashes of already processed files by path, size and modification time
+    _file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+    @classmethod
+    def _hash_file(cls, path):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if key not in cls._file_hashes:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+            cls._file_hashes[key] = h.hexdigest()
+        return cls._file_hashes[key]
+
+    @classmethod
+    def _get_mock_config(cls, options):
+        """Gets resolved path to mock configuration selected by options and hash of its content."""
+        config = MockRootCache.get_config(shlex.split(options or ''))
+        if not config.endswith('.cfg'):
+            config = os.path.join(cls.MOCK_CONFIG_DIR, config + '.cfg')
+        path = os.path.realpath(config)
+        try:
+            return [path, cls._hash_file(path)]
+        except OSError:
+            return [path, None]
+
+    @classmethod
+    def get_key(cls, spec, kind, tool, options=None, macros=None):
+        """Gets key identifying a build.
+
+        Args:
+            spec (rebasehelper.specfile.SpecFile): SPEC file of the package.
+            kind (str): Kind of the build, 'srpm' or 'rpm'.
+            tool (str): Name of the build tool.
+            options (str): Additional options of the build tool.
+            macros (dict): Macros defined on the command line.
+
+        Returns:
+            str: Key of the build.
+
+        """
+        data = {
+            'kind': kind,
+            'tool': tool,
+            'options': options,
+            'macros': sorted((macros or {}).items()),
+            'arch': platform.machine(),
+            'mock_config': cls._get_mock_config(options) if tool == 'mock' else None,
+            'spec': cls._hash_file(spec.spec.path),
+            'sources': sorted(
+                (os.path.basename(p), cls._hash_file(p))
+                for p in spec.get_sources() + [p.path for p in spec.get_patches()]
+            ),
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode(ENCODING)).hexdigest()
+
+    @staticmethod
+    def _get_path(key):
+        return PathHelper.get_cache_dir('artifacts', key[:2], key)
+
+    @classmethod
+    def store(cls, key, build_dict):
+        """Stores packages and logs of a successful build.
+
+        Args:
+            key (str): Key of the build.
+            build_dict (dict): Build data containing paths to packages and logs.
+
+        """
+        path = cls._get_path(key)
+        if os.path.isdir(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(path))
+        try:
+            metadata: Dict[str, List[str]] = {}
+            for name in ['srpm', 'rpm', 'logs']:
+                files = build_dict.get(name)
+                if not files:
+                    continue
+                metadata[name] = []
+                for f in [files] if isinstance(files, str) else files:
+                    # build results are never modified in place
+                    PathHelper.stage_file(f, tmp, hardlink=True)
+                    metadata[name].append(os.path.basename(f))
+            with open(os.path.join(tmp, cls.METADATA_FILE), 'w', encoding=ENCODING) as f:
+                json.dump(metadata, f)
+            os.rename(tmp, path)
+        except OSError as e:
+            # the same build can be stored concurrently
+            logger.debug("Failed to store build %s: %s", key, str(e))
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            logger.verbose("Stored build %s", key)
+
+    @classmethod
+    def retrieve(cls, key, results_dir) -> Optional[Dict]:
+        """Retrieves packages and logs of a stored build.
+
+        Args:
+            key (str): Key of the build.
+            results_dir (str): Path to directory where packages and logs will be placed.
+
+        Returns:
+            dict: Build data containing paths to packages and logs or None if the build is not stored.
+
+        """
+        path = cls._get_path(key)
+        try:
+            with open(os.path.join(path, cls.METADATA_FILE), encoding=ENCODING) as f:
+                metadata = json.load(f)
+            build_dict = {}
+            for name, files in metadata.items():
+                staged = [PathHelper.stage_file(os.path.join(path, f), results_dir, hardlink=True) for f in files]
+                build_dict[name] = staged[0] if name == 'srpm' else staged
+        except (OSError, ValueError):
+            return None
+        logger.verbose("Retrieved stored build %s", key)
+        return build_dict
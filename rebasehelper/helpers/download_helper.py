@@ -22,13 +22,16 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import collections
+import concurrent.futures
 import logging
 import os
 import sys
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
-from typing import cast
+from typing import Dict, List, Optional, Tuple, cast
 
 import requests
 
@@ -43,6 +46,8 @@ class DownloadHelper:
 
     """Class for downloading files and performing HTTP requests."""
 
+    MAX_CONNECTIONS_PER_HOST: int = 4
+
     @staticmethod
     def progress(download_total, downloaded, start_time, show_size=True):
         """Prints current progress and estimated remaining time of a download to the standard output.
@@ -92,15 +97,13 @@ class DownloadHelper:
         sys.stdout.flush()
 
     @staticmethod
-    def request(url, **kwargs):
-        """Performs an HTTP request or an FTP RETR command.
+    def create_session():
+        """Creates a new session capable of HTTP, HTTPS and FTP requests.
 
-        Args:
-            url (str): HTTP, HTTPS or FTP URL.
-            **kwargs: Keyword arguments to be passed to requests.session.get().
+        Connections to HTTP and HTTPS hosts are kept alive and reused by subsequent requests of the session.
 
         Returns:
-            requests.Response: Response object.
+            requests.Session: Session object.
 
         """
 
@@ -128,6 +131,23 @@ class DownloadHelper:
 
         session = requests.Session()
         session.mount('ftp://', FTPAdapter())
+        return session
+
+    @staticmethod
+    def request(url, session=None, **kwargs):
+        """Performs an HTTP request or an FTP RETR command.
+
+        Args:
+            url (str): HTTP, HTTPS or FTP URL.
+            session (requests.Session): Session to reuse, a new one is created if not specified.
+            **kwargs: Keyword arguments to be passed to requests.session.get().
+
+        Returns:
+            requests.Response: Response object.
+
+        """
+        if session is None:
+            session = DownloadHelper.create_session()
 
         try:
             return session.get(url, **kwargs)
@@ -136,16 +156,23 @@ class DownloadHelper:
             return None
 
     @staticmethod
-    def download_file(url, destination_path, blocksize=8192):
+    def download_file(url, destination_path, blocksize=8192, show_progress=True, session=None, expected_size=None):
         """Downloads a file from HTTP, HTTPS or FTP URL.
 
         Args:
             url (str): URL to be downloaded.
             destination_path (str): Path to where the downloaded file will be stored.
             blocksize (int): Block size in bytes.
+            show_progress (bool): Whether to show a progress bar.
+            session (requests.Session): Session to reuse, a new one is created if not specified.
+            expected_size (int): Known size of the file in bytes. If specified, a downloaded file
+              of a different size is removed and reported as an error.
+
+        Raises:
+            DownloadError: If download failed.
 
         """
-        r = DownloadHelper.request(url, stream=True)
+        r = DownloadHelper.request(url, session=session, stream=True)
         if r is None:
             raise DownloadError("An unexpected error occurred during the download.")
 
@@ -175,7 +202,8 @@ class DownloadHelper:
                 downloaded = 0
 
                 # report progress
-                DownloadHelper.progress(file_size, downloaded, download_start)
+                if show_progress:
+                    DownloadHelper.progress(file_size, downloaded, download_start)
 
                 # do the actual download
                 for chunk in r.iter_content(chunk_size=blocksize):
@@ -183,10 +211,71 @@ class DownloadHelper:
                     local_file.write(chunk)
 
                     # report progress
-                    DownloadHelper.progress(file_size, downloaded, download_start)
+                    if show_progress:
+                        DownloadHelper.progress(file_size, downloaded, download_start)
 
-                sys.stdout.write('\n')
-                sys.stdout.flush()
+                if show_progress:
+                    sys.stdout.write('\n')
+                    sys.stdout.flush()
         except KeyboardInterrupt as e:
             os.remove(destination_path)
             raise e
+
+        if expected_size is not None and downloaded != expected_size:
+            os.remove(destination_path)
+            raise DownloadError('Size of the downloaded file {} does not match, expected {} bytes, got {}'.format(
+                os.path.basename(destination_path), expected_size, downloaded))
+
+    @staticmethod
+    def download_files(downloads: List[Tuple[str, str]],
+                       max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST,
+                       expected_sizes: Optional[Dict[str, int]] = None) -> Dict[str, DownloadError]:
+        """Downloads multiple files concurrently.
+
+        Downloads are grouped by host and every host is served by at most
+        max_connections_per_host workers at the same time. Every worker keeps
+        its connection alive for all the files it downloads.
+
+        Args:
+            downloads: List of (URL, destination path) tuples. If there are more
+              downloads to the same destination, only the first one is performed.
+            max_connections_per_host: Maximum number of simultaneous connections to a single host.
+            expected_sizes: Known sizes of files in bytes by destination path,
+              see DownloadHelper.download_file().
+
+        Returns:
+            Errors of failed downloads by URL.
+
+        """
+        queues: Dict[str, collections.deque] = collections.defaultdict(collections.deque)
+        destinations = set()
+        for url, destination_path in downloads:
+            if str(destination_path) in destinations:
+                continue
+            destinations.add(str(destination_path))
+            queues[urllib.parse.urlsplit(url).netloc].append((url, destination_path))
+
+        errors: Dict[str, DownloadError] = {}
+
+        def worker(queue):
+            session = DownloadHelper.create_session()
+            with session:
+                while True:
+                    try:
+                        url, destination_path = queue.popleft()
+                    except IndexError:
+                        return
+                    try:
+                        DownloadHelper.download_file(url, destination_path, show_progress=len(destinations) == 1,
+                                                     session=session,
+                                                     expected_size=(expected_sizes or {}).get(str(destination_path)))
+                    except DownloadError as e:
+                        errors[url] = e
+
+        workers = [q for q in queues.values() for _ in range(min(len(q), max(max_connections_per_host, 1)))]
+        if not workers:
+            return errors
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            for future in [executor.submit(worker, q) for q in workers]:
+                future.result()
+        return errors
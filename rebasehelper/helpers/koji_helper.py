@@ -22,6 +22,7 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import hashlib
 import logging
 import os
 import random
@@ -29,19 +30,17 @@ import string
 import sys
 import time
 
-from typing import List, cast
+from typing import Dict, List, Set, Tuple, cast
 
 from specfile.utils import NEVRA
 
-from rebasehelper.exceptions import RebaseHelperError
-from rebasehelper.helpers.console_helper import ConsoleHelper
+from rebasehelper.exceptions import DownloadError, RebaseHelperError
 from rebasehelper.helpers.download_helper import DownloadHelper
 from rebasehelper.logger import CustomLogger
 
 koji_helper_functional: bool
 try:
     import koji  # type: ignore
-    from koji_cli.lib import TaskWatcher  # type: ignore
 except ImportError:
     koji_helper_functional = False
 else:
@@ -55,6 +54,10 @@ class KojiHelper:
 
     functional: bool = koji_helper_functional
 
+    POLL_INTERVAL_MIN: float = 1.0
+    POLL_INTERVAL_MAX: float = 30.0
+    POLL_INTERVAL_BACKOFF: float = 1.5
+
     @classmethod
     def create_session(cls, login=False, profile='koji'):
         """Creates new Koji session and immediately logs in to a Koji hub.
@@ -116,17 +119,21 @@ class KojiHelper:
     def get_task_url(cls, session, task_id):
         return '/'.join([session.opts['weburl'], 'taskinfo?taskID={}'.format(task_id)])
 
+    @classmethod
+    def get_task_label(cls, info):
+        return '{} {}'.format(info['id'], koji.taskLabel(info))
+
     @classmethod
     def display_task_results(cls, tasks):
         """Prints states of Koji tasks.
 
         Args:
-            tasks (list): List of koji.TaskWatcher instances.
+            tasks (list): List of task info dictionaries of top-level tasks.
 
         """
-        for task in [t for t in tasks if t.level == 0]:
-            state = task.info['state']
-            task_label = task.str()
+        for info in tasks:
+            state = info['state']
+            task_label = cls.get_task_label(info)
             logger.info('State %s (%s)', state, task_label)
             if state == koji.TASK_STATES['CLOSED']:
                 logger.info('%s completed successfully', task_label)
@@ -138,10 +145,30 @@ class KojiHelper:
                 # shouldn't happen
                 logger.info('%s has not completed', task_label)
 
+    @classmethod
+    def query_tasks(cls, session, task_ids):
+        """Fetches info and children of multiple Koji tasks in a single hub call.
+
+        Args:
+            session (koji.ClientSession): Active Koji session instance.
+            task_ids (list): List of task IDs.
+
+        Returns:
+            dict: Dictionary mapping task IDs to tuples of task info and list of child tasks.
+
+        """
+        with session.multicall(strict=True) as m:
+            calls = [(m.getTaskInfo(task_id), m.getTaskChildren(task_id)) for task_id in task_ids]
+        return {task_id: (info.result, children.result) for task_id, (info, children) in zip(task_ids, calls)}
+
     @classmethod
     def watch_koji_tasks(cls, session, tasklist):
         """Waits for Koji tasks to finish and prints their states.
 
+        States of all unfinished tasks are queried in a single multicall per tick.
+        The polling interval starts at POLL_INTERVAL_MIN and grows up to POLL_INTERVAL_MAX
+        while nothing changes, so that long builds don't flood the hub with requests.
+
         Args:
             session (koji.ClientSession): Active Koji session instance.
             tasklist (list): List of task IDs.
@@ -152,62 +179,44 @@ class KojiHelper:
         """
         if not tasklist:
             return None
-        sys.stdout.flush()
+        done_states = [koji.TASK_STATES[s] for s in ('CLOSED', 'FAILED', 'CANCELED')]
         rh_tasks = {}
+        toplevel = [int(task_id) for task_id in tasklist]
+        tasks = {task_id: None for task_id in toplevel}
+        explored = set()
+        interval = cls.POLL_INTERVAL_MIN
         try:
-            tasks = {}
-            for task_id in tasklist:
-                task_id = int(task_id)
-                tasks[task_id] = TaskWatcher(task_id, session, quiet=False)
             while True:
-                all_done = True
-                for task_id, task in list(tasks.items()):
-                    with ConsoleHelper.Capturer(stdout=True) as capturer:
-                        changed = task.update()
-                    for line in capturer.stdout.split('\n'):
-                        if line:
-                            logger.info(line)
-                    info = session.getTaskInfo(task_id)
-                    state = task.info['state']
+                pending = [task_id for task_id, info in tasks.items()
+                           if task_id not in explored or info['state'] not in done_states]
+                if not pending:
+                    cls.display_task_results([tasks[task_id] for task_id in toplevel])
+                    break
+                changed = False
+                updates = list(cls.query_tasks(session, pending).values())
+                explored.update(pending)
+                while updates:
+                    info, children = updates.pop(0)
+                    previous = tasks.get(info['id'])
+                    tasks[info['id']] = info
+                    state = info['state']
+                    if previous is None or previous['state'] != state:
+                        changed = True
+                        logger.info('%s: %s', cls.get_task_label(info), koji.TASK_STATES[state].lower())
                     if state == koji.TASK_STATES['FAILED']:
                         return {info['id']: state}
-                    else:
+                    if state == koji.TASK_STATES['CANCELED']:
+                        rh_tasks = None
+                    elif rh_tasks is not None:
                         # FIXME: multiple arches
                         if info['arch'] == 'x86_64' or info['arch'] == 'noarch':
                             rh_tasks[info['id']] = state
-                    if not task.is_done():
-                        all_done = False
-                    else:
-                        if changed:
-                            # task is done and state just changed
-                            cls.display_task_results(list(tasks.values()))
-                        if not task.is_success():
-                            rh_tasks = None
-                    for child in session.getTaskChildren(task_id):
-                        child_id = child['id']
-                        if child_id not in list(tasks.keys()):
-                            tasks[child_id] = TaskWatcher(child_id, session, task.level + 1, quiet=False)
-                            with ConsoleHelper.Capturer(stdout=True) as capturer:
-                                tasks[child_id].update()
-                            for line in capturer.stdout.split('\n'):
-                                if line:
-                                    logger.info(line)
-                            info = session.getTaskInfo(child_id)
-                            state = task.info['state']
-                            if state == koji.TASK_STATES['FAILED']:
-                                return {info['id']: state}
-                            else:
-                                # FIXME: multiple arches
-                                if info['arch'] == 'x86_64' or info['arch'] == 'noarch':
-                                    rh_tasks[info['id']] = state
-                            # If we found new children, go through the list again,
-                            # in case they have children also
-                            all_done = False
-                if all_done:
-                    cls.display_task_results(list(tasks.values()))
-                    break
-                sys.stdout.flush()
-                time.sleep(1)
+                    # newly discovered children come with their info already,
+                    # their own children will be queried on the next tick
+                    updates.extend((child, []) for child in children if child['id'] not in tasks)
+                interval = cls.POLL_INTERVAL_MIN if changed else \
+                    min(interval * cls.POLL_INTERVAL_BACKOFF, cls.POLL_INTERVAL_MAX)
+                time.sleep(interval)
         except KeyboardInterrupt:
             rh_tasks = None
         return rh_tasks
@@ -230,8 +239,10 @@ class KojiHelper:
         """
         rpms: List[str] = []
         logs: List[str] = []
+        downloads: List[Tuple[str, str]] = []
+        sizes: Dict[str, int] = {}
         for task_id in tasklist:
-            logger.info('Downloading packages and logs for task %s', task_id)
+            logger.info('Looking up packages and logs of task %s', task_id)
             task = session.getTaskInfo(task_id, request=True)
             if task['state'] in [koji.TASK_STATES['FREE'], koji.TASK_STATES['OPEN']]:
                 logger.info('Task %s is still running!', task_id)
@@ -247,32 +258,99 @@ class KojiHelper:
             else:
                 logger.info('Task %s is not a build or buildArch task!', task_id)
                 continue
-            for task in tasks:
+            with session.multicall(strict=True) as m:
+                outputs = [(task, m.listTaskOutput(task['id'], stat=True)) for task in tasks]
+            for task, output in outputs:
                 base_path = koji.pathinfo.taskrelpath(task['id'])
-                output = session.listTaskOutput(task['id'])
-                for filename in output:
+                for filename, stat in output.result.items():
                     local_path = os.path.join(destination, filename)
-                    download = False
+                    if local_path in sizes:
+                        continue
                     fn, ext = os.path.splitext(filename)
                     if ext == '.rpm':
                         if task['state'] != koji.TASK_STATES['CLOSED']:
                             continue
-                        if local_path not in rpms:
-                            nevra = NEVRA.from_string(fn)
-                            # FIXME: multiple arches
-                            download = nevra.arch in ['noarch', 'x86_64']
-                            if download:
-                                rpms.append(local_path)
+                        nevra = NEVRA.from_string(fn)
+                        # FIXME: multiple arches
+                        if nevra.arch not in ['noarch', 'x86_64']:
+                            continue
+                        rpms.append(local_path)
                     else:
-                        if local_path not in logs:
-                            download = True
-                            logs.append(local_path)
-                    if download:
-                        logger.info('Downloading file %s', filename)
-                        url = '/'.join([session.opts['topurl'], 'work', base_path, filename])
-                        DownloadHelper.download_file(url, local_path)
+                        logs.append(local_path)
+                    url = '/'.join([session.opts['topurl'], 'work', base_path, filename])
+                    downloads.append((url, local_path))
+                    sizes[local_path] = int(stat['st_size'])
+        cls.download_files(downloads, sizes)
         return rpms, logs
 
+    @classmethod
+    def download_files(cls, downloads, sizes):
+        """Downloads files from a Koji instance concurrently.
+
+        Args:
+            downloads (list): List of (URL, destination path) tuples.
+            sizes (dict): Sizes of files reported by Koji by destination path.
+
+        Existing destination files are downloaded again, they can come
+        from a different build or task with the same file names.
+
+        Raises:
+            DownloadError: If download of any of the files failed or its size doesn't match.
+
+        """
+        for _, local_path in downloads:
+            logger.info('Downloading file %s', os.path.basename(local_path))
+            if os.path.lexists(local_path):
+                os.unlink(local_path)
+        errors = DownloadHelper.download_files(downloads, expected_sizes=sizes)
+        for url, _ in downloads:
+            if url in errors:
+                raise DownloadError('Failed to download file from URL {}. '
+                                    'Reason: {}'.format(url, str(errors[url]))) from errors[url]
+
+    @classmethod
+    def get_payloadhash(cls, path):
+        """Computes payload hash of an RPM as reported by Koji.
+
+        The payload hash is MD5 digest of the header and the payload of the RPM,
+        i.e. of everything following the signature header.
+
+        Args:
+            path (str): Path to the RPM.
+
+        Returns:
+            str: Payload hash or None if the RPM can't be read.
+
+        """
+        try:
+            start, size = koji.find_rpm_sighdr(path)
+            h = hashlib.md5(usedforsecurity=False)
+            with open(path, 'rb') as f:
+                f.seek(start + size)
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+        except Exception:  # pylint: disable=broad-except
+            return None
+        return h.hexdigest()
+
+    @classmethod
+    def verify_rpm(cls, path, payloadhash):
+        """Verifies that a downloaded RPM matches the one stored in Koji.
+
+        Args:
+            path (str): Path to the downloaded RPM.
+            payloadhash (str): Payload hash (SIGMD5 header) of the RPM reported by Koji.
+
+        Raises:
+            DownloadError: If the RPM doesn't match, the RPM is removed in that case.
+
+        """
+        sigmd5 = cls.get_payloadhash(path)
+        if sigmd5 != payloadhash:
+            os.remove(path)
+            raise DownloadError('Payload hash of the downloaded file {} does not match, '
+                                'expected {}, got {}'.format(os.path.basename(path), payloadhash, sigmd5))
+
     @classmethod
     def get_latest_build(cls, session, package):
         """Looks up latest Koji build of a package.
@@ -332,24 +410,36 @@ class KojiHelper:
         pathinfo = koji.PathInfo(topdir=session.opts['topurl'])
         rpms: List[str] = []
         logs: List[str] = []
+        downloads: List[Tuple[str, str]] = []
+        sizes: Dict[str, int] = {}
+        hashes: Dict[str, str] = {}
+        seen: Set[str] = set()
         os.makedirs(destination, exist_ok=True)
         for pkg in session.listBuildRPMs(build_id):
             if pkg['arch'] not in arches:
                 continue
             rpmpath = pathinfo.rpm(pkg)
             local_path = os.path.join(destination, os.path.basename(rpmpath))
-            if local_path not in rpms:
-                url = pathinfo.build(build) + '/' + rpmpath
-                DownloadHelper.download_file(url, local_path)
+            if local_path not in seen:
+                seen.add(local_path)
                 rpms.append(local_path)
+                if os.path.isfile(local_path) and cls.get_payloadhash(local_path) == pkg['payloadhash']:
+                    logger.verbose("The file '%s' has been already downloaded", local_path)
+                    continue
+                downloads.append((pathinfo.build(build) + '/' + rpmpath, local_path))
+                sizes[local_path] = pkg['size']
+                hashes[local_path] = pkg['payloadhash']
         for logfile in session.getBuildLogs(build_id):
             if logfile['dir'] not in arches:
                 continue
             local_path = os.path.join(destination, logfile['name'])
-            if local_path not in logs:
-                url = pathinfo.topdir + '/' + logfile['path']
-                DownloadHelper.download_file(url, local_path)
+            if local_path not in seen:
+                seen.add(local_path)
+                downloads.append((pathinfo.topdir + '/' + logfile['path'], local_path))
                 logs.append(local_path)
+        cls.download_files(downloads, sizes)
+        for local_path, payloadhash in hashes.items():
+            cls.verify_rpm(local_path, payloadhash)
         return rpms, logs
 
     @classmethod
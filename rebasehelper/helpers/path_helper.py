@@ -22,8 +22,10 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import fcntl
 import fnmatch
 import os
+import shutil
 import tempfile
 
 
@@ -31,6 +33,9 @@ class PathHelper:
 
     """Class for performing path related tasks."""
 
+    # ioctl request cloning a file on Linux
+    FICLONE: int = 0x40049409
+
     @staticmethod
     def find_first_dir_with_file(top_path, pattern):
         """Recursively searches for a directory containing a file that matches the given pattern.
@@ -122,6 +127,58 @@ class PathHelper:
         """
         return tempfile.mkdtemp(prefix='rebase-helper-')
 
+    @staticmethod
+    def stage_file(source, destination, hardlink=False):
+        """Makes a file available at the destination without copying its data where possible.
+
+        The file is cloned using a reflink on filesystems supporting it (btrfs, XFS),
+        otherwise it is hardlinked, if allowed, and copied as the last resort.
+        Hardlinks share data, permissions and ownership with the source, so they
+        are suitable only for read-only artifacts that are never modified in place.
+
+        Args:
+            source (str): Path to the file.
+            destination (str): Path to the destination file or directory.
+            hardlink (bool): Whether hardlinking is allowed.
+
+        Returns:
+            str: Path to the staged file.
+
+        """
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        if os.path.lexists(destination):
+            os.unlink(destination)
+        try:
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), PathHelper.FICLONE, src.fileno())
+            shutil.copymode(source, destination)
+            return destination
+        except OSError:
+            if os.path.lexists(destination):
+                os.unlink(destination)
+        if hardlink:
+            try:
+                os.link(source, destination)
+                return destination
+            except OSError:
+                pass
+        return shutil.copy(source, destination)
+
+    @staticmethod
+    def get_cache_dir(*subdirs):
+        """Gets path to a directory for persistent cached data.
+
+        Args:
+            *subdirs (str): Subdirectories of the rebase-helper cache directory.
+
+        Returns:
+            str: Path to the directory. It is not created.
+
+        """
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_home, 'rebase-helper', *subdirs)
+
     @staticmethod
     def file_available(filename):
         """Checks if the given file exists.
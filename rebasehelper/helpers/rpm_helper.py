@@ -24,7 +24,8 @@
 
 import logging
 import os
-from typing import Any, List, cast
+import time
+from typing import Any, Dict, List, Tuple, cast
 
 import rpm  # type: ignore
 
@@ -57,6 +58,11 @@ class RpmHelper:
 
     ARCHES: List[str] = []
 
+    DEPENDENCY_CACHE_TIMEOUT: int = 60
+
+    # times of recent checks of satisfied dependencies by dependency
+    _dependency_cache: Dict[Tuple[str, int, str], float] = {}
+
     @staticmethod
     def is_package_installed(pkg_name=None):
         """Checks whether a package is installed.
@@ -83,10 +89,73 @@ class RpmHelper:
             bool: True if all packages are installed, False otherwise.
 
         """
-        for pkg in pkg_names:
-            if not RpmHelper.is_package_installed(pkg):
-                return False
-        return True
+        return not RpmHelper.get_missing_dependencies(pkg_names)
+
+    @staticmethod
+    def format_dependency(name, flags=0, version=''):
+        """Formats a dependency as it would be written in a SPEC file.
+
+        Args:
+            name (str): Name of the dependency.
+            flags (int): Dependency flags.
+            version (str): Version of the dependency.
+
+        Returns:
+            str: Formatted dependency, e.g. 'make >= 4.0'.
+
+        """
+        operator = ''.join(c for bit, c in ((rpm.RPMSENSE_LESS, '<'), (rpm.RPMSENSE_GREATER, '>'),
+                                            (rpm.RPMSENSE_EQUAL, '=')) if flags & bit)
+        return ' '.join(filter(None, [name, operator, version]))
+
+    @classmethod
+    def get_missing_dependencies(cls, requires):
+        """Gets dependencies not satisfied by installed packages.
+
+        The rpmdb is opened only once for all dependencies and satisfied
+        dependencies are cached for DEPENDENCY_CACHE_TIMEOUT seconds or until
+        build dependencies are installed. Missing dependencies are always checked
+        again, as they can be installed at any time.
+
+        Args:
+            requires (iterable): Dependencies as (name, flags, version) tuples
+                or unversioned dependency names.
+
+        Returns:
+            list: Unsatisfied dependencies in the form they were specified.
+
+        """
+        ts = None
+        now = time.monotonic()
+        missing = []
+        for require in requires:
+            dependency = (require, 0, '') if isinstance(require, str) else tuple(require)
+            checked = cls._dependency_cache.get(dependency)
+            if checked is not None and now - checked < cls.DEPENDENCY_CACHE_TIMEOUT:
+                continue
+            if ts is None:
+                ts = rpm.TransactionSet()
+            if cls._is_dependency_satisfied(ts, *dependency):
+                cls._dependency_cache[dependency] = now
+            else:
+                missing.append(require)
+        return missing
+
+    @staticmethod
+    def _is_dependency_satisfied(ts, name, flags, version):
+        if name.startswith('rpmlib('):
+            # provided by rpm itself
+            return True
+        if name.startswith('/'):
+            if len(ts.dbMatch('basenames', name)) > 0:
+                return True
+        require = rpm.ds((name, flags, version), 'requires')
+        for hdr in ts.dbMatch('providename', name):
+            header = RpmHeader(hdr)
+            for provide in zip(header.providename, header.provideflags, header.provideversion):
+                if provide[0] == name and rpm.ds(provide, 'provides').Compare(require):
+                    return True
+        return False
 
     @staticmethod
     def install_build_dependencies(spec_path=None, assume_yes=False):
@@ -106,6 +175,8 @@ class RpmHelper:
             cmd = ['pkexec'] + cmd
         if assume_yes:
             cmd.append('-y')
+        # installed packages are about to change
+        RpmHelper._dependency_cache.clear()
         return ProcessHelper.run_subprocess(cmd)
 
     @staticmethod
@@ -26,6 +26,7 @@ import os
 
 from rebasehelper.types import Options
 from rebasehelper.constants import CONFIG_PATH, CONFIG_FILENAME, CHANGES_PATCH
+from rebasehelper.helpers.download_helper import DownloadHelper
 from rebasehelper.plugins.plugin_manager import plugin_manager
 
 
@@ -151,10 +152,11 @@ OPTIONS: Options = [
     },
     {
         "name": ["--favor-on-conflict"],
-        "choices": ["downstream", "upstream", "off"],
+        "choices": ["downstream", "upstream", "off", "auto"],
         "default": "off",
         "dest": "favor_on_conflict",
-        "help": "favor downstream or upstream changes when conflicts appear",
+        "help": "favor downstream or upstream changes when conflicts appear, "
+                "auto tries all options and picks the best result (only in non-interactive mode)",
     },
     {
         "name": ["--not-download-sources"],
@@ -162,6 +164,13 @@ OPTIONS: Options = [
         "switch": True,
         "help": "do not download sources",
     },
+    {
+        "name": ["--max-connections-per-host"],
+        "type": int,
+        "default": DownloadHelper.MAX_CONNECTIONS_PER_HOST,
+        "help": "maximum number of simultaneous connections to a single host when downloading sources, "
+                "defaults to %(default)s",
+    },
     {
         "name": ["-w", "--keep-workspace"],
         "default": False,
@@ -234,6 +243,28 @@ OPTIONS: Options = [
         "help": "enable arbitrary local srpm builder option(s), enclose %(metavar)s in quotes "
                 "to pass more than one",
     },
+    {
+        "name": ["--incremental-rebuild"],
+        "default": False,
+        "switch": True,
+        "help": "when only %%files sections change after a failed rpmbuild build, package new RPMs from "
+                "the build tree of the failed build instead of building them from scratch, "
+                "packages built this way depend on rpmlib(ShortCircuited)",
+    },
+    {
+        "name": ["--artifact-store"],
+        "default": False,
+        "switch": True,
+        "help": "store successful local builds in a local artifact store and reuse stored builds "
+                "of the old version instead of building it again",
+    },
+    {
+        "name": ["--compiler-cache"],
+        "choices": ["ccache", "sccache"],
+        "default": None,
+        "help": "use persistent compiler cache of the package in local builds, "
+                "only ccache is supported by mock",
+    },
     # misc
     {
         "name": ["--lookaside-cache-preset"],
@@ -22,12 +22,14 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import concurrent.futures
 import logging
 import os
 import re
+import shlex
 import shutil
 import tempfile
-from typing import List, Optional, cast
+from typing import Any, BinaryIO, Dict, List, Optional, Set, Tuple, cast
 
 import git  # type: ignore
 import unidiff  # type: ignore
@@ -53,6 +55,12 @@ class Patcher:
     new_repo: Optional[git.Repo] = None
     non_interactive: bool = False
     patches: List[PatchObject] = []
+    replayed_patches: List[PatchObject] = []
+    skipped_patches: List[str] = []
+    strategy_results: Optional[Dict[str, Any]] = None
+
+    # conflict strategies tried in auto mode, ordered by preference
+    AUTO_STRATEGIES: List[str] = ['off', 'downstream', 'upstream']
 
     @staticmethod
     def decorate_patch_name(patch_name):
@@ -69,15 +77,6 @@ class Patcher:
                 return line[3:-3]
         return None
 
-    @classmethod
-    def strip_patch_name(cls, diff, patch_name):
-        token = '\n\n{0}'.format(cls.decorate_patch_name(patch_name)).encode(ENCODING)
-        try:
-            idx = diff.index(token)
-            return diff[:idx] + diff[idx + len(token):]
-        except (IndexError, ValueError):
-            return diff
-
     @classmethod
     def apply_patch(cls, repo, patch_object):
         """
@@ -134,55 +133,222 @@ class Patcher:
             commit = repo.index.commit(cls.decorate_patch_name(os.path.basename(patch_name)), skip_hooks=True)
         repo.git.commit(amend=True, m=cls.insert_patch_name(commit.message, os.path.basename(patch_name)))
 
+    @classmethod
+    def _export_patches(cls, repo: git.Repo, commits: Dict[str, Tuple[str, bool]],
+                        rebased_sources_dir: str) -> None:
+        """Exports rebased patches into rebased sources directory.
+
+        All patches are exported by a single git-format-patch invocation
+        and its output is streamed directly into the patch files.
+
+        Args:
+            repo: Repository to export the patches from.
+            commits: Dict mapping commit hashes to tuples of patch name and a flag
+              determining if the commit has no proper message and only its diff
+              should be exported.
+            rebased_sources_dir: Directory to export the patches to.
+
+        """
+        if not commits:
+            return
+        header_re = re.compile(rb'^From ([0-9a-f]{40}) Mon Sep 17 00:00:00 2001$')
+        # the count has to be specified, a single revision would be interpreted as <since>
+        proc = repo.git.format_patch('-{}'.format(len(commits)), *commits, stdout=True, no_walk=True,
+                                         no_numbered=True, no_attach=True, no_signature=True, as_process=True)
+        f: Optional[BinaryIO] = None
+        token = b''
+        diff_only = in_diff = False
+        # blank lines are held back until it's clear they don't belong to the patch name token
+        # or separate the patch from the next one
+        held: List[bytes] = []
+        try:
+            for line in proc.stdout:
+                m = header_re.match(line)
+                if m:
+                    if f:
+                        f.write(b'\n')
+                        f.close()
+                        f = None
+                    held = []
+                    commit = m.group(1).decode(ENCODING)
+                    if commit not in commits:
+                        continue
+                    patch_name, diff_only = commits[commit]
+                    token = '{0}\n'.format(cls.decorate_patch_name(patch_name)).encode(ENCODING)
+                    in_diff = False
+                    f = open(os.path.join(rebased_sources_dir, patch_name), 'wb')
+                    if diff_only:
+                        continue
+                if not f:
+                    continue
+                if diff_only and not in_diff:
+                    if not line.startswith(b'diff --git'):
+                        continue
+                    in_diff = True
+                if line == b'\n':
+                    held.append(line)
+                    continue
+                if token and line == token and held:
+                    # strip patch name from the commit message
+                    held.pop()
+                    token = b''
+                    continue
+                f.writelines(held)
+                held = []
+                f.write(line)
+            proc.wait()
+        finally:
+            if f:
+                f.write(b'\n')
+                f.close()
+
+    @classmethod
+    def _index_patches(cls, root_commit: str, last_commit: str,
+                       upstream_branch: str) -> Tuple[List[str], List[str]]:
+        """Determines which patches need to be replayed on top of new upstream sources.
+
+        Records paths touched by each patch and compares blob hashes of those paths
+        between old and new upstream sources. A patch whose files are all identical
+        in both versions and are not touched by any patch that has to be replayed
+        would be applied unchanged, so there is no need to replay it.
+
+        Args:
+            root_commit: Commit representing old upstream sources.
+            last_commit: Commit of the last patch.
+            upstream_branch: Branch representing new upstream sources.
+
+        Returns:
+            Tuple of list of commits to be replayed and list of names of untouched patches.
+
+        """
+        # changed upstream paths, git compares blob hashes of both trees
+        output = cls.old_repo.git.diff_tree(root_commit, upstream_branch, r=True, name_only=True,
+                                            no_renames=True, z=True)
+        dirty: Set[str] = {p for p in output.split('\0') if p}
+        # paths touched by each patch, collected in a single git invocation
+        output = cls.old_repo.git.log('{}..{}'.format(root_commit, last_commit), z=True, name_only=True,
+                                      no_renames=True, reverse=True, format='%x01%H%x02%B')
+        index: List[Tuple[str, Optional[str], Set[str]]] = []
+        for item in output.split('\0'):
+            if item.startswith('\x01'):
+                commit, message = item[1:].split('\x02', 1)
+                index.append((commit, cls.extract_patch_name(message), set()))
+            elif index and item.strip('\n'):
+                index[-1][2].add(item.lstrip('\n'))
+        # a patch has to be replayed if it touches a changed upstream path
+        # or a path touched by another patch that has to be replayed
+        replayed: Set[str] = set()
+        while True:
+            new = {c for c, n, paths in index if c not in replayed and (not n or paths & dirty)}
+            if not new:
+                break
+            replayed.update(new)
+            for commit, _, paths in index:
+                if commit in new:
+                    dirty.update(paths)
+        commits = [c for c, _, _ in index if c in replayed]
+        untouched = [cast(str, n) for c, n, _ in index if c not in replayed]
+        return commits, untouched
+
+    @staticmethod
+    def _save_skipped_patches(repo, skipped_patches):
+        """Stores names of skipped patches in repository config so that they survive git-rebase --continue."""
+        try:
+            repo.git.config('rebasehelper.skippedpatch', unset_all=True, local=True)
+        except git.GitCommandError:
+            # no previously stored patches
+            pass
+        for patch_name in skipped_patches:
+            repo.git.config('rebasehelper.skippedpatch', patch_name, add=True, local=True)
+
+    @staticmethod
+    def _load_skipped_patches(repo):
+        """Loads names of skipped patches stored by _save_skipped_patches()."""
+        try:
+            output = repo.git.config('rebasehelper.skippedpatch', get_all=True, local=True)
+        except git.GitCommandError:
+            return []
+        return [p for p in output.split('\n') if p]
+
+    @staticmethod
+    def _get_strategy_option(favor_on_conflict):
+        if favor_on_conflict == 'upstream':
+            return 'ours'
+        elif favor_on_conflict == 'downstream':
+            return 'theirs'
+        return False
+
+    @classmethod
+    def _start_rebase(cls, repo, favor_on_conflict, root_commit, last_commit, commits, upstream_branch):
+        """Starts git-rebase of the specified patch commits.
+
+        Args:
+            repo (git.Repo): Repository (or worktree) to run git-rebase in.
+            favor_on_conflict (str): Whose changes to favor when conflicts appear.
+            root_commit (str): Commit representing old upstream sources.
+            last_commit (git.Commit): Commit of the last patch.
+            commits (list): Commits to be replayed.
+            upstream_branch (str): Branch representing new upstream sources.
+
+        Returns:
+            tuple: Return code and output of git-rebase.
+
+        """
+        if not commits:
+            return 0, None
+        strategy_option = cls._get_strategy_option(favor_on_conflict)
+        try:
+            if cls.skipped_patches:
+                # replay only the remaining patches, provide the todo list through sequence editor
+                with tempfile.NamedTemporaryFile(mode='w', encoding=ENCODING) as todo:
+                    todo.write(''.join('pick {}\n'.format(c) for c in commits))
+                    todo.flush()
+                    with repo.git.custom_environment(GIT_SEQUENCE_EDITOR='cp {}'.format(shlex.quote(todo.name))):
+                        output = repo.git.rebase(root_commit, last_commit,
+                                                 interactive=True,
+                                                 strategy_option=strategy_option,
+                                                 onto=upstream_branch,
+                                                 stdout_as_string=True)
+            else:
+                output = repo.git.rebase(root_commit, last_commit,
+                                         strategy_option=strategy_option,
+                                         onto=upstream_branch,
+                                         stdout_as_string=True)
+        except git.GitCommandError as e:
+            if e.status == 128:
+                logger.debug(str(e))
+                raise RuntimeError('git-rebase failed unexpectedly. Please check log files') from e
+            return e.status, e.stdout
+        return 0, output
+
     @classmethod
     def _git_rebase(cls):
         """Function performs git rebase between old and new sources"""
-        def compare_commits(a, b):
-            # compare commit diffs disregarding differences in blob hashes
-            attributes = (
-                'a_mode', 'b_mode', 'a_rawpath', 'b_rawpath',
-                'new_file', 'deleted_file', 'raw_rename_from', 'raw_rename_to',
-                'diff', 'change_type', 'score')
-            diff1 = a.diff(a.parents[0], create_patch=True)
-            diff2 = b.diff(b.parents[0], create_patch=True)
-            if len(diff1) != len(diff2):
-                return False
-            for d1, d2 in zip(diff1, diff2):
-                for attr in attributes:
-                    if getattr(d1, attr) != getattr(d2, attr):
-                        return False
-            return True
         # in old_sources do:
         # 1) git remote add new_sources <path_to_new_sources>
         # 2) git fetch new_sources
         # 3) git rebase --onto new_sources/<main_branch> <root_commit_old_sources> <last_commit_old_sources>
-        if not os.path.exists(os.path.join(cls.old_sources, '.git', 'rebase-apply')):
+        if not any(os.path.exists(os.path.join(cls.old_repo.git_dir, d)) for d in ('rebase-apply', 'rebase-merge')):
             logger.info('git-rebase operation to %s is ongoing...', os.path.basename(cls.new_sources))
             upstream = 'new_upstream'
             upstream_branch = '{}/{}'.format(upstream, cls.new_repo.heads.pop().name)
             cls.old_repo.create_remote(upstream, url=cls.new_sources).fetch()
             root_commit = cls.old_repo.git.rev_list('HEAD', max_parents=0)
             last_commit = cls.old_repo.commit('HEAD')
-            if cls.favor_on_conflict == 'upstream':
-                strategy_option = 'ours'
-            elif cls.favor_on_conflict == 'downstream':
-                strategy_option = 'theirs'
-            else:
-                strategy_option = False
-            try:
-                cls.output_data = cls.old_repo.git.rebase(root_commit, last_commit,
-                                                          strategy_option=strategy_option,
-                                                          onto=upstream_branch,
-                                                          stdout_as_string=True)
-            except git.GitCommandError as e:
-                if e.status == 128:
-                    logger.debug(str(e))
-                    raise RuntimeError('git-rebase failed unexpectedly. Please check log files') from e
-                ret_code, cls.output_data = e.status, e.stdout
-            else:
-                ret_code = 0
+            commits, cls.skipped_patches = cls._index_patches(root_commit, last_commit.hexsha, upstream_branch)
+            cls._save_skipped_patches(cls.old_repo, cls.skipped_patches)
+            cls.replayed_patches = [p for p in cls.patches if p.get_patch_name() not in cls.skipped_patches]
+            if cls.skipped_patches:
+                logger.verbose('Skipping rebase of patches touching only files unchanged upstream: %s',
+                               ', '.join(cls.skipped_patches))
+            if cls.favor_on_conflict == 'auto':
+                return cls._auto_rebase(root_commit, last_commit, commits, upstream_branch)
+            ret_code, cls.output_data = cls._start_rebase(cls.old_repo, cls.favor_on_conflict,
+                                                          root_commit, last_commit, commits, upstream_branch)
         else:
             logger.info('git-rebase operation continues...')
+            cls.skipped_patches = cls._load_skipped_patches(cls.old_repo)
+            cls.replayed_patches = [p for p in cls.patches if p.get_patch_name() not in cls.skipped_patches]
             try:
                 cls.output_data = cls.old_repo.git.rebase('--continue', stdout_as_string=True)
             except git.GitCommandError as e:
@@ -192,44 +358,153 @@ class Patcher:
                 ret_code = 0
         if cls.output_data:
             logger.verbose(cls.output_data)
+        return cls._finish_rebase(cls.old_repo, ret_code, cls.kwargs['rebased_sources_dir'])
+
+    @classmethod
+    def _auto_rebase(cls, root_commit, last_commit, commits, upstream_branch):
+        """Tries all conflict strategies simultaneously and keeps the best result.
+
+        Each strategy is tried in a separate worktree sharing the object store
+        of old sources repository. The result with the lowest number of inapplicable
+        patches is chosen, ties are broken by the number of deleted patches, so that
+        strategies keeping downstream changes are preferred, and then by the size
+        of modified patches.
+
+        Args:
+            root_commit (str): Commit representing old upstream sources.
+            last_commit (git.Commit): Commit of the last patch.
+            commits (list): Commits to be replayed.
+            upstream_branch (str): Branch representing new upstream sources.
+
+        Returns:
+            dict: Patch dictionary of the chosen strategy.
+
+        """
+        workdir = tempfile.mkdtemp(prefix='rebase-',
+                                   dir=cls.kwargs.get('workspace_dir') or os.path.dirname(cls.old_sources))
+        worktrees = {s: os.path.join(workdir, s) for s in cls.AUTO_STRATEGIES}
+        try:
+            # worktrees share repository metadata, create them one at a time
+            for strategy, path in worktrees.items():
+                cls.old_repo.git.worktree('add', '--detach', path, last_commit.hexsha)
+            logger.info('Trying %s conflict strategies simultaneously', ', '.join(cls.AUTO_STRATEGIES))
+            trials = {}
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(worktrees)) as executor:
+                futures = {
+                    executor.submit(cls._try_strategy, path, strategy, root_commit, last_commit,
+                                    commits, upstream_branch): strategy
+                    for strategy, path in worktrees.items()
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    trials[futures[future]] = future.result()
+            # strategies are ordered by preference in case of a tie
+            chosen = min(cls.AUTO_STRATEGIES,
+                         key=lambda s: (trials[s][1]['inapplicable'], trials[s][1]['deleted'],
+                                        trials[s][1]['modified_size']))
+            patch_dictionary, _, head = trials[chosen]
+            logger.info("Chose conflict strategy '%s'", chosen)
+            for patch_name in patch_dictionary.get('modified', []):
+                os.replace(os.path.join(worktrees[chosen] + '-patches', patch_name),
+                           os.path.join(cls.kwargs['rebased_sources_dir'], patch_name))
+            cls.old_repo.git.checkout(head, detach=True)
+            cls.strategy_results = dict(chosen=chosen, trials={s: t[1] for s, t in trials.items()})
+            return patch_dictionary
+        finally:
+            for path in worktrees.values():
+                try:
+                    cls.old_repo.git.worktree('remove', '--force', path)
+                except git.GitCommandError:
+                    pass
+            cls.old_repo.git.worktree('prune')
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    @classmethod
+    def _try_strategy(cls, path, favor_on_conflict, root_commit, last_commit, commits, upstream_branch):
+        """Runs non-interactive git-rebase in a worktree using the specified conflict strategy.
+
+        Returns:
+            tuple: Patch dictionary, statistics and the resulting HEAD commit.
+
+        """
+        repo = git.Repo(path)
+        ret_code, output = cls._start_rebase(repo, favor_on_conflict, root_commit, last_commit,
+                                             commits, upstream_branch)
+        if output:
+            logger.debug(output)
+        rebased_sources_dir = path + '-patches'
+        os.makedirs(rebased_sources_dir)
+        patch_dictionary = cls._finish_rebase(repo, ret_code, rebased_sources_dir)
+        stats = {k: len(patch_dictionary.get(k, [])) for k in ('deleted', 'modified', 'inapplicable', 'untouched')}
+        stats['modified_size'] = sum(os.path.getsize(os.path.join(rebased_sources_dir, p))
+                                     for p in patch_dictionary.get('modified', []))
+        return patch_dictionary, stats, repo.head.commit.hexsha
+
+    @classmethod
+    def _finish_rebase(cls, repo, ret_code, rebased_sources_dir):
+        """Resolves conflicts of an ongoing git-rebase and exports the rebased patches.
+
+        Args:
+            repo (git.Repo): Repository (or worktree) with the ongoing git-rebase.
+            ret_code (int): Return code of the last git-rebase invocation.
+            rebased_sources_dir (str): Directory to export modified patches to.
+
+        Returns:
+            dict: Lists of deleted, modified, inapplicable and untouched patches.
+
+        """
+        def compare_commits(a, b):
+            # compare commit diffs disregarding differences in blob hashes
+            attributes = (
+                'a_mode', 'b_mode', 'a_rawpath', 'b_rawpath',
+                'new_file', 'deleted_file', 'raw_rename_from', 'raw_rename_to',
+                'diff', 'change_type', 'score')
+            diff1 = a.diff(a.parents[0], create_patch=True)
+            diff2 = b.diff(b.parents[0], create_patch=True)
+            if len(diff1) != len(diff2):
+                return False
+            for d1, d2 in zip(diff1, diff2):
+                for attr in attributes:
+                    if getattr(d1, attr) != getattr(d2, attr):
+                        return False
+            return True
         patch_dictionary = {}
         modified_patches = []
         inapplicable_patches = []
         while ret_code != 0:
-            if not cls.old_repo.index.unmerged_blobs() and not cls.old_repo.index.diff(cls.old_repo.commit()):
+            if not repo.index.unmerged_blobs() and not repo.index.diff(repo.commit()):
                 # empty commit - conflict has been automatically resolved - skip
                 try:
-                    cls.output_data = cls.old_repo.git.rebase(skip=True, stdout_as_string=True)
+                    repo.git.rebase(skip=True, stdout_as_string=True)
                 except git.GitCommandError as e:
                     if e.status == 128:
                         logger.debug(str(e))
                         raise RuntimeError('git-rebase failed unexpectedly. Please check log files') from e
-                    ret_code, cls.output_data = e.status, e.stdout
+                    ret_code = e.status
                     continue
                 else:
                     break
             try:
-                if os.path.isdir(os.path.join(cls.old_sources, '.git', 'rebase-merge')):
-                    with open(os.path.join(cls.old_sources, '.git', 'rebase-merge', 'msgnum'), encoding=ENCODING) as f:
+                if os.path.isdir(os.path.join(repo.git_dir, 'rebase-merge')):
+                    with open(os.path.join(repo.git_dir, 'rebase-merge', 'msgnum'), encoding=ENCODING) as f:
                         next_index = int(f.readline())
-                    with open(os.path.join(cls.old_sources, '.git', 'rebase-merge', 'end'), encoding=ENCODING) as f:
+                    with open(os.path.join(repo.git_dir, 'rebase-merge', 'end'), encoding=ENCODING) as f:
                         last_index = int(f.readline())
                 else:
-                    with open(os.path.join(cls.old_sources, '.git', 'rebase-apply', 'next'), encoding=ENCODING) as f:
+                    with open(os.path.join(repo.git_dir, 'rebase-apply', 'next'), encoding=ENCODING) as f:
                         next_index = int(f.readline())
-                    with open(os.path.join(cls.old_sources, '.git', 'rebase-apply', 'last'), encoding=ENCODING) as f:
+                    with open(os.path.join(repo.git_dir, 'rebase-apply', 'last'), encoding=ENCODING) as f:
                         last_index = int(f.readline())
             except (FileNotFoundError, IOError) as e:
                 raise RuntimeError('git-rebase failed with unknown reason. Please check log files') from e
-            patch_name = cls.patches[next_index - 1].get_patch_name()
+            patch_name = cls.replayed_patches[next_index - 1].get_patch_name()
             inapplicable = False
             if cls.non_interactive:
                 inapplicable = True
             else:
                 logger.info('Failed to auto-merge patch %s', patch_name)
-                unmerged = cls.old_repo.index.unmerged_blobs()
-                GitHelper.run_mergetool(cls.old_repo)
-                if cls.old_repo.index.unmerged_blobs():
+                unmerged = repo.index.unmerged_blobs()
+                GitHelper.run_mergetool(repo)
+                if repo.index.unmerged_blobs():
                     if InputHelper.get_message('There are still unmerged entries. Do you want to skip this patch',
                                                default_yes=False):
                         inapplicable = True
@@ -240,7 +515,7 @@ class Patcher:
                     unresolved = []
                     for file in unmerged:
                         try:
-                            with open(os.path.join(cls.old_sources, file), 'rb') as f:
+                            with open(os.path.join(repo.working_tree_dir, file), 'rb') as f:
                                 if [l for l in f if b'<<<<<<<' in l]:
                                     unresolved.append(file)
                         except FileNotFoundError:
@@ -252,23 +527,23 @@ class Patcher:
                                                    default_yes=False):
                             inapplicable = True
                         else:
-                            cls.old_repo.index.reset(paths=unresolved)
+                            repo.index.reset(paths=unresolved)
                             unresolved.insert(0, '--')
-                            cls.old_repo.git.checkout(*unresolved, conflict='diff3')
+                            repo.git.checkout(*unresolved, conflict='diff3')
                             continue
             if inapplicable:
                 inapplicable_patches.append(patch_name)
                 try:
-                    cls.output_data = cls.old_repo.git.rebase(skip=True, stdout_as_string=True)
+                    repo.git.rebase(skip=True, stdout_as_string=True)
                 except git.GitCommandError as e:
                     if e.status == 128:
                         logger.debug(str(e))
                         raise RuntimeError('git-rebase failed unexpectedly. Please check log files') from e
-                    ret_code, cls.output_data = e.status, e.stdout
+                    ret_code = e.status
                     continue
                 else:
                     break
-            diff = cls.old_repo.index.diff(cls.old_repo.commit())
+            diff = repo.index.diff(repo.commit())
             if diff:
                 modified_patches.append(patch_name)
             if next_index < last_index:
@@ -276,43 +551,45 @@ class Patcher:
                     raise KeyboardInterrupt
             try:
                 if diff:
-                    cls.output_data = cls.old_repo.git.rebase('--continue', stdout_as_string=True)
+                    repo.git.rebase('--continue', stdout_as_string=True)
                 else:
-                    cls.output_data = cls.old_repo.git.rebase(skip=True, stdout_as_string=True)
+                    repo.git.rebase(skip=True, stdout_as_string=True)
             except git.GitCommandError as e:
                 if e.status == 128:
                     logger.debug(str(e))
                     raise RuntimeError('git-rebase failed unexpectedly. Please check log files') from e
-                ret_code, cls.output_data = e.status, e.stdout
+                ret_code = e.status
             else:
                 break
-        original_commits = list(cls.old_repo.iter_commits(rev=cls.old_repo.heads.pop()))
-        commits = list(cls.old_repo.iter_commits())
+        original_commits = list(repo.iter_commits(rev=repo.heads.pop()))
+        # skipped patches apply cleanly, their paths are not touched by upstream
+        # nor by any replayed patch, so just pick them on top of the rebased tree
+        skipped_commits = [c.hexsha for c in reversed(original_commits)
+                           if cls.extract_patch_name(c.message) in cls.skipped_patches]
+        if skipped_commits:
+            repo.git.cherry_pick(*skipped_commits)
+        commits = list(repo.iter_commits())
         untouched_patches = []
         deleted_patches = []
+        exported = {}
         for patch in cls.patches:
             patch_name = patch.get_patch_name()
+            if patch_name in cls.skipped_patches:
+                untouched_patches.append(patch_name)
+                continue
             original_commit = [c for c in original_commits if cls.extract_patch_name(c.message) == patch_name]
             commit = [c for c in commits if cls.extract_patch_name(c.message) == patch_name]
             if original_commit and commit:
                 if patch_name not in modified_patches and compare_commits(original_commit[0], commit[0]):
                     untouched_patches.append(patch_name)
                 else:
-                    base_name = os.path.join(cls.kwargs['rebased_sources_dir'], patch_name)
-                    if commit[0].summary == cls.decorate_patch_name(patch_name):
-                        diff = cls.old_repo.git.diff(commit[0].parents[0], commit[0], stdout_as_string=False)
-                    else:
-                        diff = cls.old_repo.git.format_patch(commit[0], '-1',
-                                                             stdout=True, no_numbered=True,
-                                                             no_attach=True, stdout_as_string=False)
-                        diff = cls.strip_patch_name(diff, patch_name)
-                    with open(base_name, 'wb') as f:
-                        f.write(diff)
-                        f.write(b'\n')
+                    exported[commit[0].hexsha] = (patch_name,
+                                                  commit[0].summary == cls.decorate_patch_name(patch_name))
                     if patch_name not in modified_patches:
                         modified_patches.append(patch_name)
             elif patch_name not in inapplicable_patches:
                 deleted_patches.append(patch_name)
+        cls._export_patches(repo, exported, rebased_sources_dir)
         if deleted_patches:
             patch_dictionary['deleted'] = deleted_patches
         if modified_patches:
@@ -382,6 +659,10 @@ class Patcher:
         cls.patches = patches
         cls.non_interactive = kwargs.get('non_interactive')
         cls.favor_on_conflict = kwargs.get('favor_on_conflict')
+        cls.strategy_results = None
+        if cls.favor_on_conflict == 'auto' and not cls.non_interactive:
+            logger.warning('Choosing conflict strategy automatically is possible only in non-interactive mode')
+            cls.favor_on_conflict = 'off'
         cls.old_repo, old_repo_state = cls.init_git(old_dir)
         if old_repo_state == 'INIT':
             cls.apply_old_patches(old_dir)
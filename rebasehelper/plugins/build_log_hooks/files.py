@@ -208,7 +208,8 @@ class Files(BaseBuildLogHook):
             if section.normalized_id.startswith('files'):
                 files.append(section.id)
                 for line in section:
-                    new_best_match = difflib.get_close_matches(file, [best_match, rebase_spec_file.spec.expand(line)])
+                    expanded = rebase_spec_file.expand(line, raise_errors=True)
+                    new_best_match = difflib.get_close_matches(file, [best_match, expanded])
                     if new_best_match:
                         # the new match is a closer match
                         if new_best_match[0] != best_match:
@@ -227,6 +228,11 @@ class Files(BaseBuildLogHook):
             path = os.path.join(directory, name)
         return path
 
+    @staticmethod
+    def _is_substitutable_macro(macro):
+        """Checks whether a macro can be used to express paths of added files."""
+        return macro.level == MacroLevel.SPEC and macro.name == "name" or macro.name in MACROS_WHITELIST
+
     @classmethod
     def _correct_missing_files(cls, rebase_spec_file, files):
         """Adds files found in buildroot which are missing in %files
@@ -241,12 +247,7 @@ class Files(BaseBuildLogHook):
                 logger.error('The specfile does not contain any %files section, cannot add the missing files')
                 break
             substituted_path = cls._sanitize_path(
-                rebase_spec_file.substitute_path_with_macros(
-                    file,
-                    lambda m: m.level == MacroLevel.SPEC
-                    and m.name == "name"
-                    or m.name in MACROS_WHITELIST,
-                )
+                rebase_spec_file.substitute_path_with_macros(file, cls._is_substitutable_macro)
             )
             with rebase_spec_file.spec.sections() as sections:
                 section = getattr(sections, section_name)
@@ -311,7 +312,7 @@ class Files(BaseBuildLogHook):
             # Expand the whole line to check for occurrences of special
             # keywords, such as %global and %if blocks. Macro definitions
             # expand to empty string.
-            expanded = spec.spec.expand(sec_content[i])
+            expanded = spec.expand(sec_content[i], raise_errors=True)
             if not original_line or not expanded or any(k in expanded for k in cls.PROHIBITED_KEYWORDS):
                 i += 1
                 continue
@@ -330,7 +331,7 @@ class Files(BaseBuildLogHook):
                         prepend_macro = cls.FILES_DIRECTIVES[prepended_directive] or ''
                         split_line[j] = os.path.join(prepend_macro, subpackage, os.path.basename(path))
                         possible_rename[j] = True
-            split_line = [spec.spec.expand(p) for p in split_line]
+            split_line = [spec.expand(p, raise_errors=True) for p in split_line]
 
             j = 0
             while j < len(split_line) and files:
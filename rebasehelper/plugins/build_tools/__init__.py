@@ -22,14 +22,24 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import atexit
+import collections
+import contextlib
+import hashlib
+import io
+import json
 import logging
 import os
 import shutil
-from typing import cast
+import threading
+import time
+from typing import Dict, List, Optional, cast
 
 import pam  # type: ignore
 
+from rebasehelper.constants import ENCODING
 from rebasehelper.helpers.path_helper import PathHelper
+from rebasehelper.helpers.process_helper import ProcessHelper
 from rebasehelper.logger import CustomLogger
 from rebasehelper.temporary_environment import TemporaryEnvironment
 
@@ -77,6 +87,356 @@ def check_mock_privileges() -> bool:
     return pam.pam().authenticate('root', '', service='mock')
 
 
+class MockRootCache:
+    """Class managing mock roots reused across builds.
+
+    A root is identified by the mock configuration and the set of build
+    dependencies of the package, so builds of old and new version share
+    a pre-populated root (including its bootstrap chroot) as long as their
+    BuildRequires match. A changed set of BuildRequires results in a new root
+    and the least recently used roots are scrubbed.
+
+    Attributes:
+        CMD(str): Mock executable.
+        PREFIX(str): Prefix of unique extensions of managed roots.
+        MAX_ROOTS(int): Maximum number of roots kept per mock configuration.
+        BASEDIR(str): Directory where mock creates roots by default.
+
+    """
+
+    CMD: str = 'mock'
+    PREFIX: str = 'rebase-helper-'
+    MAX_ROOTS: int = 2
+    BASEDIR: str = '/var/lib/mock'
+
+    @classmethod
+    def get_basedir(cls, fallback):
+        """Gets directory where mock creates roots or fallback directory if it doesn't exist."""
+        return cls.BASEDIR if os.path.isdir(cls.BASEDIR) else fallback
+
+    @staticmethod
+    def get_config(builder_options):
+        """Gets mock configuration selected by builder options.
+
+        Args:
+            builder_options (list): Additional options for mock.
+
+        Returns:
+            str: Name of or path to the configuration.
+
+        """
+        config = 'default'
+        options = iter(builder_options or [])
+        for option in options:
+            if option in ('-r', '--root'):
+                config = next(options, config)
+            elif option.startswith('--root='):
+                config = option.split('=', 1)[1]
+        return config
+
+    @staticmethod
+    def get_root_key(config, build_requires):
+        """Gets key identifying a root for the given configuration and build dependencies."""
+        data = '\0'.join([config] + sorted(set(build_requires)))
+        return hashlib.sha256(data.encode(ENCODING)).hexdigest()[:16]
+
+    @staticmethod
+    def get_cache_dir(config):
+        return PathHelper.get_cache_dir('mock-roots', os.path.basename(config))
+
+    @classmethod
+    @contextlib.contextmanager
+    def root(cls, spec, builder_options):
+        """Context manager providing mock options to build in a cached root.
+
+        The root is marked as populated when the build succeeds. A failed build
+        scrubs the root, because it can be left in an inconsistent state.
+
+        Args:
+            spec (rebasehelper.specfile.SpecFile): SPEC file of the package to build.
+            builder_options (list): Additional options for mock.
+
+        Yields:
+            list: Options to pass to mock.
+
+        """
+        config = cls.get_config(builder_options)
+        key = cls.get_root_key(config, spec.build_requires)
+        cache_dir = cls.get_cache_dir(config)
+        stamp = os.path.join(cache_dir, key)
+        options = ['--uniqueext', cls.PREFIX + key, '--no-cleanup-after']
+        if os.path.isfile(stamp):
+            logger.verbose("Reusing mock root '%s' of '%s'", key, config)
+            # the bootstrap chroot is kept along with the root, don't pull its image again
+            options.extend(['--no-clean', '--config-opts=bootstrap_image_skip_pull=True'])
+        try:
+            yield options
+        except Exception:
+            if os.path.isfile(stamp):
+                os.unlink(stamp)
+            # the root is not cleaned up after the build, don't leave it behind
+            logger.verbose("Scrubbing mock root '%s' of '%s' after failed build", key, config)
+            cls._scrub(config, key)
+            raise
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(stamp, 'w', encoding=ENCODING):
+            pass
+        cls._prune(config, cache_dir)
+
+    @classmethod
+    def _prune(cls, config, cache_dir):
+        stamps = sorted(os.scandir(cache_dir), key=lambda e: e.stat().st_mtime, reverse=True)
+        for entry in stamps[cls.MAX_ROOTS:]:
+            logger.verbose("Scrubbing stale mock root '%s' of '%s'", entry.name, config)
+            cls._scrub(config, entry.name)
+            os.unlink(entry.path)
+
+    @classmethod
+    def _scrub(cls, config, key):
+        cmd = [cls.CMD, '--root', config, '--uniqueext', cls.PREFIX + key, '--scrub', 'all']
+        if not check_mock_privileges():
+            cmd = ['pkexec'] + cmd
+        try:
+            ProcessHelper.run_subprocess(cmd, output_file=os.devnull)
+        except OSError as e:
+            logger.warning("Failed to scrub mock root '%s': %s", key, str(e))
+
+
+class CompilerCache:
+    """Class representing a persistent compiler cache of a package shared by local builds.
+
+    Attributes:
+        TOOLS(list): Supported compiler cache tools.
+        CCACHE_MASQUERADE_DIRS(list): Directories with compiler symlinks to ccache.
+
+    """
+
+    TOOLS: List[str] = ['ccache', 'sccache']
+    CCACHE_MASQUERADE_DIRS: List[str] = ['/usr/lib64/ccache', '/usr/lib/ccache']
+
+    def __init__(self, tool, package):
+        self.tool = tool
+        self.path = PathHelper.get_cache_dir('compiler-cache', tool, package)
+        os.makedirs(self.path, exist_ok=True)
+
+    @classmethod
+    def from_options(cls, spec, **kwargs):
+        """Creates a compiler cache of a package if enabled by --compiler-cache option.
+
+        Args:
+            spec (rebasehelper.specfile.SpecFile): SPEC file of the package.
+
+        Returns:
+            CompilerCache: Compiler cache or None if not enabled.
+
+        """
+        tool = kwargs.get('app_kwargs', {}).get('compiler_cache')
+        if not tool:
+            return None
+        return cls(tool, spec.spec.expanded_name)
+
+    def get_environment(self):
+        """Gets environment variables making a local build use the cache."""
+        if self.tool == 'ccache':
+            env = {'CCACHE_DIR': self.path}
+            masquerade_dir = next((d for d in self.CCACHE_MASQUERADE_DIRS if os.path.isdir(d)), None)
+            if masquerade_dir:
+                env['PATH'] = os.pathsep.join([masquerade_dir, os.environ.get('PATH', os.defpath)])
+            else:
+                env.update(CC='ccache gcc', CXX='ccache g++')
+            return env
+        return {
+            'SCCACHE_DIR': self.path,
+            'RUSTC_WRAPPER': 'sccache',
+            'CC': 'sccache gcc',
+            'CXX': 'sccache g++',
+        }
+
+    def get_mock_options(self):
+        """Gets mock options bind mounting the cache into the buildroot."""
+        if self.tool != 'ccache':
+            logger.warning("%s is not supported by mock, building without compiler cache", self.tool)
+            return []
+        return ['--enable-plugin=ccache', '--plugin-option=ccache:dir={}'.format(self.path)]
+
+    def _run(self, *args):
+        output = io.StringIO()
+        try:
+            ret = ProcessHelper.run_subprocess_env([self.tool] + list(args), env=self.get_environment(),
+                                                   output_file=output, ignore_stderr=True)
+        except OSError:
+            return None
+        return output.getvalue() if ret == 0 else None
+
+    def zero_stats(self):
+        """Resets statistics of the cache, so that they cover only the next build."""
+        self._run('--zero-stats')
+
+    def get_stats(self):
+        """Gets statistics of the cache since the last reset.
+
+        Returns:
+            dict: Numbers of cache 'hits' and 'misses' or None if not available.
+
+        """
+        if self.tool == 'ccache':
+            output = self._run('--print-stats')
+            if output is None:
+                return None
+            stats = dict(l.split('\t', 1) for l in output.splitlines() if '\t' in l)
+            try:
+                return dict(
+                    hits=int(stats.get('direct_cache_hit', 0)) + int(stats.get('preprocessed_cache_hit', 0)),
+                    misses=int(stats.get('cache_miss', 0)))
+            except ValueError:
+                return None
+        output = self._run('--show-stats', '--stats-format', 'json')
+        if output is None:
+            return None
+        try:
+            stats = json.loads(output)['stats']
+            return dict(hits=sum(stats['cache_hits']['counts'].values()),
+                        misses=sum(stats['cache_misses']['counts'].values()))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+
+class BuildJob:
+    """Class representing host resources reserved for a local build."""
+
+    def __init__(self, name, cpus, memory, limited=True):
+        self.name = name
+        self.cpus = cpus
+        self.memory = memory
+        self.limited = limited
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def get_rpm_options(self):
+        """Gets rpmbuild/mock options limiting parallelism of the build to the reserved CPUs."""
+        if not self.limited:
+            return []
+        return [
+            '--define', '_smp_build_ncpus {}'.format(self.cpus),
+            # older rpm versions don't derive _smp_mflags from _smp_build_ncpus
+            '--define', '_smp_mflags -j{}'.format(self.cpus),
+        ]
+
+    def get_stats(self):
+        return dict(cpus=self.cpus, wait_time=round(self.wait_time, 1), run_time=round(self.run_time, 1))
+
+
+class BuildScheduler:
+    """Class distributing CPUs and memory of the host among simultaneous local builds.
+
+    A build gets free CPUs shared among builds waiting at the moment, so builds
+    started simultaneously should limit their CPUs. A build waits until there are
+    enough resources, but it is always allowed to run if no other build is running.
+    A build running alone without an explicit CPU limit gets the whole host
+    and its parallelism is left to the build tool.
+
+    Attributes:
+        MEMORY_PER_CPU(int): Memory in bytes reserved for each CPU of a build.
+        MIN_FREE_DISK(int): Free disk space in bytes required to start a build.
+
+    """
+
+    MEMORY_PER_CPU: int = 2 * 1024 ** 3
+    MIN_FREE_DISK: int = 2 * 1024 ** 3
+
+    _condition: threading.Condition = threading.Condition()
+    _free_cpus: Optional[int] = None
+    _free_memory: Optional[int] = None
+    _running: int = 0
+    _waiting: int = 0
+
+    @staticmethod
+    def get_host_cpus():
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+
+    @staticmethod
+    def get_host_memory():
+        try:
+            with open('/proc/meminfo', encoding=ENCODING) as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+    @classmethod
+    @contextlib.contextmanager
+    def job(cls, name, path, max_cpus=None):
+        """Context manager reserving resources for a build for the duration of the context.
+
+        Args:
+            name (str): Name of the build.
+            path (str): Path to directory where the build takes place.
+            max_cpus (int): Maximum number of CPUs the build can use.
+
+        Yields:
+            BuildJob: Reserved resources.
+
+        """
+        start = time.monotonic()
+        with cls._condition:
+            if cls._free_cpus is None:
+                cls._free_cpus = cls.get_host_cpus()
+                cls._free_memory = cls.get_host_memory()
+            cls._waiting += 1
+            try:
+                job = cls._allocate(name, path, max_cpus)
+                while job is None:
+                    cls._condition.wait()
+                    job = cls._allocate(name, path, max_cpus)
+            finally:
+                cls._waiting -= 1
+            cls._running += 1
+        job.wait_time = time.monotonic() - start
+        logger.verbose("Build %s got %d CPUs after waiting %.1f s", name, job.cpus, job.wait_time)
+        start = time.monotonic()
+        try:
+            yield job
+        finally:
+            job.run_time = time.monotonic() - start
+            with cls._condition:
+                cls._free_cpus += job.cpus
+                cls._free_memory += job.memory
+                cls._running -= 1
+                cls._condition.notify_all()
+
+    @classmethod
+    def _allocate(cls, name, path, max_cpus):
+        alone = cls._running == 0
+        if shutil.disk_usage(path).free < cls.MIN_FREE_DISK:
+            if not alone:
+                return None
+            logger.warning("Low free disk space in '%s'", path)
+        if alone and cls._waiting == 1 and not max_cpus:
+            # nothing to share the host with, don't limit the build
+            job = BuildJob(name, cls._free_cpus, cls._free_memory, limited=False)
+            cls._free_cpus = 0
+            cls._free_memory = 0
+            return job
+        # share free CPUs with the other waiting builds
+        cpus = max(1, cls._free_cpus // cls._waiting)
+        if max_cpus:
+            cpus = min(cpus, max_cpus)
+        cpus = min(cpus, cls._free_cpus, cls._free_memory // cls.MEMORY_PER_CPU)
+        if cpus < 1:
+            if not alone:
+                return None
+            cpus = 1
+        memory = min(cpus * cls.MEMORY_PER_CPU, cls._free_memory)
+        cls._free_cpus -= cpus
+        cls._free_memory -= memory
+        return BuildJob(name, cpus, memory)
+
+
 class BuildTemporaryEnvironment(TemporaryEnvironment):
     """Class representing temporary environment."""
 
@@ -85,33 +445,123 @@ class BuildTemporaryEnvironment(TemporaryEnvironment):
     TEMPDIR_SPECS: str = TemporaryEnvironment.TEMPDIR + '_SPECS'
     TEMPDIR_RESULTS: str = TemporaryEnvironment.TEMPDIR + '_RESULTS'
 
-    def __init__(self, sources, patches, spec, results_dir):
+    # directories where build tools place packages and logs
+    ARTIFACT_DIRS: List[str] = [TEMPDIR_RESULTS]
+
+    # directory structures of finished environments available for reuse, by environment class
+    _pool: Dict[type, List[Dict[str, str]]] = collections.defaultdict(list)
+
+    # environments kept with their content after exit, by key
+    _kept: Dict[str, Dict[str, str]] = {}
+
+    def __init__(self, sources, patches, spec, results_dir, key=None):
+        """Constructs the environment.
+
+        Args:
+            sources: List of paths to sources.
+            patches: List of paths to patches.
+            spec: Path to SPEC file.
+            results_dir: Path to directory where packages and logs will be moved.
+            key: Key identifying the environment. If an environment with the same key
+                has been kept, it is reused including its content.
+
+        """
         super().__init__(self._build_env_exit_callback)
         self._env['results_dir'] = results_dir
+        self._skeleton: Dict[str, str] = {}
+        self._keep = False
+        self.key = key
+        self.reused = False
         self.sources = sources
         self.patches = patches
         self.spec = spec
 
     def __enter__(self):
-        obj = super().__enter__()
-        log_message = "Copying '%s' to '%s'"
-        # create the directory structure
-        self._create_directory_structure()
-        # copy sources
+        pool = self._pool[type(self)]
+        kept = self._kept.pop(self.key, None) if self.key else None
+        if kept:
+            self._env.update(kept)
+            self.reused = True
+            logger.debug("Reusing kept environment in '%s'", self.path())
+        elif pool:
+            self._env.update(pool.pop())
+            logger.debug("Reusing environment in '%s'", self.path())
+        else:
+            super().__enter__()
+            # create the directory structure
+            self._create_directory_structure()
+        self._skeleton = {k: v for k, v in self._env.items() if k.startswith(self.TEMPDIR)}
+        log_message = "Staging '%s' in '%s'"
+        # stage sources
         for source in self.sources:
             logger.debug(log_message, source, self._env[self.TEMPDIR_SOURCES])
-            shutil.copy(source, self._env[self.TEMPDIR_SOURCES])
-        # copy patches
+            PathHelper.stage_file(source, self._env[self.TEMPDIR_SOURCES])
+        # stage patches
         for patch in self.patches:
             logger.debug(log_message, patch, self._env[self.TEMPDIR_SOURCES])
-            shutil.copy(patch, self._env[self.TEMPDIR_SOURCES])
-        # copy SPEC file
+            PathHelper.stage_file(patch, self._env[self.TEMPDIR_SOURCES])
+        # stage SPEC file
         spec_name = os.path.basename(self.spec)
         self._env[self.TEMPDIR_SPEC] = os.path.join(self._env[self.TEMPDIR_SPECS], spec_name)
-        shutil.copy(self.spec, self._env[self.TEMPDIR_SPEC])
+        PathHelper.stage_file(self.spec, self._env[self.TEMPDIR_SPEC])
         logger.debug(log_message, self.spec, self._env[self.TEMPDIR_SPEC])
 
-        return obj
+        return self
+
+    def keep(self):
+        """Keeps the environment with its content after exit for an environment with the same key."""
+        if self.key:
+            self._keep = True
+
+    @classmethod
+    def discard_kept(cls, key):
+        """Removes a kept environment.
+
+        Args:
+            key: Key of the environment.
+
+        """
+        kept = cls._kept.pop(key, None)
+        if kept:
+            shutil.rmtree(kept[cls.TEMPDIR], ignore_errors=True)
+
+    def _destroy(self):
+        if self._keep:
+            self._kept[self.key] = self._skeleton
+            logger.debug("Kept environment in '%s'", self.path())
+            return
+        # empty the directory structure and keep it for the next environment
+        try:
+            self._empty_directory_structure()
+        except OSError:
+            super()._destroy()
+        else:
+            self._pool[type(self)].append(self._skeleton)
+            logger.debug("Released environment in '%s'", self.path())
+
+    def _empty_directory_structure(self):
+        directories = set(self._skeleton.values())
+        for root, dirnames, filenames in os.walk(self.path()):
+            for filename in filenames:
+                os.unlink(os.path.join(root, filename))
+            for dirname in list(dirnames):
+                path = os.path.join(root, dirname)
+                if path in directories:
+                    continue
+                if os.path.islink(path):
+                    os.unlink(path)
+                else:
+                    shutil.rmtree(path)
+                dirnames.remove(dirname)
+
+    @classmethod
+    def clear_pool(cls):
+        """Removes directory structures of all finished and kept environments."""
+        for pool in cls._pool.values():
+            while pool:
+                shutil.rmtree(pool.pop()[cls.TEMPDIR], ignore_errors=True)
+        for key in list(cls._kept):
+            cls.discard_kept(key)
 
     def _create_directory_structure(self):
         """Function creating the directory structure in the TemporaryEnvironment."""
@@ -120,20 +570,59 @@ class BuildTemporaryEnvironment(TemporaryEnvironment):
     def _build_env_exit_callback(self, results_dir, **kwargs):
         """
         The function that is called just before the destruction of the TemporaryEnvironment.
-        It copies packages and logs into the results directory.
+        It moves packages and logs from output directories into the results directory.
 
         :param results_dir: absolute path to results directory
         :return:
         """
-        log_message = "Copying '%s' '%s' to '%s'"
-        # copy logs
-        for log in PathHelper.find_all_files(kwargs[self.TEMPDIR_RESULTS], '*.log'):
-            logger.debug(log_message, 'log', log, results_dir)
-            shutil.copy(log, results_dir)
-        # copy packages
-        for package in PathHelper.find_all_files(kwargs[self.TEMPDIR], '*.rpm'):
-            logger.debug(log_message, 'package', package, results_dir)
-            shutil.copy(package, results_dir)
+        log_message = "Moving '%s' '%s' to '%s'"
+        packages, logs = self.find_artifacts(*[kwargs[d] for d in self.ARTIFACT_DIRS])
+        for kind, artifacts in [('log', logs), ('package', packages)]:
+            for artifact in artifacts:
+                logger.debug(log_message, kind, artifact, results_dir)
+                destination = os.path.join(results_dir, os.path.basename(artifact))
+                try:
+                    os.replace(artifact, destination)
+                except OSError:
+                    # different filesystem
+                    shutil.move(artifact, destination)
+
+    @staticmethod
+    def find_artifacts(*dirs):
+        """Finds packages and logs in output directories of a build.
+
+        Only the directories themselves and their immediate subdirectories
+        (e.g. architecture subdirectories of RPMS) are scanned, build trees
+        are never traversed.
+
+        Args:
+            *dirs (str): Output directories.
+
+        Returns:
+            tuple: Sorted lists of absolute paths to packages and logs.
+
+        """
+        packages = []
+        logs = []
+
+        def scan(path, depth):
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth > 0:
+                            scan(entry.path, depth - 1)
+                    elif entry.name.endswith('.rpm'):
+                        packages.append(os.path.abspath(entry.path))
+                    elif entry.name.endswith('.log'):
+                        logs.append(os.path.abspath(entry.path))
+
+        for d in dirs:
+            if os.path.isdir(d):
+                scan(d, 1)
+        return sorted(packages), sorted(logs)
+
+
+atexit.register(BuildTemporaryEnvironment.clear_pool)
 
 
 class RpmbuildTemporaryEnvironment(BuildTemporaryEnvironment):
@@ -145,6 +634,8 @@ class RpmbuildTemporaryEnvironment(BuildTemporaryEnvironment):
     TEMPDIR_RPMS: str = TemporaryEnvironment.TEMPDIR + '_RPMS'
     TEMPDIR_SRPMS: str = TemporaryEnvironment.TEMPDIR + '_SRPMS'
 
+    ARTIFACT_DIRS: List[str] = BuildTemporaryEnvironment.ARTIFACT_DIRS + [TEMPDIR_RPMS, TEMPDIR_SRPMS]
+
     def _create_directory_structure(self):
         # create rpmbuild directory structure
         for dir_name in ['RESULTS', 'rpmbuild']:
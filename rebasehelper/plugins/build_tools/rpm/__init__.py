@@ -36,12 +36,16 @@ class BuildToolBase(Plugin):
         ACCEPTS_OPTIONS(bool): If True, the build tool accepts additional
             options passed via --builder-options.
         CREATES_TASKS(bool): If True, the build tool creates remote tasks.
+        INCREMENTAL(bool): If True, the build tool can rebuild packages incrementally,
+            reusing the build tree of the previous failed build, after changes
+            in %files sections.
 
     """
 
     DEFAULT: bool = False
     ACCEPTS_OPTIONS: bool = False
     CREATES_TASKS: bool = False
+    INCREMENTAL: bool = False
 
     @classmethod
     def prepare(cls, spec, conf):
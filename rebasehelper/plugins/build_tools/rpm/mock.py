@@ -22,6 +22,7 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import contextlib
 import logging
 import os
 from typing import cast
@@ -29,9 +30,11 @@ from typing import cast
 from rebasehelper.helpers.process_helper import ProcessHelper
 from rebasehelper.helpers.path_helper import PathHelper
 from rebasehelper.logger import CustomLogger
-from rebasehelper.plugins.build_tools import MockTemporaryEnvironment, check_mock_privileges, get_mock_logfile_path
+from rebasehelper.plugins.build_tools import (BuildScheduler, CompilerCache, MockRootCache, MockTemporaryEnvironment,
+                                              check_mock_privileges, get_mock_logfile_path)
 from rebasehelper.plugins.build_tools.rpm import BuildToolBase
 from rebasehelper.exceptions import BinaryPackageBuildError
+from rebasehelper.types import Options
 
 
 logger: CustomLogger = cast(CustomLogger, logging.getLogger(__name__))
@@ -47,6 +50,15 @@ class Mock(BuildToolBase):  # pylint: disable=abstract-method
 
     CMD: str = 'mock'
 
+    OPTIONS: Options = [
+        {
+            "name": ["--no-mock-root-reuse"],
+            "default": False,
+            "switch": True,
+            "help": "do not reuse mock roots populated by previous builds with the same build dependencies",
+        },
+    ]
+
     @classmethod
     def _build_rpm(cls, srpm, results_dir, rpm_results_dir, root=None, arch=None, builder_options=None):
         """Builds RPMs using mock.
@@ -79,12 +91,11 @@ class Mock(BuildToolBase):  # pylint: disable=abstract-method
             cmd = ['pkexec'] + cmd
 
         ret = ProcessHelper.run_subprocess(cmd, output_file=output)
-        logs = []
-        for log in PathHelper.find_all_files(results_dir, '*.log'):
-            logs.append(os.path.join(rpm_results_dir, os.path.basename(log)))
+        packages, logs = MockTemporaryEnvironment.find_artifacts(results_dir)
+        logs = [os.path.join(rpm_results_dir, os.path.basename(log)) for log in logs]
 
         if ret == 0:
-            return [f for f in PathHelper.find_all_files(results_dir, '*.rpm') if not f.endswith('.src.rpm')], logs
+            return [f for f in packages if not f.endswith('.src.rpm')], logs
         else:
             logfile = get_mock_logfile_path(ret, rpm_results_dir, tmp_path=results_dir)
         raise BinaryPackageBuildError("Building RPMs failed!", rpm_results_dir, logfile=logfile, logs=logs)
@@ -102,14 +113,30 @@ class Mock(BuildToolBase):  # pylint: disable=abstract-method
         :return: dict with:
                  'rpm' -> list with absolute paths to RPMs
                  'logs' -> list with absolute paths to logs
+                 'compiler_cache' -> compiler cache statistics, if enabled
+                 'resources' -> CPUs used by the build, time spent waiting for them and build time
         """
         sources = spec.get_sources()
         patches = [p.path for p in spec.get_patches()]
-        with MockTemporaryEnvironment(sources, patches, spec.spec.path, results_dir) as tmp_env:
+        builder_options = cls.get_builder_options(**kwargs) or []
+        compiler_cache = CompilerCache.from_options(spec, **kwargs)
+        if compiler_cache is not None:
+            cache_options = compiler_cache.get_mock_options()
+            if cache_options:
+                compiler_cache.zero_stats()
+                builder_options = builder_options + cache_options
+            else:
+                compiler_cache = None
+        with contextlib.ExitStack() as stack:
+            if not kwargs.get('app_kwargs', {}).get('no_mock_root_reuse'):
+                builder_options = builder_options + stack.enter_context(MockRootCache.root(spec, builder_options))
+            tmp_env = stack.enter_context(MockTemporaryEnvironment(sources, patches, spec.spec.path, results_dir))
             env = tmp_env.env()
             tmp_results_dir = env.get(MockTemporaryEnvironment.TEMPDIR_RESULTS)
-            rpms, logs = cls._build_rpm(srpm, tmp_results_dir, results_dir,
-                                        builder_options=cls.get_builder_options(**kwargs))
+            with BuildScheduler.job('{}-{}'.format(kwargs.get('name'), kwargs.get('version')),
+                                    MockRootCache.get_basedir(tmp_env.path())) as job:
+                rpms, logs = cls._build_rpm(srpm, tmp_results_dir, results_dir,
+                                            builder_options=job.get_rpm_options() + builder_options)
             # remove SRPM - side product of building RPM
             tmp_srpm = PathHelper.find_first_file(tmp_results_dir, "*.src.rpm")
             if tmp_srpm is not None:
@@ -121,4 +148,7 @@ class Mock(BuildToolBase):  # pylint: disable=abstract-method
         logger.verbose("Successfully built RPMs: '%s'", str(rpms))
         logger.verbose("logs: '%s'", str(logs))
 
-        return dict(rpm=rpms, logs=logs)
+        result = dict(rpm=rpms, logs=logs, resources=job.get_stats())
+        if compiler_cache is not None:
+            result['compiler_cache'] = compiler_cache.get_stats()
+        return result
@@ -24,14 +24,14 @@
 
 import logging
 import os
-from typing import cast
+from typing import List, cast
 
+from rebasehelper.constants import ENCODING
 from rebasehelper.helpers.process_helper import ProcessHelper
 from rebasehelper.helpers.input_helper import InputHelper
-from rebasehelper.helpers.path_helper import PathHelper
 from rebasehelper.helpers.rpm_helper import RpmHelper, RpmHeader
 from rebasehelper.logger import CustomLogger
-from rebasehelper.plugins.build_tools import RpmbuildTemporaryEnvironment
+from rebasehelper.plugins.build_tools import BuildScheduler, CompilerCache, RpmbuildTemporaryEnvironment
 from rebasehelper.plugins.build_tools.rpm import BuildToolBase
 from rebasehelper.exceptions import RebaseHelperError, BinaryPackageBuildError
 
@@ -45,11 +45,33 @@ class Rpmbuild(BuildToolBase):  # pylint: disable=abstract-method
     """
 
     ACCEPTS_OPTIONS: bool = True
+    INCREMENTAL: bool = True
 
     CMD: str = 'rpmbuild'
 
+    # lines of build log printed by rpmbuild only after %install and %check succeeded
+    PACKAGING_MARKERS: List[str] = ['Processing files:', 'Checking for unpackaged file(s)']
+
+    @classmethod
+    def failed_in_packaging(cls, build_log):
+        """Checks whether a failed build got to packaging, i.e. its buildroot is complete.
+
+        Args:
+            build_log: Path to build log of the build.
+
+        Returns:
+            bool: True if the build failed while packaging.
+
+        """
+        try:
+            with open(build_log, encoding=ENCODING, errors='replace') as f:
+                return any(marker in line for line in f for marker in cls.PACKAGING_MARKERS)
+        except OSError:
+            return False
+
     @classmethod
-    def _build_rpm(cls, srpm, workdir, results_dir, rpm_results_dir, builder_options=None):
+    def _build_rpm(cls, srpm, workdir, results_dir, rpm_results_dir, builder_options=None, compiler_cache=None,
+                   short_circuit_spec=None):
         """Builds RPMs using rpmbuild
 
         Args:
@@ -58,6 +80,9 @@ class Rpmbuild(BuildToolBase):  # pylint: disable=abstract-method
             results_dir: Path to directory where logs will be placed.
             rpm_results_dir: Path to directory where RPMs will be placed.
             builder_options: Additional options for rpmbuild.
+            compiler_cache: CompilerCache to use.
+            short_circuit_spec: Path to SPEC file to package from the build tree of the previous build
+                instead of rebuilding SRPM.
 
         Returns:
             Tuple, the first element is a list of paths to built RPMs,
@@ -67,20 +92,28 @@ class Rpmbuild(BuildToolBase):  # pylint: disable=abstract-method
         logger.info("Building RPMs")
         output = os.path.join(results_dir, "build.log")
 
-        cmd = [cls.CMD, '--rebuild', srpm]
+        if short_circuit_spec is not None:
+            # skip straight to packaging, the build tree and buildroot are already there
+            cmd = [cls.CMD, '-bb', '--short-circuit', short_circuit_spec]
+        else:
+            cmd = [cls.CMD, '--rebuild', srpm]
         if builder_options is not None:
             cmd.extend(builder_options)
+        env = {'HOME': workdir}
+        if compiler_cache is not None:
+            env.update(compiler_cache.get_environment())
         ret = ProcessHelper.run_subprocess_cwd_env(cmd,
-                                                   env={'HOME': workdir},
+                                                   env=env,
                                                    output_file=output)
 
         build_log_path = os.path.join(rpm_results_dir, 'build.log')
-        logs = []
-        for log in PathHelper.find_all_files(results_dir, '*.log'):
-            logs.append(os.path.join(rpm_results_dir, os.path.basename(log)))
+        # rpmbuild places packages into its topdir in HOME
+        packages, logs = RpmbuildTemporaryEnvironment.find_artifacts(results_dir,
+                                                                     os.path.join(workdir, 'rpmbuild', 'RPMS'))
+        logs = [os.path.join(rpm_results_dir, os.path.basename(l)) for l in logs]
 
         if ret == 0:
-            return [f for f in PathHelper.find_all_files(workdir, '*.rpm') if not f.endswith('.src.rpm')], logs
+            return [f for f in packages if not f.endswith('.src.rpm')], logs
         # An error occurred, raise an exception
         raise BinaryPackageBuildError("Building RPMs failed!", results_dir, logfile=build_log_path, logs=logs)
 
@@ -92,7 +125,11 @@ class Rpmbuild(BuildToolBase):  # pylint: disable=abstract-method
 
         :param spec: SpecFile object
         """
-        if not RpmHelper.all_packages_installed(RpmHeader(spec.spec.rpm_spec.sourceHeader).requires):
+        header = RpmHeader(spec.spec.rpm_spec.sourceHeader)
+        missing = RpmHelper.get_missing_dependencies(zip(header.requirename, header.requireflags,
+                                                         header.requireversion))
+        if missing:
+            logger.info('Missing build dependencies: %s', ', '.join(RpmHelper.format_dependency(*d) for d in missing))
             question = '\nSome build dependencies are missing. Do you want to install them now'
             if conf.non_interactive or InputHelper.get_message(question):
                 if RpmHelper.install_build_dependencies(spec.spec.path, assume_yes=conf.non_interactive) != 0:
@@ -106,18 +143,43 @@ class Rpmbuild(BuildToolBase):  # pylint: disable=abstract-method
         :param spec: SpecFile object
         :param results_dir: absolute path to DIR where results should be stored
         :param srpm: absolute path to SRPM
+        :param incremental: whether to only package the files using the build tree of the previous build
         :return: dict with:
                  'rpm' -> list with absolute paths to RPMs
                  'logs' -> list with absolute paths to build_logs
+                 'compiler_cache' -> compiler cache statistics, if enabled
+                 'resources' -> CPUs used by the build, time spent waiting for them and build time
         """
         sources = spec.get_sources()
         patches = [p.path for p in spec.get_patches()]
-        with RpmbuildTemporaryEnvironment(sources, patches, spec.spec.path, results_dir) as tmp_env:
+        compiler_cache = CompilerCache.from_options(spec, **kwargs)
+        if compiler_cache is not None:
+            compiler_cache.zero_stats()
+        # build tree of a failed build is kept for an incremental rebuild
+        key = spec.spec.path if kwargs.get('app_kwargs', {}).get('incremental_rebuild') else None
+        if not kwargs.get('incremental'):
+            RpmbuildTemporaryEnvironment.discard_kept(spec.spec.path)
+        with RpmbuildTemporaryEnvironment(sources, patches, spec.spec.path, results_dir, key=key) as tmp_env:
             env = tmp_env.env()
             tmp_dir = tmp_env.path()
             tmp_results_dir = env.get(RpmbuildTemporaryEnvironment.TEMPDIR_RESULTS)
-            rpms, logs = cls._build_rpm(srpm, tmp_dir, tmp_results_dir, results_dir,
-                                        builder_options=cls.get_builder_options(**kwargs))
+            if tmp_env.reused:
+                logger.info("Packaging RPMs from the build tree of the previous build")
+            with BuildScheduler.job('{}-{}'.format(kwargs.get('name'), kwargs.get('version')), tmp_dir) as job:
+                try:
+                    rpms, logs = cls._build_rpm(srpm, tmp_dir, tmp_results_dir, results_dir,
+                                                builder_options=job.get_rpm_options() +
+                                                (cls.get_builder_options(**kwargs) or []),
+                                                compiler_cache=compiler_cache,
+                                                short_circuit_spec=env.get(RpmbuildTemporaryEnvironment.TEMPDIR_SPEC)
+                                                if tmp_env.reused else None)
+                except BinaryPackageBuildError:
+                    # packaging can be repeated only with complete buildroot
+                    if cls.failed_in_packaging(os.path.join(tmp_results_dir, 'build.log')):
+                        tmp_env.keep()
+                    else:
+                        logger.verbose("Build failed before packaging, its build tree can't be reused")
+                    raise
 
         logger.info("Building RPMs finished successfully")
 
@@ -126,4 +188,7 @@ class Rpmbuild(BuildToolBase):  # pylint: disable=abstract-method
         logger.verbose("Successfully built RPMs: '%s'", str(rpms))
         logger.verbose("logs: '%s'", str(logs))
 
-        return dict(rpm=rpms, logs=logs)
+        result = dict(rpm=rpms, logs=logs, resources=job.get_stats())
+        if compiler_cache is not None:
+            result['compiler_cache'] = compiler_cache.get_stats()
+        return result
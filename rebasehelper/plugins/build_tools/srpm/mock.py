@@ -22,14 +22,15 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import contextlib
 import logging
 import os
 from typing import cast
 
-from rebasehelper.plugins.build_tools import MockTemporaryEnvironment, check_mock_privileges
+from rebasehelper.plugins.build_tools import (BuildScheduler, MockRootCache, MockTemporaryEnvironment,
+                                              check_mock_privileges)
 from rebasehelper.plugins.build_tools.srpm import SRPMBuildToolBase
 from rebasehelper.exceptions import SourcePackageBuildError
-from rebasehelper.helpers.path_helper import PathHelper
 from rebasehelper.helpers.process_helper import ProcessHelper
 from rebasehelper.logger import CustomLogger
 
@@ -81,12 +82,11 @@ class Mock(SRPMBuildToolBase):
         build_log_path = os.path.join(srpm_results_dir, 'build.log')
         mock_log_path = os.path.join(srpm_results_dir, 'mock_output.log')
         root_log_path = os.path.join(srpm_results_dir, 'root.log')
-        logs = []
-        for log in PathHelper.find_all_files(results_dir, '*.log'):
-            logs.append(os.path.join(srpm_results_dir, os.path.basename(log)))
+        packages, logs = MockTemporaryEnvironment.find_artifacts(results_dir)
+        logs = [os.path.join(srpm_results_dir, os.path.basename(log)) for log in logs]
 
         if ret == 0:
-            return PathHelper.find_first_file(workdir, '*.src.rpm'), logs
+            return next((f for f in packages if f.endswith('.src.rpm')), None), logs
         if ret == 1:
             if not os.path.exists(build_log_path) and os.path.exists(mock_log_path):
                 logfile = mock_log_path
@@ -107,8 +107,12 @@ class Mock(SRPMBuildToolBase):
         """
         sources = spec.get_sources()
         patches = [p.path for p in spec.get_patches()]
-        with MockTemporaryEnvironment(sources, patches, spec.spec.path, results_dir) as tmp_env:
-            srpm_builder_options = cls.get_srpm_builder_options(**kwargs)
+        srpm_builder_options = cls.get_srpm_builder_options(**kwargs) or []
+        with contextlib.ExitStack() as stack:
+            if not kwargs.get('app_kwargs', {}).get('no_mock_root_reuse'):
+                srpm_builder_options = srpm_builder_options + stack.enter_context(
+                    MockRootCache.root(spec, srpm_builder_options))
+            tmp_env = stack.enter_context(MockTemporaryEnvironment(sources, patches, spec.spec.path, results_dir))
 
             env = tmp_env.env()
             tmp_dir = tmp_env.path()
@@ -116,8 +120,11 @@ class Mock(SRPMBuildToolBase):
             tmp_results_dir = env.get(
                 MockTemporaryEnvironment.TEMPDIR_RESULTS)
 
-            srpm, logs = cls._build_srpm(tmp_spec, tmp_dir, tmp_results_dir, results_dir,
-                                         srpm_builder_options=srpm_builder_options)
+            # building SRPM doesn't compile anything
+            with BuildScheduler.job('{}-{}.src'.format(kwargs.get('name'), kwargs.get('version')),
+                                    MockRootCache.get_basedir(tmp_dir), max_cpus=1):
+                srpm, logs = cls._build_srpm(tmp_spec, tmp_dir, tmp_results_dir, results_dir,
+                                             srpm_builder_options=srpm_builder_options)
 
         logger.info("Building SRPM finished successfully")
 
@@ -27,9 +27,8 @@ import os
 from typing import cast
 
 from rebasehelper.logger import CustomLogger
-from rebasehelper.plugins.build_tools import RpmbuildTemporaryEnvironment
+from rebasehelper.plugins.build_tools import BuildScheduler, RpmbuildTemporaryEnvironment
 from rebasehelper.plugins.build_tools.srpm import SRPMBuildToolBase
-from rebasehelper.helpers.path_helper import PathHelper
 from rebasehelper.helpers.process_helper import ProcessHelper
 from rebasehelper.exceptions import SourcePackageBuildError
 
@@ -74,12 +73,13 @@ class Rpmbuild(SRPMBuildToolBase):
                                                    output_file=output)
 
         build_log_path = os.path.join(srpm_results_dir, 'build.log')
-        logs = []
-        for l in PathHelper.find_all_files(results_dir, '*.log'):
-            logs.append(os.path.join(srpm_results_dir, os.path.basename(l)))
+        # rpmbuild places packages into its topdir in HOME
+        packages, logs = RpmbuildTemporaryEnvironment.find_artifacts(results_dir,
+                                                                     os.path.join(workdir, 'rpmbuild', 'SRPMS'))
+        logs = [os.path.join(srpm_results_dir, os.path.basename(l)) for l in logs]
 
         if ret == 0:
-            return PathHelper.find_first_file(workdir, '*.src.rpm'), logs
+            return next((f for f in packages if f.endswith('.src.rpm')), None), logs
         # An error occurred, raise an exception
         raise SourcePackageBuildError("Building SRPM failed!", logfile=build_log_path, logs=logs)
 
@@ -103,8 +103,11 @@ class Rpmbuild(SRPMBuildToolBase):
             tmp_results_dir = env.get(
                 RpmbuildTemporaryEnvironment.TEMPDIR_RESULTS)
 
-            srpm, logs = cls._build_srpm(tmp_spec, tmp_dir, tmp_results_dir, results_dir,
-                                         srpm_builder_options=srpm_builder_options)
+            # building SRPM doesn't compile anything
+            with BuildScheduler.job('{}-{}.src'.format(kwargs.get('name'), kwargs.get('version')), tmp_dir,
+                                    max_cpus=1):
+                srpm, logs = cls._build_srpm(tmp_spec, tmp_dir, tmp_results_dir, results_dir,
+                                             srpm_builder_options=srpm_builder_options)
 
         logger.info("Building SRPM finished successfully")
 
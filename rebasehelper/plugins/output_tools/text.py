@@ -100,6 +100,20 @@ class Text(BaseOutputTool):
                                                                 symbols.get(patch_type, ' ')))
         logger_report.info('\n'.join(sorted(patches_out)))
 
+    @classmethod
+    def print_conflict_strategy(cls, conflict_strategy):
+        """Outputs the automatically chosen conflict strategy and statistics of all tried strategies.
+
+        Args:
+            conflict_strategy: Dictionary with the chosen strategy and per-strategy statistics.
+
+        """
+        cls.print_message_and_separator("\nConflict strategy")
+        logger_report.info("Chosen strategy: %s", conflict_strategy['chosen'])
+        for strategy, stats in sorted(conflict_strategy['trials'].items()):
+            logger_report.info(' * {0:12} inapplicable: {1}, modified: {2} ({3} bytes), deleted: {4}'.format(
+                strategy, stats['inapplicable'], stats['modified'], stats['modified_size'], stats['deleted']))
+
     @classmethod
     def print_rpms_and_logs(cls, rpms, version):
         """Outputs information about location of RPMs and logs created during rebase.
@@ -140,6 +154,13 @@ class Text(BaseOutputTool):
                     logger_report.info(" - %s", os.path.basename(pkg))
                 # Print RPMs logs
                 cls.print_build_logs(rpms, dirname)
+                stats = rpms.get('compiler_cache')
+                if stats:
+                    logger_report.info("\nCompiler cache: %d hits, %d misses", stats['hits'], stats['misses'])
+                resources = rpms.get('resources')
+                if resources:
+                    logger_report.info("\nBuilt using %d CPUs in %.1f s after waiting %.1f s for resources",
+                                       resources['cpus'], resources['run_time'], resources['wait_time'])
 
     @classmethod
     def print_build_logs(cls, rpms, dirpath):
@@ -190,6 +211,9 @@ class Text(BaseOutputTool):
         if results.get_patches():
             cls.print_patches(results.get_patches())
 
+        if results.get_conflict_strategy():
+            cls.print_conflict_strategy(results.get_conflict_strategy())
+
         cls.print_message_and_separator("\nRPMS")
         for pkg_version in ['old', 'new']:
             pkg_results = results.get_build(pkg_version)
@@ -23,7 +23,9 @@
 #          František Nečas <fifinecas@seznam.cz>
 
 import logging
-from typing import cast
+from typing import Callable, List, Optional, cast
+
+from specfile.sections import Section
 
 from rebasehelper.logger import CustomLogger
 from rebasehelper.plugins.plugin import Plugin
@@ -51,6 +53,102 @@ class BaseSpecHook(Plugin):
         raise NotImplementedError()
 
 
+class LineTransformer:
+
+    """Class represents a transformation of lines of a spec file"""
+
+    def __init__(self, transform: Callable[[str, Section], str],
+                 section_filter: Optional[Callable[[Section], bool]] = None):
+        """Constructs a line transformer.
+
+        Args:
+            transform: Function taking a line and the section containing it
+              and returning the transformed line.
+            section_filter: Function determining if lines of a section should be
+              transformed. All sections are transformed if not specified.
+
+        """
+        self.transform = transform
+        self.section_filter = section_filter
+
+    @staticmethod
+    def apply(rebase_spec_file, transformers: List['LineTransformer']) -> None:
+        """Applies line transformations in a single pass over a spec file and saves it.
+
+        Args:
+            rebase_spec_file (rebasehelper.specfile.SpecFile): SpecFile object to transform.
+            transformers: Transformations to apply, in order.
+
+        """
+        if not transformers:
+            return
+        with rebase_spec_file.spec.sections() as sections:
+            for section in sections:
+                section_transformers = [
+                    t for t in transformers
+                    if t.section_filter is None or t.section_filter(section)
+                ]
+                if not section_transformers:
+                    continue
+                for index, line in enumerate(section):
+                    new_line = line
+                    for transformer in section_transformers:
+                        new_line = transformer.transform(new_line, section)
+                    if new_line != line:
+                        section[index] = new_line
+        rebase_spec_file.save()
+
+
+class LineSpecHook(BaseSpecHook):
+    """Base class for a spec hook transforming individual lines of a spec file
+
+    When run by SpecHookCollection, transformations of consecutive line spec hooks
+    are applied together in a single pass, in place of the first of them, so that
+    hooks run later see the transformed content.
+    """
+
+    @classmethod
+    def prepare(cls, spec_file, rebase_spec_file, **kwargs):
+        """Makes changes that can't be expressed as line transformations.
+
+        Args:
+            spec_file (rebasehelper.specfile.SpecFile): Original SpecFile object.
+            rebase_spec_file (rebasehelper.specfile.SpecFile): Rebased SpecFile object.
+            **kwargs: Keyword arguments from Application instance.
+
+        """
+
+    @classmethod
+    def has_preparation(cls) -> bool:
+        """Checks whether the spec hook makes changes outside of line transformations.
+
+        Returns:
+            True if prepare() is overridden.
+
+        """
+        return cls.prepare.__func__ is not LineSpecHook.prepare.__func__  # type: ignore[attr-defined]
+
+    @classmethod
+    def get_line_transformers(cls, spec_file, rebase_spec_file, **kwargs) -> List[LineTransformer]:
+        """Gets transformations of lines of the rebased spec file.
+
+        Args:
+            spec_file (rebasehelper.specfile.SpecFile): Original SpecFile object.
+            rebase_spec_file (rebasehelper.specfile.SpecFile): Rebased SpecFile object.
+            **kwargs: Keyword arguments from Application instance.
+
+        Returns:
+            List of line transformers.
+
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def run(cls, spec_file, rebase_spec_file, **kwargs):
+        cls.prepare(spec_file, rebase_spec_file, **kwargs)
+        LineTransformer.apply(rebase_spec_file, cls.get_line_transformers(spec_file, rebase_spec_file, **kwargs))
+
+
 class SpecHookCollection(PluginCollection):
     """
     Class representing the process of running various spec file hooks.
@@ -59,6 +157,11 @@ class SpecHookCollection(PluginCollection):
     def run(self, spec_file, rebase_spec_file, **kwargs):
         """Runs all non-blacklisted spec hooks.
 
+        All hooks run in a single transaction, so the rebased spec file
+        is written only once. Line transformations of consecutive line spec hooks
+        are applied in a single pass, which is performed before any other change
+        made by a subsequent hook, so the order of the hooks is preserved.
+
         Args:
             spec_file (rebasehelper.specfile.SpecFile): Original SpecFile object.
             rebase_spec_file (rebasehelper.specfile.SpecFile): Rebased SpecFile object.
@@ -67,10 +170,22 @@ class SpecHookCollection(PluginCollection):
         """
         blacklist = kwargs.get("spec_hook_blacklist", [])
 
-        for name, spec_hook in self.plugins.items():
-            if not spec_hook or name in blacklist:
-                continue
-            categories = spec_hook.CATEGORIES
-            if not categories or spec_file.category in categories:
-                logger.info("Running '%s' spec hook", name)
-                spec_hook.run(spec_file, rebase_spec_file, **kwargs)
+        transformers: List[LineTransformer] = []
+        with rebase_spec_file.transaction():
+            for name, spec_hook in self.plugins.items():
+                if not spec_hook or name in blacklist:
+                    continue
+                categories = spec_hook.CATEGORIES
+                if not categories or spec_file.category in categories:
+                    logger.info("Running '%s' spec hook", name)
+                    if issubclass(spec_hook, LineSpecHook):
+                        if spec_hook.has_preparation():
+                            LineTransformer.apply(rebase_spec_file, transformers)
+                            transformers = []
+                            spec_hook.prepare(spec_file, rebase_spec_file, **kwargs)
+                        transformers.extend(spec_hook.get_line_transformers(spec_file, rebase_spec_file, **kwargs))
+                    else:
+                        LineTransformer.apply(rebase_spec_file, transformers)
+                        transformers = []
+                        spec_hook.run(spec_file, rebase_spec_file, **kwargs)
+            LineTransformer.apply(rebase_spec_file, transformers)
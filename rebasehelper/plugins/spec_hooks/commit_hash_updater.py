@@ -22,13 +22,22 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import concurrent.futures
+import hashlib
+import json
 import logging
+import os
 import re
-from typing import cast
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple, cast
 
+import requests
+
+from rebasehelper.constants import ENCODING
 from rebasehelper.logger import CustomLogger
 from rebasehelper.plugins.spec_hooks import BaseSpecHook
 from rebasehelper.helpers.download_helper import DownloadHelper
+from rebasehelper.helpers.path_helper import PathHelper
 
 
 logger: CustomLogger = cast(CustomLogger, logging.getLogger(__name__))
@@ -37,78 +46,137 @@ logger: CustomLogger = cast(CustomLogger, logging.getLogger(__name__))
 class CommitHashUpdater(BaseSpecHook):
     """Tries to update commit hash present in Source0 tag according to the new version"""
 
+    # maximum number of pages of API results to go through
+    MAX_PAGES: int = 10
+
+    @staticmethod
+    def _get_cache_path(url: str) -> str:
+        return os.path.join(PathHelper.get_cache_dir('github'),
+                            '{}.json'.format(hashlib.sha256(url.encode(ENCODING)).hexdigest()))
+
+    @classmethod
+    def _get_page(cls, session: requests.Session, url: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Gets a page of Github API results.
+
+        Responses are cached on disk and revalidated using ETag, conditional
+        requests answered with 304 don't count against the rate limit.
+
+        Args:
+            session: Session to use.
+            url: URL of the page.
+
+        Returns:
+            Tuple containing the results and URL of the next page, if any.
+
+        """
+        cache_path = cls._get_cache_path(url)
+        cached = None
+        try:
+            with open(cache_path, encoding=ENCODING) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            pass
+        headers = {'If-None-Match': cached['etag']} if cached else {}
+        r = DownloadHelper.request(url, session=session, headers=headers)
+        if r is None:
+            return [], None
+        if r.status_code == 304 and cached:
+            return cached['data'], cached['next']
+        if not r.ok:
+            if r.status_code == 403 and r.headers.get('X-RateLimit-Remaining') == '0':
+                logger.warning("Rate limit exceeded on Github API! Try again later.")
+            return [], None
+        data = r.json()
+        next_url = r.links.get('next', {}).get('url')
+        if r.headers.get('ETag'):
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                with tempfile.NamedTemporaryFile('w', encoding=ENCODING, dir=os.path.dirname(cache_path),
+                                                 delete=False) as f:
+                    json.dump(dict(etag=r.headers['ETag'], data=data, next=next_url), f)
+                os.replace(f.name, cache_path)
+            except OSError as e:
+                logger.debug('Failed to cache Github API response: %s', str(e))
+        return data, next_url
+
     @classmethod
-    def _get_commit_hash_from_github(cls, spec_file):
+    def _get_commit_hashes_from_github(cls, spec_file, versions: List[str]) -> Dict[str, str]:
         """
-        Tries to find a commit using Github API
+        Tries to find commits matching versions using Github API
 
         :param spec_file: SPEC file to base the search on
-        :return: SHA of a commit, or None
+        :param versions: versions to find commits for
+        :return: dict of SHAs of found commits by version
         """
         m = re.match(
             r'^https?://github\.com/(?P<owner>[\w-]+)/(?P<project>[\w-]+)/.*$',
             spec_file.get_raw_main_source(),
         )
         if not m:
-            return None
+            return {}
         baseurl = 'https://api.github.com/repos/{owner}/{project}'.format(**m.groupdict())
-        # try to get tag name from a release matching version
-        r = DownloadHelper.request('{}/releases'.format(baseurl))
-        if r is None:
-            return None
-
-        if not r.ok:
-            if r.status_code == 403 and r.headers.get('X-RateLimit-Remaining') == '0':
-                logger.warning("Rate limit exceeded on Github API! Try again later.")
-            return None
-        data = r.json()
-        version = spec_file.spec.expanded_version
-        tag_name = None
-        for release in data:
-            if version in release.get('name', ''):
-                tag_name = release.get('tag_name')
-                break
-
-        r = DownloadHelper.request('{}/tags'.format(baseurl))
-        if r is None:
-            return None
-        if not r.ok:
-            if r.status_code == 403 and r.headers.get('X-RateLimit-Remaining') == '0':
-                logger.warning("Rate limit exceeded on Github API! Try again later.")
-            return None
-        data = r.json()
-        for tag in data:
-            name = tag.get('name')
-            if tag_name:
-                if name != tag_name:
-                    continue
-            else:
-                # no specific tag name, try common tag names
-                if name not in [version, 'v{}'.format(version)]:
-                    continue
-            commit = tag.get('commit')
-            if commit:
-                return commit.get('sha')
-        return None
+        with requests.Session() as session:
+            # get the first pages of releases and tags at once
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                releases_page, tags_page = executor.map(
+                    lambda u: cls._get_page(session, u),
+                    ['{}/releases?per_page=100'.format(baseurl), '{}/tags?per_page=100'.format(baseurl)],
+                )
+            # try to get tag names from releases matching versions
+            tag_names: Dict[str, str] = {}
+            releases, next_url = releases_page
+            for page in range(cls.MAX_PAGES):
+                for release in releases:
+                    for version in versions:
+                        if version not in tag_names and version in (release.get('name') or ''):
+                            tag_names[version] = release.get('tag_name')
+                if len(tag_names) == len(versions) or not next_url or page == cls.MAX_PAGES - 1:
+                    break
+                releases, next_url = cls._get_page(session, next_url)
+            result: Dict[str, str] = {}
+            tags, next_url = tags_page
+            for page in range(cls.MAX_PAGES):
+                for tag in tags:
+                    name = tag.get('name')
+                    commit = tag.get('commit')
+                    for version in versions:
+                        if version in result:
+                            continue
+                        if tag_names.get(version):
+                            if name != tag_names[version]:
+                                continue
+                        else:
+                            # no specific tag name, try common tag names
+                            if name not in [version, 'v{}'.format(version)]:
+                                continue
+                        if commit:
+                            result[version] = commit.get('sha')
+                if len(result) == len(versions) or not next_url or page == cls.MAX_PAGES - 1:
+                    break
+                tags, next_url = cls._get_page(session, next_url)
+        return result
 
     @classmethod
-    def _get_commit_hash(cls, spec_file):
+    def _get_commit_hashes(cls, spec_file, versions: List[str]) -> Dict[str, str]:
         if 'github.com' in spec_file.get_raw_main_source():
-            return cls._get_commit_hash_from_github(spec_file)
-        return None
+            return cls._get_commit_hashes_from_github(spec_file, versions)
+        return {}
 
     @classmethod
     def run(cls, spec_file, rebase_spec_file, **kwargs):
         if rebase_spec_file.get_raw_main_source() != spec_file.get_raw_main_source():
             # nothing to do
             return
-        # try to determine commit hash matching the new version
-        new_commit = cls._get_commit_hash(rebase_spec_file)
+        # try to determine commit hashes matching the new and the old version,
+        # the main source is the same, so both can be looked up at once
+        new_version = rebase_spec_file.spec.expanded_version
+        old_version = spec_file.spec.expanded_version
+        commits = cls._get_commit_hashes(rebase_spec_file, [new_version, old_version])
+        new_commit = commits.get(new_version)
         if not new_commit:
             return
         value = original_value = rebase_spec_file.get_raw_main_source()
-        # try to determine commit hash matching the old version
-        old_commit = cls._get_commit_hash(spec_file)
+        old_commit = commits.get(old_version)
         if old_commit:
             # replace old commit hash with the new one
             value = value.replace(old_commit, new_commit)
@@ -23,18 +23,20 @@
 #          František Nečas <fifinecas@seznam.cz>
 
 import re
+from typing import Pattern
 
-from rebasehelper.plugins.spec_hooks import BaseSpecHook
+from rebasehelper.plugins.spec_hooks import LineSpecHook, LineTransformer
 
 
-class EscapeMacros(BaseSpecHook):
+class EscapeMacros(LineSpecHook):
     """Spec hook escaping RPM macros in comments."""
 
+    MACRO_RE: Pattern[str] = re.compile(r'(?<!%)(%(?P<brace>{\??)?\w+(?(brace)}))')
+
     @classmethod
-    def run(cls, spec_file, rebase_spec_file, **kwargs):
-        with rebase_spec_file.spec.sections() as sections:
-            for section in sections:
-                for index, line in enumerate(section):
-                    start, end = spec_file.get_comment_span(line, section.is_script)
-                    new_comment = re.sub(r'(?<!%)(%(?P<brace>{\??)?\w+(?(brace)}))', r'%\1', line[start:end])
-                    section[index] = line[:start] + new_comment
+    def get_line_transformers(cls, spec_file, rebase_spec_file, **kwargs):
+        def transform(line, section):
+            start, end = spec_file.get_comment_span(line, section.is_script)
+            new_comment = cls.MACRO_RE.sub(r'%\1', line[start:end])
+            return line[:start] + new_comment
+        return [LineTransformer(transform)]
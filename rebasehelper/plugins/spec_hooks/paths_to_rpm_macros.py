@@ -22,19 +22,17 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
-from rebasehelper.plugins.spec_hooks import BaseSpecHook
+from rebasehelper.plugins.spec_hooks import LineSpecHook, LineTransformer
 
 
-class PathsToRPMMacros(BaseSpecHook):
+class PathsToRPMMacros(LineSpecHook):
     """SpecHook for replacing paths to files with RPM macros."""
 
     @classmethod
-    def run(cls, spec_file, rebase_spec_file, **kwargs):
-        with rebase_spec_file.spec.sections() as sections:
-            for section in sections:
-                if not section.normalized_id.startswith('files'):
-                    continue
-                for index, line in enumerate(section):
-                    new_path = rebase_spec_file.substitute_path_with_macros(line)
-                    section[index] = new_path
-        rebase_spec_file.save()
+    def get_line_transformers(cls, spec_file, rebase_spec_file, **kwargs):
+        return [
+            LineTransformer(
+                lambda line, _: rebase_spec_file.substitute_path_with_macros(line),
+                lambda section: section.normalized_id.startswith('files'),
+            )
+        ]
@@ -23,17 +23,20 @@
 #          František Nečas <fifinecas@seznam.cz>
 
 import re
+import urllib.parse
 from typing import Any, List, Pattern, Tuple
 
-from specfile.sources import TagSource
+from specfile.constants import TAG_NAMES
+from specfile.tags import get_tag_name_regex
+from specfile.utils import split_conditional_macro_expansion
 
 from rebasehelper.exceptions import RebaseHelperError
 from rebasehelper.types import Options
-from rebasehelper.plugins.spec_hooks import BaseSpecHook
+from rebasehelper.plugins.spec_hooks import LineSpecHook, LineTransformer
 from rebasehelper.specfile import SpecFile
 
 
-class ReplaceOldVersion(BaseSpecHook):
+class ReplaceOldVersion(LineSpecHook):
     """SpecHook for replacing occurrences of old version string."""
 
     OPTIONS: Options = [
@@ -61,6 +64,12 @@ class ReplaceOldVersion(BaseSpecHook):
         'Version',
     ]
 
+    # matches a tag definition the same way as specfile does
+    TAG_RE: Pattern[str] = re.compile(
+        r'^(?P<name>{})\s*:\s*(?P<value>.+)$'.format('|'.join(get_tag_name_regex(t) for t in TAG_NAMES)),
+        re.IGNORECASE,
+    )
+
     @classmethod
     def _create_possible_replacements(cls, spec_file: SpecFile, rebase_spec_file: SpecFile,
                                       use_macro: bool) -> List[Tuple[Pattern[str], str]]:
@@ -111,39 +120,45 @@ class ReplaceOldVersion(BaseSpecHook):
         return res
 
     @classmethod
-    def run(cls, spec_file: SpecFile, rebase_spec_file: SpecFile, **kwargs: Any):
+    def get_line_transformers(cls, spec_file: SpecFile, rebase_spec_file: SpecFile, **kwargs: Any):
         replace_with_macro = bool(kwargs.get('replace_old_version_with_macro'))
-
         subversion_patterns = cls._create_possible_replacements(spec_file, rebase_spec_file, replace_with_macro)
-        with rebase_spec_file.spec.sections() as sections:
-            for section in sections:
-                if section.normalized_id.startswith('changelog'):
-                    continue
-                elif section.normalized_id.startswith('package'):
-                    with rebase_spec_file.spec.tags(section) as tags:
-                        for tag in tags:
-                            for index, line in enumerate(tag.comments._preceding_lines): # pylint: disable=protected-access
-                                start, end = spec_file.get_comment_span(line, section.is_script)
-                                updated_line = subversion_patterns[0][0].sub(subversion_patterns[0][1], line[:start])
-                                tag.comments._preceding_lines[index] = updated_line + line[start:end] # pylint: disable=protected-access
-                            if not tag.value or tag.normalized_name in cls.IGNORED_TAGS:
-                                continue
-                            if (
-                                tag.normalized_name.startswith("Source")
-                                or tag.normalized_name.startswith("Patch")
-                            ) and not TagSource(tag).remote:
-                                # skip local sources
-                                continue
-                            # replace the whole version first
-                            updated_value = subversion_patterns[0][0].sub(subversion_patterns[0][1], tag.value)
-                            # replace subversions only for remote sources/patches
-                            if tag.normalized_name.startswith('Source') or tag.normalized_name.startswith('Patch'):
-                                for sub_pattern, repl in subversion_patterns[1:]:
-                                    updated_value = sub_pattern.sub(repl, updated_value)
-                            tag.value = updated_value
-                    continue
-                for index, line in enumerate(section):
-                    start, end = spec_file.get_comment_span(line, section.is_script)
-                    updated_line = subversion_patterns[0][0].sub(subversion_patterns[0][1], line[:start])
-                    section[index] = updated_line + line[start:end]
-            rebase_spec_file.save()
+        pattern, replacement = subversion_patterns[0]
+
+        def transform(line, section):
+            start, end = spec_file.get_comment_span(line, section.is_script)
+            return pattern.sub(replacement, line[:start]) + line[start:end]
+
+        def transform_tag(line, section):
+            stripped = line.rstrip()
+            body, prefix, suffix = split_conditional_macro_expansion(stripped)
+            m = cls.TAG_RE.match(body)
+            if not m:
+                return transform(line, section)
+            name, value = m.group('name').capitalize(), m.group('value')
+            if name in cls.IGNORED_TAGS:
+                return line
+            is_source = name.startswith(('Source', 'Patch'))
+            if is_source:
+                url = urllib.parse.urlsplit(rebase_spec_file.expand(value, value))
+                if not all((url.scheme, url.netloc)):
+                    # skip local sources
+                    return line
+            # replace the whole version first
+            value = pattern.sub(replacement, value)
+            # replace subversions only for remote sources/patches
+            if is_source:
+                for sub_pattern, repl in subversion_patterns[1:]:
+                    value = sub_pattern.sub(repl, value)
+            return prefix + body[:m.start('value')] + value + suffix + line[len(stripped):]
+
+        return [
+            LineTransformer(
+                transform_tag,
+                lambda section: section.normalized_id.startswith('package'),
+            ),
+            LineTransformer(
+                transform,
+                lambda section: not section.normalized_id.startswith(('changelog', 'package')),
+            ),
+        ]
@@ -22,9 +22,13 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import concurrent.futures
+import hashlib
 import logging
 import os
 import re
+import shutil
+import tempfile
 from typing import cast
 
 from rebasehelper.constants import ENCODING
@@ -33,6 +37,7 @@ from rebasehelper.plugins.spec_hooks import BaseSpecHook
 from rebasehelper.temporary_environment import TemporaryEnvironment
 from rebasehelper.types import PackageCategories
 from rebasehelper.specfile import PackageCategory
+from rebasehelper.helpers.path_helper import PathHelper
 from rebasehelper.helpers.process_helper import ProcessHelper
 
 
@@ -43,6 +48,9 @@ class RubyHelper(BaseSpecHook):
 
     CATEGORIES: PackageCategories = [PackageCategory.ruby]
 
+    # maximum number of sources created simultaneously
+    MAX_WORKERS: int = 4
+
     @classmethod
     def _get_instructions(cls, spec, comments, old_version, new_version):
         """Extract instructions from comments, update version if necessary"""
@@ -54,9 +62,20 @@ class RubyHelper(BaseSpecHook):
             instructions.append(comment)
         return instructions
 
+    @classmethod
+    def _get_cache_path(cls, instructions, source):
+        """Get path to a cached source created by the same instructions"""
+        key = hashlib.sha256('\n'.join(instructions).encode(ENCODING)).hexdigest()
+        return os.path.join(PathHelper.get_cache_dir('ruby-helper', key), os.path.basename(source))
+
     @classmethod
     def _build_source_from_instructions(cls, instructions, source, logfile):
-        """Run instructions to create source archive"""
+        """Run instructions to create source archive, reuse cached one if available"""
+        cache_path = cls._get_cache_path(instructions, source)
+        if os.path.isfile(cache_path):
+            logger.info("Using source '%s' created previously by the same instructions", source)
+            shutil.copy(cache_path, source)
+            return
         logger.info("Attempting to create source '%s' using instructions in comments", source)
         with TemporaryEnvironment() as tmp:
             script = os.path.join(tmp.path(), 'script.sh')
@@ -68,6 +87,14 @@ class RubyHelper(BaseSpecHook):
             result = ProcessHelper.run_subprocess_cwd(script, tmp.path(), output_file=logfile, shell=True)
         if result == 0 and os.path.isfile(source):
             logger.info('Source creation succeeded.')
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_path), delete=False) as f:
+                    with open(source, 'rb') as src:
+                        shutil.copyfileobj(src, f)
+                os.replace(f.name, cache_path)
+            except OSError as e:
+                logger.debug("Failed to cache source '%s': %s", source, str(e))
         else:
             logger.info('Source creation failed.')
 
@@ -80,8 +107,10 @@ class RubyHelper(BaseSpecHook):
             if not s.remote
             and not (rebase_spec_file.spec.sourcedir / s.expanded_filename).is_file()
         ]
+        jobs = []
         for source in sources:
-            if next(s for s in spec_file.all_sources if s.number == source.number).location == source.location:
+            old_source = spec_file.get_corresponding_source(source)
+            if old_source and old_source.location == source.location:
                 # skip sources that stayed unchanged
                 continue
             logger.info("Found non-existent source '%s'", source.expanded_filename)
@@ -95,8 +124,8 @@ class RubyHelper(BaseSpecHook):
                 rebase_spec_file.spec.expanded_version,
             )
             logfile = os.path.join(kwargs['workspace_dir'], '{}.log'.format(source.expanded_filename))
-            cls._build_source_from_instructions(
-                instructions,
-                rebase_spec_file.spec.sourcedir / source.expanded_filename,
-                logfile,
-            )
+            jobs.append((instructions, rebase_spec_file.spec.sourcedir / source.expanded_filename, logfile))
+        # every source is created in its own environment, so the sources can be created simultaneously
+        with concurrent.futures.ThreadPoolExecutor(max_workers=cls.MAX_WORKERS) as executor:
+            for future in [executor.submit(cls._build_source_from_instructions, *job) for job in jobs]:
+                future.result()
@@ -23,28 +23,26 @@
 #          František Nečas <fifinecas@seznam.cz>
 
 import re
-from typing import List, Tuple
+from typing import List, Pattern, Tuple
 
-from rebasehelper.plugins.spec_hooks import BaseSpecHook
+from rebasehelper.plugins.spec_hooks import LineSpecHook, LineTransformer
 from rebasehelper.types import PackageCategories
 
 
-class TypoFix(BaseSpecHook):
+class TypoFix(LineSpecHook):
     """Sample spec hook that fixes typos in spec file"""
 
     CATEGORIES: PackageCategories = [None]
 
-    REPLACEMENTS: List[Tuple[str, str]] = [
-        ('chnagelog', 'changelog'),
-        ('indentional', 'intentional'),
+    REPLACEMENTS: List[Tuple[Pattern[str], str]] = [
+        (re.compile('chnagelog'), 'changelog'),
+        (re.compile('indentional'), 'intentional'),
     ]
 
     @classmethod
-    def run(cls, spec_file, rebase_spec_file, **kwargs):
-        with rebase_spec_file.spec.sections() as sections:
-            for section in sections:
-                for index, line in enumerate(section):
-                    for replacement in cls.REPLACEMENTS:
-                        line = re.sub(replacement[0], replacement[1], line)
-                    section[index] = line
-        rebase_spec_file.save()
+    def get_line_transformers(cls, spec_file, rebase_spec_file, **kwargs):
+        def transform(line, _):
+            for pattern, replacement in cls.REPLACEMENTS:
+                line = pattern.sub(replacement, line)
+            return line
+        return [LineTransformer(transform)]
@@ -35,6 +35,7 @@ class ResultsStore:
     RESULTS_BUILD_LOG_HOOKS: str = 'build_log_hooks'
     RESULTS_BUILDS: str = 'builds'
     RESULTS_PATCHES: str = 'patches'
+    RESULTS_CONFLICT_STRATEGY: str = 'conflict_strategy'
     RESULTS_CHANGES_PATCH: str = 'changes_patch'
     RESULTS_SUCCESS: str = 'result'
 
@@ -51,6 +52,7 @@ class ResultsStore:
                 self.RESULTS_BUILD_LOG_HOOKS,
                 self.RESULTS_BUILDS,
                 self.RESULTS_PATCHES,
+                self.RESULTS_CONFLICT_STRATEGY,
                 self.RESULTS_CHANGES_PATCH,
                 self.RESULTS_SUCCESS
         ):
@@ -69,6 +71,9 @@ class ResultsStore:
     def set_patches_results(self, results_dict):
         self.set_results(self.RESULTS_PATCHES, results_dict)
 
+    def set_conflict_strategy_results(self, results_dict):
+        self.set_results(self.RESULTS_CONFLICT_STRATEGY, results_dict)
+
     def set_checker_output(self, text, data):
         self.set_results(self.RESULTS_CHECKERS, {text: data})
 
@@ -103,6 +108,9 @@ class ResultsStore:
     def get_patches(self):
         return self._data_store.get(self.RESULTS_PATCHES, None)
 
+    def get_conflict_strategy(self):
+        return self._data_store.get(self.RESULTS_CONFLICT_STRATEGY, None)
+
     def get_checkers(self):
         return self._data_store.get(self.RESULTS_CHECKERS, {})
 
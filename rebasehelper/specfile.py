@@ -23,31 +23,35 @@
 #          František Nečas <fifinecas@seznam.cz>
 
 import argparse
+import collections
+import contextlib
+import copy
 import enum
+import hashlib
 import itertools
 import logging
 import os
 import re
 import shlex
 import shutil
-from typing import Callable, List, Optional, Pattern, Tuple, Dict, cast
+from typing import Any, Callable, Iterator, List, Optional, Pattern, Set, Tuple, Dict, Union, cast
 
 from specfile import Specfile
 from specfile.exceptions import RPMException
 from specfile.macros import MacroLevel
 from specfile.prep import PatchMacro
 from specfile.sections import Section
-from specfile.sources import Source, ListSource, TagSource
+from specfile.sources import Patch, Source, ListSource, TagSource
 
 from rebasehelper import constants
 from rebasehelper.archive import Archive
-from rebasehelper.exceptions import RebaseHelperError, DownloadError, ParseError, LookasideCacheError
+from rebasehelper.exceptions import RebaseHelperError, ParseError, LookasideCacheError
 from rebasehelper.argument_parser import SilentArgumentParser
 from rebasehelper.logger import CustomLogger
 from rebasehelper.helpers.download_helper import DownloadHelper
 from rebasehelper.helpers.git_helper import GitHelper
 from rebasehelper.helpers.lookaside_cache_helper import LookasideCacheHelper
-from rebasehelper.helpers.rpm_helper import RpmHeader
+from rebasehelper.helpers.rpm_helper import RpmHeader, RpmHelper
 
 
 MACROS_WHITELIST: List[str] = [
@@ -96,6 +100,95 @@ class PatchObject:
         return os.path.basename(self.path)
 
 
+class MacroTrie:
+
+    """Class represents a trie of expanded macro bodies for substitution of macros"""
+
+    def __init__(self, macros):
+        """Constructs a trie.
+
+        Macros with longer bodies take precedence, macros with bodies
+        of the same length take precedence in the specified order.
+
+        Args:
+            macros: List of (name, expanded body) tuples. If more macros have
+              the same body, the first one takes precedence.
+
+        """
+        self.root: Dict[str, Any] = {}
+        ranked = sorted((m for m in macros if m[1]), key=lambda m: len(m[1]), reverse=True)
+        for rank, (name, body) in enumerate(ranked):
+            node = self.root
+            for c in body:
+                node = node.setdefault(c, {})
+            # empty string can't be a character of a body, use it to mark the end
+            node.setdefault('', (rank, name))
+
+    def substitute(self, path: str) -> str:
+        """Substitutes macro bodies with the macros.
+
+        The result is the same as replacing all occurrences of each body in order
+        of precedence, but the path is scanned only once. Occurrences overlapping
+        an already substituted body of a macro taking precedence are left intact.
+
+        Args:
+            path: Path to be changed.
+
+        Returns:
+            Path expressed using macros.
+
+        """
+        matches = []
+        for i in range(len(path)):
+            node = self.root
+            j = i
+            while j < len(path) and path[j] in node:
+                node = node[path[j]]
+                j += 1
+                if '' in node:
+                    rank, name = node['']
+                    matches.append((rank, i, j, name))
+        if not matches:
+            return path
+        taken = [False] * len(path)
+        substitutions = []
+        for _, i, j, name in sorted(matches):
+            if not any(taken[i:j]):
+                taken[i:j] = [True] * (j - i)
+                substitutions.append((i, j, name))
+        result = []
+        end = 0
+        for i, j, name in sorted(substitutions):
+            result.append(path[end:i])
+            result.append('%{{{}}}'.format(name))
+            end = j
+        result.append(path[end:])
+        return ''.join(result)
+
+
+class PrepCommand:
+
+    """Class represents a single command of a logical line of %prep section"""
+
+    def __init__(self, name, args, basedir):
+        self.name = name
+        self.args = args
+        # absolute path to the directory the command is run in
+        self.basedir = basedir
+
+
+class PrepLine:
+
+    """Class represents a tokenized logical line of %prep section"""
+
+    def __init__(self, line, tokens, commands):
+        self.line = line
+        # None if the line could not be tokenized
+        self.tokens = tokens
+        # commands separated by pipes
+        self.commands = commands
+
+
 class PackageCategory(enum.Enum):
     python: Pattern[str] = re.compile(r'^python[23]?-')
     perl: Pattern[str] = re.compile(r'^perl-')
@@ -107,6 +200,13 @@ class PackageCategory(enum.Enum):
     rust: Pattern[str] = re.compile(r'^rust-')
 
 
+# matches a name against all package categories at once,
+# the name of the matching group is the name of the category
+PACKAGE_CATEGORY_MATCHER: Pattern[str] = re.compile('|'.join(
+    '(?P<{}>{})'.format(category.name, category.value.pattern) for category in PackageCategory
+))
+
+
 def saves(func):
     """Decorator for saving the SpecFile after a method is run."""
     def wrapper(spec, *args, **kwargs):
@@ -119,21 +219,34 @@ def saves(func):
 class SpecFile:
     """Class representing a spec file."""
 
+    # derived data and kinds of sections of the spec file they depend on,
+    # None means the data depend on the content of the whole spec file
+    DERIVED_DATA_DEPENDENCIES: Dict[str, Optional[Tuple[str, ...]]] = {
+        'expansions': None,
+        'macro_tries': None,
+        'category': ('package',),
+        'build_requires': ('package',),
+        'sources': ('package', 'sourcelist', 'patchlist'),
+        'prep_section': ('package', 'prep'),
+        'prep_lines': ('package', 'prep'),
+        'patches': ('package', 'sourcelist', 'patchlist', 'prep'),
+    }
+
+    # categories of already processed spec files by hash of their content
+    _category_cache: Dict[str, Optional[PackageCategory]] = {}
+
+    # nesting level of transactions in progress
+    _transaction_depth: int = 0
+
     def __init__(self, path: str, sources_location: str = '', predefined_macros: Optional[Dict[str, str]] = None,
                  lookaside_cache_preset: str = 'fedpkg'):
         # Initialize attributes
         self.lookaside_cache_preset: str = lookaside_cache_preset
-        self.prep_section: str = ''
-        self.all_sources: List[Source] = []
-        self.sources: List[Source] = []
-        self.patches: Dict[str, List[PatchObject]] = {}
         self.removed_patches: List[str] = []
-        self.category: Optional[PackageCategory] = None
         self.spec = Specfile(path, sourcedir=sources_location, macros=list((predefined_macros or {}).items()))
-        self._update_data()
+        self._invalidate()
 
-    def download_remote_sources(self) -> None:
-        """Downloads sources specified as URL."""
+    def _download_from_lookaside_cache(self) -> None:
         try:
             # try to download old sources from Fedora lookaside cache
             LookasideCacheHelper.download(self.lookaside_cache_preset,
@@ -144,6 +257,8 @@ class SpecFile:
             logger.verbose("Downloading sources from lookaside cache failed. "
                            "Reason: %s.", str(e))
 
+    def _get_remote_sources_to_download(self) -> List[Tuple[str, str]]:
+        result = []
         for source in self.all_sources:
             if not source.remote:
                 continue
@@ -153,64 +268,307 @@ class SpecFile:
             target = self.spec.sourcedir / source.expanded_filename
             if not target.is_file():
                 logger.verbose("File '%s' doesn't exist locally, downloading it.", str(target))
-                try:
-                    DownloadHelper.download_file(source.expanded_location, target)
-                except DownloadError as e:
-                    raise RebaseHelperError("Failed to download file from URL {}. "
-                                            "Reason: '{}'. ".format(source.expanded_location, str(e))) from e
+                result.append((source.expanded_location, str(target)))
+        return result
+
+    def download_remote_sources(self) -> None:
+        """Downloads sources specified as URL."""
+        self.download_remote_sources_of([self])
+
+    @staticmethod
+    def download_remote_sources_of(spec_files: List['SpecFile'],
+                                   max_connections_per_host: int = DownloadHelper.MAX_CONNECTIONS_PER_HOST) -> None:
+        """Downloads sources specified as URL of multiple spec files at once.
+
+        Sources are first downloaded from lookaside cache, the remaining remote
+        sources and patches of all spec files are then downloaded concurrently.
+        The spec files are not updated, call update() to reparse them with
+        the sources present.
+
+        Args:
+            spec_files: SpecFile objects to download the sources of.
+            max_connections_per_host: Maximum number of simultaneous connections to a single host.
+
+        Raises:
+            RebaseHelperError: If any of the downloads failed.
+
+        """
+        lookaside_downloads = set()
+        for spec_file in spec_files:
+            # spec files sharing the same sources file and sources directory need to be processed only once
+            sources_file = os.path.join(os.path.dirname(spec_file.spec.path), 'sources')
+            try:
+                with open(sources_file, encoding=constants.ENCODING) as f:
+                    sources = f.read()
+            except OSError:
+                sources = None
+            key = (spec_file.lookaside_cache_preset, spec_file.spec.expanded_name, str(spec_file.spec.sourcedir), sources)
+            if key in lookaside_downloads:
+                continue
+            lookaside_downloads.add(key)
+            spec_file._download_from_lookaside_cache()  # pylint: disable=protected-access
+
+        downloads = [d for s in spec_files for d in s._get_remote_sources_to_download()]  # pylint: disable=protected-access
+        errors = DownloadHelper.download_files(downloads, max_connections_per_host)
+        for url, _ in downloads:
+            if url in errors:
+                raise RebaseHelperError("Failed to download file from URL {}. "
+                                        "Reason: '{}'. ".format(url, str(errors[url]))) from errors[url]
 
     def update(self) -> None:
+        """Reloads the spec file content and discards all derived data.
+
+        Raises:
+            RuntimeError: If called within a transaction, changes made within
+              the transaction would be silently lost.
+
+        """
+        if self._transaction_depth:
+            raise RuntimeError('Spec file cannot be reloaded within a transaction')
         self.spec.reload()
-        self._update_data()
+        self._invalidate()
+
+    def get_sections_snapshot(self) -> Dict[str, List[str]]:
+        """Gets a snapshot of the current content of all sections."""
+        snapshot: Dict[str, List[str]] = collections.defaultdict(list)
+        for section in self.spec.sections().content: # pylint: disable=no-member
+            snapshot[section.normalized_id].append(str(section))
+        return snapshot
+
+    def get_changed_sections(self, snapshot: Dict[str, List[str]]) -> Set[str]:
+        """Gets kinds of sections changed since the given snapshot was taken.
+
+        Args:
+            snapshot: Snapshot obtained by get_sections_snapshot().
+
+        Returns:
+            Names of changed sections without arguments, e.g. 'files'.
 
-    def _update_data(self):
         """
-        Function updates data from given SPEC file
+        return self._compare_snapshots(snapshot, self.get_sections_snapshot())
+
+    @staticmethod
+    def _compare_snapshots(old: Dict[str, List[str]], new: Dict[str, List[str]]) -> Set[str]:
+        return {
+            section_id.split()[0]
+            for section_id in set(old) | set(new)
+            if old.get(section_id) != new.get(section_id)
+        }
+
+    def _invalidate(self, full: bool = True) -> None:
+        """Marks data derived from the spec file content as outdated.
+
+        Outdated data are recomputed on the first access.
+
+        Args:
+            full: Whether to discard all derived data. If False, only the data
+              depending on sections changed since the last invalidation are discarded.
 
-        :return:
         """
+        snapshot = self.get_sections_snapshot()
+        if full:
+            self._derived: Dict[str, Any] = {}
+        else:
+            changed = self._compare_snapshots(self._sections_snapshot, snapshot)
+            for name, dependencies in self.DERIVED_DATA_DEPENDENCIES.items():
+                if changed and (dependencies is None or changed.intersection(dependencies)):
+                    self._derived.pop(name, None)
+        self._sections_snapshot = snapshot
+
+    def _get_derived(self, name: str, getter: Callable[[], Any]) -> Any:
+        if name not in self._derived:
+            self._derived[name] = getter()
+        return self._derived[name]
+
+    @property
+    def category(self) -> Optional[PackageCategory]:
+        """Category of the package guessed from names and provides of its packages."""
         def guess_category():
-            for pkg in self.spec.rpm_spec.packages:
-                header = RpmHeader(pkg.header)
-                for category in PackageCategory:
-                    if category.value.match(header.name):
-                        return category
-                    for provide in header.providename:
-                        if category.value.match(provide):
-                            return category
-            return None
-        self.category = guess_category()
-        self.prep_section = self.spec.rpm_spec.prep
-        self.main_source_number = self._identify_main_source(self.spec)
-        self.all_sources = [
-            s
-            for s in self.spec.sources().content + self.spec.patches().content # pylint: disable=no-member
-            if s.expanded_location is not None
-        ]
-        self.sources = [
-            s
-            for s in self.spec.sources().content # pylint: disable=no-member
-            if s.expanded_location is not None
-        ]
-        self.patches = self._get_initial_patches()
+            key = hashlib.sha256('{}\0{!r}'.format(self.spec, self.spec.macros).encode(constants.ENCODING)).hexdigest()
+            if key not in self._category_cache:
+                self._category_cache[key] = self._guess_category()
+            return self._category_cache[key]
+        return self._get_derived('category', guess_category)
+
+    def _guess_category(self) -> Optional[PackageCategory]:
+        categories = list(PackageCategory)
+        for pkg in self.spec.rpm_spec.packages:
+            header = RpmHeader(pkg.header)
+            # the first category in order of definition wins
+            matched = {
+                m.lastgroup
+                for m in map(PACKAGE_CATEGORY_MATCHER.match, [header.name] + header.providename)
+                if m
+            }
+            if matched:
+                return min((PackageCategory[c] for c in matched), key=categories.index)
+        return None
+
+    @property
+    def build_requires(self) -> List[str]:
+        """Sorted build dependencies of the package including version constraints."""
+        def get_build_requires():
+            header = RpmHeader(self.spec.rpm_spec.sourceHeader)
+            return sorted({
+                RpmHelper.format_dependency(*d)
+                for d in zip(header.requirename, header.requireflags, header.requireversion)
+            })
+        return self._get_derived('build_requires', get_build_requires)
+
+    @property
+    def prep_section(self) -> str:
+        """Expanded %prep section."""
+        return self._get_derived('prep_section', lambda: self.spec.rpm_spec.prep)
+
+    @property
+    def prep_lines(self) -> List[PrepLine]:
+        """Tokenized logical lines of expanded %prep section."""
+        return self._get_derived('prep_lines', self._get_prep_lines)
+
+    def _get_prep_lines(self) -> List[PrepLine]:
+        def tokenize(line):
+            try:
+                return shlex.split(line, comments=True)
+            except ValueError:
+                return None
+        # join lines split by backslash, ending with pipe or with unmatched quotation
+        logical_lines: List[Tuple[str, Optional[List[str]]]] = []
+        pending = None
+        for line in self.prep_section.split('\n') if self.prep_section else []:
+            if pending is not None:
+                if pending.rstrip().endswith('\\'):
+                    pending = pending[:-1] + line
+                    continue
+                if pending.rstrip().endswith('|'):
+                    pending += line
+                    continue
+                tokens = tokenize(pending)
+                if tokens is None:
+                    pending += line
+                    continue
+                logical_lines.append((pending, tokens))
+            pending = line
+        if pending is not None:
+            logical_lines.append((pending, tokenize(pending)))
+        cd_parser = SilentArgumentParser()
+        cd_parser.add_argument('dir', default=os.environ.get('HOME', ''))
+        # keep track of current directory
+        basedir = self.expand('%{_builddir}', '')
+        result = []
+        for line, tokens in logical_lines:
+            commands = []
+            # split tokens by pipe
+            for group in [list(g) for k, g in itertools.groupby(tokens or [], lambda t: t == '|') if not k]:
+                command = PrepCommand(os.path.basename(group[0]), group[1:], basedir)
+                if command.name == 'cd':
+                    try:
+                        ns, _ = cd_parser.parse_known_args(command.args)
+                    except ParseError:
+                        pass
+                    else:
+                        basedir = ns.dir if os.path.isabs(ns.dir) else os.path.join(basedir, ns.dir)
+                commands.append(command)
+            result.append(PrepLine(line, tokens, commands))
+        return result
+
+    def _get_sources_data(self) -> Dict[str, Any]:
+        sources = self.spec.sources().content # pylint: disable=no-member
+        patches = self.spec.patches().content # pylint: disable=no-member
+        source_index: Dict[int, Source] = {}
+        for source in sources:
+            source_index.setdefault(source.number, source)
+        patch_index: Dict[int, Source] = {}
+        patch_filename_index: Dict[str, List[Source]] = collections.defaultdict(list)
+        for patch in patches:
+            patch_index.setdefault(patch.number, patch)
+            if patch.expanded_filename:
+                patch_filename_index[patch.expanded_filename].append(patch)
+        return dict(
+            main_source_number=min(source_index, default=None),
+            all_sources=[s for s in sources + patches if s.expanded_location is not None],
+            sources=[s for s in sources if s.expanded_location is not None],
+            source_index=source_index,
+            patch_index=patch_index,
+            patch_filename_index=patch_filename_index,
+        )
+
+    @property
+    def _sources_data(self) -> Dict[str, Any]:
+        return self._get_derived('sources', self._get_sources_data)
+
+    @property
+    def main_source_number(self) -> Optional[int]:
+        return self._sources_data['main_source_number']
+
+    @property
+    def all_sources(self) -> List[Source]:
+        """All sources and patches with a valid location."""
+        return self._sources_data['all_sources']
+
+    @property
+    def sources(self) -> List[Source]:
+        """All sources with a valid location."""
+        return self._sources_data['sources']
+
+    @property
+    def patches(self) -> Dict[str, List[PatchObject]]:
+        """Applied and not applied patches."""
+        return self._get_derived('patches', self._get_initial_patches)
 
     ###########################
     # SOURCES RELATED METHODS #
     ###########################
 
-    @staticmethod
-    def _identify_main_source(spec: Specfile) -> Optional[int]:
-        # the lowest number is the main source
-        return min((s.number for s in spec.sources().content), default=None) # pylint: disable=no-member
+    def get_source_by_number(self, number: Optional[int]) -> Optional[Source]:
+        """Gets a source by its number.
+
+        Args:
+            number: Number of the source.
+
+        Returns:
+            Source object or None if there is no such source.
+
+        """
+        return self._sources_data['source_index'].get(number)
+
+    def get_patch_by_number(self, number: Optional[int]) -> Optional[Source]:
+        """Gets a patch by its number.
+
+        Args:
+            number: Number of the patch.
+
+        Returns:
+            Patch object or None if there is no such patch.
+
+        """
+        return self._sources_data['patch_index'].get(number)
+
+    def get_corresponding_source(self, source: Source) -> Optional[Source]:
+        """Gets a source or patch of the same kind and number as the given one.
+
+        Args:
+            source: Source or patch, typically from another spec file.
+
+        Returns:
+            Matching source or patch with a valid location or None if not found.
+
+        """
+        if isinstance(source, Patch):
+            result = self.get_patch_by_number(source.number)
+        else:
+            result = self.get_source_by_number(source.number)
+        if not result or result.expanded_location is None:
+            return None
+        return result
 
     def _get_raw_source_string(self, source_num: Optional[int]) -> Optional[str]:
-        source = next((s for s in self.spec.sources().content if s.number == source_num), None) # pylint: disable=no-member
+        source = self.get_source_by_number(source_num)
         if not source:
             return None
         return source.location
 
     def _get_source_filename(self, source_num: Optional[int]) -> Optional[str]:
-        source = next((s for s in self.spec.sources().content if s.number == source_num), None) # pylint: disable=no-member
+        source = self.get_source_by_number(source_num)
         if not source:
             return None
         return source.expanded_filename
@@ -245,6 +603,8 @@ class SpecFile:
         patches_applied = []
         patches_not_used = []
         strip_options = self._get_patch_strip_options()
+        patches = []
+        downloads = []
         for patch in self.spec.patches().content: # pylint: disable=no-member
             if not patch.expanded_filename:
                 continue
@@ -253,17 +613,19 @@ class SpecFile:
                 if patch.remote
                 else patch.expanded_location
             )
+            if not patch_path.exists() and patch.remote:
+                logger.info('Patch%s is remote, trying to download it', patch.number)
+                downloads.append((patch.expanded_location, str(patch_path)))
+            patches.append((patch, patch_path))
+        # download all missing remote patches at once
+        errors = DownloadHelper.download_files(downloads) if downloads else {}
+        for patch, patch_path in patches:
+            if patch.remote and patch.expanded_location in errors:
+                logger.error('Could not download remote patch %s', patch.expanded_location)
+                continue
             if not patch_path.exists():
-                if patch.remote:
-                    logger.info('Patch%s is remote, trying to download it', patch.number)
-                    try:
-                        DownloadHelper.download_file(patch.expanded_location, patch_path)
-                    except DownloadError:
-                        logger.error('Could not download remote patch %s', patch.expanded_location)
-                        continue
-                else:
-                    logger.error('Patch %s does not exist', patch.expanded_filename)
-                    continue
+                logger.error('Patch %s does not exist', patch.expanded_filename)
+                continue
             if patch.number in strip_options:
                 patches_applied.append(PatchObject(str(patch_path), patch.number, strip_options[patch.number]))
             else:
@@ -280,25 +642,21 @@ class SpecFile:
         """
         parser = SilentArgumentParser()
         parser.add_argument('-p', type=int, default=1)
+        patch_filename_index = self._sources_data['patch_filename_index']
         result: Dict[int, int] = {}
-        for line in self.get_prep_section():
-            try:
-                tokens = shlex.split(line, comments=True)
-            except ValueError:
+        for line in self.prep_lines:
+            if not line.tokens:
                 continue
-            if not tokens:
-                continue
-            args = tokens[1:]
+            args = line.tokens[1:]
             try:
                 ns, rest = parser.parse_known_args(args)
             except ParseError:
                 continue
-            rest = [os.path.basename(a) for a in rest]
-            numbers = [
+            numbers = {
                 p.number
-                for p in self.spec.patches().content # pylint: disable=no-member
-                if p.expanded_filename in rest
-            ]
+                for a in rest
+                for p in patch_filename_index.get(os.path.basename(a), [])
+            }
             for num in numbers:
                 if num not in result or result[num] < ns.p:
                     result[num] = ns.p
@@ -342,6 +700,12 @@ class SpecFile:
         remove = list(remove or [])
         annotate = list(annotate or [])
 
+        listed_patches = {
+            p.number
+            for p in self.spec.patches().content # pylint: disable=no-member
+            if isinstance(p, ListSource)
+        }
+
         with self.spec.prep() as prep:
             if not prep:
                 return
@@ -364,11 +728,7 @@ class SpecFile:
                     removed += 1
                 # When combining Patch tags and %patchlist, if a Patch is removed, the numbers
                 # of %patchlist patches change and %patch macros need to be modified
-                elif macro.number in [
-                    p.number
-                    for p in self.spec.patches().content # pylint: disable=no-member
-                    if isinstance(p, ListSource)
-                ]:
+                elif macro.number in listed_patches:
                     macro.number = macro.number - removed
             for index in reversed(indexes_to_remove):
                 del prep.macros[index]
@@ -476,7 +836,7 @@ class SpecFile:
             self.spec.update_tag('Version', version)
         else:
             self.spec.version = version
-        self.spec.save()
+        self.save()
 
     def set_release(self, release: str, preserve_macros: bool = True) -> None:
         logger.verbose('Changing release to %s', release)
@@ -484,7 +844,7 @@ class SpecFile:
             self.spec.update_tag('Release', '{}%{{?dist}}'.format(release))
         else:
             self.spec.release = release
-        self.spec.save()
+        self.save()
 
     def set_extra_version(self, extra_version: Optional[str], version_changed: bool) -> None:
         """Updates SPEC file with the specified extra version.
@@ -577,25 +937,7 @@ class SpecFile:
 
     def get_prep_section(self):
         """Function returns whole prep section"""
-        def unmatched_quotation(s):
-            try:
-                shlex.split(s, comments=True)
-            except ValueError:
-                return True
-            return False
-        if not self.prep_section:
-            return []
-        prep = self.prep_section.split('\n')
-        # join lines split by backslash or ending with pipe
-        result = [prep.pop(0)]
-        while prep:
-            if result[-1].rstrip().endswith('\\'):
-                result[-1] = result[-1][:-1] + prep.pop(0)
-            elif result[-1].rstrip().endswith('|') or unmatched_quotation(result[-1]):
-                result[-1] = result[-1] + prep.pop(0)
-            else:
-                result.append(prep.pop(0))
-        return result
+        return [line.line for line in self.prep_lines]
 
     @staticmethod
     def get_subpackage_name(files_section):
@@ -645,8 +987,22 @@ class SpecFile:
 
         """
         shutil.copy(self.spec.path, new_path)
-        new_object = SpecFile(new_path, self.spec.sourcedir, self.spec.macros,
-                              self.lookaside_cache_preset)
+        new_object = SpecFile.__new__(SpecFile)
+        new_object.lookaside_cache_preset = self.lookaside_cache_preset
+        new_object.removed_patches = []
+        new_object.spec = Specfile(new_path, sourcedir=self.spec.sourcedir, macros=list(self.spec.macros),
+                                   force_parse=self.spec.force_parse)
+        # take over unsaved changes
+        with self.spec.lines() as lines, new_object.spec.lines() as new_lines:
+            new_lines[:] = lines
+        # the content is identical, so is the derived data, except for sources
+        # and patches that are bound to the original spec file
+        new_object._sections_snapshot = self._sections_snapshot  # pylint: disable=protected-access
+        new_object._derived = {  # pylint: disable=protected-access
+            name: copy.deepcopy(value)
+            for name, value in self._derived.items()
+            if name != 'sources'
+        }
         return new_object
 
     def reload(self):
@@ -654,10 +1010,48 @@ class SpecFile:
         self.update()
 
     def save(self) -> None:
-        """Saves changes made to SpecContent and updates the internal state."""
-        self.spec.save()
-        #  Update internal variables
-        self.update()
+        """Saves changes made to SpecContent and updates the internal state.
+
+        Within a transaction only the internal state is updated,
+        the spec file is written at the end of the transaction.
+        """
+        if not self._transaction_depth:
+            self.spec.save()
+        # discard derived data affected by the changes
+        self._invalidate(full=False)
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator['SpecFile']:
+        """Context manager batching changes of the spec file.
+
+        The spec file is written only once at the end of the outermost
+        transaction. If an exception is raised, all changes made within
+        the transaction are discarded.
+
+        Yields:
+            The SpecFile object itself.
+
+        """
+        with self.spec.lines() as lines:
+            original_lines = lines.copy()
+        original_removed_patches = self.removed_patches.copy()
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            with self.spec.lines() as lines:
+                lines[:] = original_lines
+            self.removed_patches = original_removed_patches
+            self._invalidate(full=False)
+            raise
+        finally:
+            self._transaction_depth -= 1
+        if not self._transaction_depth:
+            with self.spec.lines() as lines:
+                changed = lines != original_lines
+            if changed:
+                self.spec.save()
+            self._invalidate(full=False)
 
     ####################
     # UNSORTED METHODS #
@@ -750,58 +1144,70 @@ class SpecFile:
         :param archive: Path to archive
         :return: Target path relative to builddir or None if not determined
         """
-        cd_parser = SilentArgumentParser()
-        cd_parser.add_argument('dir', default=os.environ.get('HOME', ''))
         tar_parser = argparse.ArgumentParser()
         tar_parser.add_argument('-C', default='.', dest='target')
         unzip_parser = argparse.ArgumentParser()
         unzip_parser.add_argument('-d', default='.', dest='target')
         archive = os.path.basename(archive)
         builddir = self.expand('%{_builddir}', '')
-        basedir = builddir
-        for line in self.get_prep_section():
-            tokens = shlex.split(line, comments=True)
-            if not tokens:
+        for line in self.prep_lines:
+            if archive not in line.line:
                 continue
-            # split tokens by pipe
-            for tokens in [list(group) for k, group in itertools.groupby(tokens, lambda t: t == '|') if not k]:
-                cmd, args = os.path.basename(tokens[0]), tokens[1:]
-                if cmd == 'cd':
-                    # keep track of current directory
+            for command in line.commands:
+                target = '.'
+                if command.name == 'tar':
+                    parser = tar_parser
+                elif command.name == 'unzip':
+                    parser = unzip_parser
+                elif command.name == 'rpmuncompress':
+                    parser = None
+                else:
+                    continue
+                if parser:
                     try:
-                        ns, _ = cd_parser.parse_known_args(args)
+                        ns, _ = parser.parse_known_args(command.args)
                     except ParseError:
-                        pass
-                    else:
-                        basedir = ns.dir if os.path.isabs(ns.dir) else os.path.join(basedir, ns.dir)
-                if archive in line:
-                    target = '.'
-                    if cmd == 'tar':
-                        parser = tar_parser
-                    elif cmd == 'unzip':
-                        parser = unzip_parser
-                    elif cmd == 'rpmuncompress':
-                        parser = None
-                    else:
                         continue
-                    if parser:
-                        try:
-                            ns, _ = parser.parse_known_args(args)
-                        except ParseError:
-                            continue
-                        else:
-                            target = ns.target
-                    basedir = os.path.relpath(basedir, builddir)
-                    return os.path.normpath(os.path.join(basedir, target))
+                    else:
+                        target = ns.target
+                basedir = os.path.relpath(command.basedir, builddir)
+                return os.path.normpath(os.path.join(basedir, target))
         return None
 
-    def expand(self, s: str, default: str = '') -> str:
-        try:
-            # there seems to be a bug in astroid 2.12.13 inference
-            # pylint: disable=not-callable
-            return self.spec.expand(s)
-        except RPMException:
+    def expand(self, s: str, default: str = '', raise_errors: bool = False) -> str:
+        """Expands macros in a string in the context of the spec file.
+
+        Results, including failures, are memoized until the spec file is saved
+        or reloaded, or until the predefined macros change.
+
+        Args:
+            s: String to expand.
+            default: Value to return if the expansion fails.
+            raise_errors: Whether to raise an exception if the expansion fails
+              instead of returning the default value.
+
+        Returns:
+            Expanded string.
+
+        Raises:
+            RPMException: If the expansion fails and raise_errors is True.
+
+        """
+        expansions: Dict[Tuple[str, Tuple], Union[str, RPMException]] = self._get_derived('expansions', dict)
+        key = (s, tuple(self.spec.macros))
+        if key not in expansions:
+            try:
+                # there seems to be a bug in astroid 2.12.13 inference
+                # pylint: disable=not-callable
+                expansions[key] = self.spec.expand(s)
+            except RPMException as e:
+                expansions[key] = e
+        result = expansions[key]
+        if isinstance(result, RPMException):
+            if raise_errors:
+                raise result.with_traceback(None)
             return default
+        return result
 
     def substitute_path_with_macros(self, path: str, condition: Optional[Callable] = None):
         """Substitutes parts of a path with macros.
@@ -814,19 +1220,17 @@ class SpecFile:
         Returns:
             Path expressed using macros.
         """
-        # there seems to be a bug in astroid 2.12.13 inference
-        # pylint: disable=not-callable
-        if condition is None:
-            condition = lambda m: m.name in MACROS_WHITELIST
-        macros = [m for m in self.spec.get_active_macros() if condition(m)]
-        for macro in macros:
-            macro.body = self.spec.expand(macro.body)
-        # ensure maximal greediness
-        macros.sort(key=lambda m: len(m.body), reverse=True)
-        for macro in macros:
-            if macro.body and macro.body in path:
-                path = path.replace(macro.body, '%{{{}}}'.format(macro.name))
-        return path
+        # the trie is built once per spec file state, predefined macros and condition
+        key = (tuple(self.spec.macros), condition)
+        tries = self._get_derived('macro_tries', dict)
+        if key not in tries:
+            # there seems to be a bug in astroid 2.12.13 inference
+            # pylint: disable=not-callable
+            if condition is None:
+                condition = lambda m: m.name in MACROS_WHITELIST
+            macros = [(m.name, self.expand(m.body, m.body)) for m in self.spec.get_active_macros() if condition(m)]
+            tries[key] = MacroTrie(macros)
+        return tries[key].substitute(path)
 
     @classmethod
     def get_comment_span(cls, line: str, script_section: bool) -> Tuple[int, int]:
@@ -61,6 +61,9 @@ class TemporaryEnvironment:
         else:
             logger.debug("Exit callback executed successfully")
 
+        self._destroy()
+
+    def _destroy(self):
         shutil.rmtree(self.path(), onerror=lambda func, path, excinfo: shutil.rmtree(path)) # pylint: disable=deprecated-argument
         logger.debug("Destroyed environment in '%s'", self.path())
 
@@ -65,6 +65,7 @@ class MockedRpmSpec:
 class MockedParser:
     def __init__(self, content):
         self.spec = MockedRpmSpec(content)
+        self.macros = []
 
     def parse(self, content, *_):
         self.spec.parsed = content
@@ -74,6 +75,7 @@ class MockedParser:
 def mocked_spec_object(spec_attributes):
     spec = SpecFile.__new__(SpecFile)
     spec.save = lambda: None
+    spec.removed_patches = []
     spec_content = ''
     active_macros = []
     for attribute, value in spec_attributes.items():
@@ -102,6 +104,7 @@ def mocked_spec_object(spec_attributes):
             expression = macro_re.sub(replace, expression)
         return expression
     spec.spec.expand = types.MethodType(expand, spec.spec)
+    spec._invalidate()  # pylint: disable=protected-access
     return spec
 
 
@@ -22,8 +22,11 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import collections
 import io
 import os
+import threading
+import time
 
 import pytest  # type: ignore
 
@@ -111,3 +114,62 @@ class TestDownloadHelper:
         with pytest.raises(DownloadError):
             DownloadHelper.download_file(url, local_file)
         assert not os.path.isfile(local_file)
+
+    def test_download_files(self, monkeypatch):
+        """Test that concurrent downloads respect the per-host connection limit"""
+        lock = threading.Lock()
+        connections = collections.Counter()
+        max_connections = collections.Counter()
+        downloaded = []
+
+        def download_file(url, destination_path, **_):
+            host = url.split('/')[2]
+            with lock:
+                connections[host] += 1
+                max_connections[host] = max(max_connections[host], connections[host])
+            time.sleep(0.05)
+            with lock:
+                connections[host] -= 1
+            if 'missing' in url:
+                raise DownloadError('Not Found')
+            downloaded.append(destination_path)
+
+        monkeypatch.setattr(DownloadHelper, 'download_file', download_file)
+        downloads = [('https://a.example.com/{}.tar.gz'.format(i), 'a{}'.format(i)) for i in range(6)]
+        downloads += [('https://b.example.com/{}.tar.gz'.format(i), 'b{}'.format(i)) for i in range(3)]
+        downloads += [
+            ('https://c.example.com/missing.patch', 'c0'),
+            ('https://c.example.com/duplicate.patch', 'a0'),
+        ]
+        errors = DownloadHelper.download_files(downloads, max_connections_per_host=2)
+        assert list(errors) == ['https://c.example.com/missing.patch']
+        assert sorted(downloaded) == ['a0', 'a1', 'a2', 'a3', 'a4', 'a5', 'b0', 'b1', 'b2']
+        assert max_connections['a.example.com'] == 2
+        assert max_connections['b.example.com'] == 2
+
+    def test_download_file_expected_size(self, monkeypatch):
+        """Test that downloaded files are checked against their expected size"""
+        requests = []
+
+        class Response:
+            status_code = 200
+            headers = {'content-length': '7'}
+
+            @staticmethod
+            def iter_content(**_):
+                yield b'content'
+
+        def request(url, **_):
+            requests.append(url)
+            return Response()
+
+        monkeypatch.setattr(DownloadHelper, 'request', request)
+        with open('existing', 'wb') as f:
+            f.write(b'content')
+        DownloadHelper.download_file('https://example.com/existing', 'existing', expected_size=7)
+        # existing files are always checked against the server
+        assert requests == ['https://example.com/existing']
+        with pytest.raises(DownloadError):
+            DownloadHelper.download_file('https://example.com/truncated', 'truncated', expected_size=8)
+        assert requests == ['https://example.com/existing', 'https://example.com/truncated']
+        assert not os.path.exists('truncated')
@@ -122,3 +122,30 @@ class TestPathHelper:
 
         def test_find_without_recursion(self, filelist):
             assert PathHelper.find_first_file(os.path.curdir, "*.spec") == os.path.abspath(filelist[-1])
+
+    class TestStageFile:
+        """ PathHelper - stage_file() tests """
+        def test_stage_file(self, filelist):
+            os.makedirs('staged')
+            staged = PathHelper.stage_file(filelist[0], 'staged')
+            assert staged == os.path.join('staged', filelist[0])
+            with open(staged, encoding=ENCODING) as f:
+                assert f.read() == filelist[0]
+            # an existing destination is replaced
+            assert PathHelper.stage_file(filelist[1], staged) == staged
+            with open(staged, encoding=ENCODING) as f:
+                assert f.read() == filelist[1]
+
+        def test_stage_file_with_hardlink(self, filelist, monkeypatch):
+            # pretend reflinks are not supported
+            monkeypatch.setattr(PathHelper, 'FICLONE', 0)
+            staged = PathHelper.stage_file(filelist[0], 'link', hardlink=True)
+            assert os.path.samefile(staged, filelist[0])
+
+        def test_stage_file_without_hardlink(self, filelist):
+            staged = PathHelper.stage_file(filelist[0], 'copy')
+            assert not os.path.samefile(staged, filelist[0])
+            with open(staged, 'w', encoding=ENCODING) as f:
+                f.write('modified')
+            with open(filelist[0], encoding=ENCODING) as f:
+                assert f.read() == filelist[0]
@@ -22,6 +22,11 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import os
+
+import rpm  # type: ignore
+
+from rebasehelper.helpers.process_helper import ProcessHelper
 from rebasehelper.helpers.rpm_helper import RpmHelper
 
 
@@ -41,3 +46,47 @@ class TestRpmHelper:
 
     def test_all_packages_installed_one_non_existing(self):
         assert RpmHelper.all_packages_installed(['glibc', 'coreutils', 'non-existing-package']) is False
+
+    def test_get_missing_dependencies(self, monkeypatch):
+        transactions = []
+        checked = []
+
+        def is_dependency_satisfied(ts, name, flags, version):
+            checked.append(name)
+            return name != 'missing' and not (name == 'make' and version == '99')
+
+        monkeypatch.setattr(RpmHelper, '_dependency_cache', {})
+        monkeypatch.setattr(rpm, 'TransactionSet', lambda: transactions.append(object()) or transactions[-1])
+        monkeypatch.setattr(RpmHelper, '_is_dependency_satisfied', staticmethod(is_dependency_satisfied))
+        requires = [('gcc', 0, ''), ('make', 12, '99'), 'missing', ('make', 12, '4.0')]
+        assert RpmHelper.get_missing_dependencies(requires) == [('make', 12, '99'), 'missing']
+        # the rpmdb is opened only once
+        assert len(transactions) == 1
+        # satisfied dependencies are cached, missing ones are checked again
+        assert RpmHelper.get_missing_dependencies(requires[:2]) == [('make', 12, '99')]
+        assert len(transactions) == 2
+        assert checked == ['gcc', 'make', 'missing', 'make', 'make']
+
+    def test_get_missing_dependencies_after_install(self, monkeypatch):
+        installed = {'gcc'}
+        checked = []
+
+        def is_dependency_satisfied(ts, name, flags, version):
+            checked.append(name)
+            return name in installed
+
+        def run_subprocess(cmd, **_):
+            installed.add('make')
+            return 0
+
+        monkeypatch.setattr(RpmHelper, '_dependency_cache', {})
+        monkeypatch.setattr(rpm, 'TransactionSet', object)
+        monkeypatch.setattr(RpmHelper, '_is_dependency_satisfied', staticmethod(is_dependency_satisfied))
+        monkeypatch.setattr(ProcessHelper, 'run_subprocess', run_subprocess)
+        monkeypatch.setattr(os, 'geteuid', lambda: 0)
+        # the old version build finds a missing dependency and installs it
+        assert RpmHelper.get_missing_dependencies(['gcc', 'make']) == ['make']
+        assert RpmHelper.install_build_dependencies('test.spec', assume_yes=True) == 0
+        # the new version build doesn't ask again
+        assert RpmHelper.get_missing_dependencies(['gcc', 'make']) == []
+        assert checked == ['gcc', 'make', 'gcc', 'make']
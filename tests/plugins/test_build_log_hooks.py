@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you rebase your package to the latest version
+# Copyright (C) 2013-2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hráček <phracek@redhat.com>
+#          Tomáš Hozza <thozza@redhat.com>
+#          Nikola Forró <nforro@redhat.com>
+#          František Nečas <fifinecas@seznam.cz>
+
+from textwrap import dedent
+
+import pytest  # type: ignore
+from specfile.exceptions import RPMException
+from specfile.macros import Macro, MacroLevel
+
+from rebasehelper.plugins.build_log_hooks.files import Files
+
+
+class TestFiles:
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                %files
+                %{_bindir}/test
+                %{_bindir}/test2
+
+                %files devel
+                %{_includedir}/test.h
+                """),
+            'macros':
+                [
+                    Macro('_bindir', None, '/usr/bin', MacroLevel.MACROFILES, False),
+                    Macro('_includedir', None, '/usr/include', MacroLevel.MACROFILES, False),
+                ]
+        }
+    ])
+    def test_expansions_are_memoized(self, mocked_spec_object):
+        calls = []
+        expand = mocked_spec_object.spec.expand
+        def counting_expand(expression, **kwargs):
+            calls.append(expression)
+            return expand(expression, **kwargs)
+        mocked_spec_object.spec.expand = counting_expand
+        # pylint: disable=protected-access
+        assert Files._get_best_matching_files_section(mocked_spec_object, '/usr/include/test2.h') == 'files devel'
+        assert Files._get_best_matching_files_section(mocked_spec_object, '/usr/bin/test3') == 'files'
+        result = Files._correct_deleted_files(mocked_spec_object, ['/usr/bin/test2'])
+        assert result['removed']['%files'] == ['%{_bindir}/test2']
+        # each distinct line and path is expanded only once
+        assert len(calls) == len(set(calls))
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                %files
+                %{_bindir}/test
+                """),
+        }
+    ])
+    def test_expansion_errors(self, mocked_spec_object):
+        calls = []
+        def failing_expand(expression, **_):
+            calls.append(expression)
+            raise RPMException([b'error: failed to expand'])
+        mocked_spec_object.spec.expand = failing_expand
+        # pylint: disable=protected-access
+        for _ in range(2):
+            with pytest.raises(RPMException):
+                Files._get_best_matching_files_section(mocked_spec_object, '/usr/bin/test')
+        assert mocked_spec_object.expand('%{_bindir}/test', 'default') == 'default'
+        assert calls == ['%{_bindir}/test']
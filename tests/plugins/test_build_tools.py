@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you rebase your package to the latest version
+# Copyright (C) 2013-2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hráček <phracek@redhat.com>
+#          Tomáš Hozza <thozza@redhat.com>
+#          Nikola Forró <nforro@redhat.com>
+#          František Nečas <fifinecas@seznam.cz>
+
+import collections
+import os
+import shutil
+import threading
+import time
+import types
+
+import pytest  # type: ignore
+
+from rebasehelper.constants import ENCODING
+from rebasehelper.helpers.process_helper import ProcessHelper
+from rebasehelper.plugins import build_tools
+from rebasehelper.plugins.build_tools import BuildScheduler, CompilerCache, MockRootCache
+from rebasehelper.plugins.build_tools.rpm.rpmbuild import Rpmbuild
+
+
+class TestMockRootCache:
+    @pytest.mark.parametrize('builder_options, config', [
+        (None, 'default'),
+        (['--nocheck'], 'default'),
+        (['-r', 'fedora-rawhide-x86_64'], 'fedora-rawhide-x86_64'),
+        (['--root=/etc/mock/custom.cfg', '--nocheck'], '/etc/mock/custom.cfg'),
+    ])
+    def test_get_config(self, builder_options, config):
+        assert MockRootCache.get_config(builder_options) == config
+
+    def test_root(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        monkeypatch.setattr(build_tools, 'check_mock_privileges', lambda: True)
+        scrubbed = []
+        monkeypatch.setattr(ProcessHelper, 'run_subprocess', lambda cmd, **_: scrubbed.append(cmd[4]) or 0)
+        old = types.SimpleNamespace(build_requires=['gcc', 'make'])
+        new = types.SimpleNamespace(build_requires=['make', 'gcc'])
+        changed = types.SimpleNamespace(build_requires=['gcc', 'make >= 4.0'])
+
+        with MockRootCache.root(old, None) as options:
+            assert '--no-clean' not in options
+            assert '--no-cleanup-after' in options
+        # build dependencies match, the root populated by the old build is reused
+        with MockRootCache.root(new, None) as options:
+            assert '--no-clean' in options
+        old_key = options[options.index('--uniqueext') + 1]
+        # a different configuration uses a different root
+        with MockRootCache.root(new, ['-r', 'epel-9-x86_64']) as options:
+            assert '--no-clean' not in options
+        # changed build dependencies invalidate the root
+        with MockRootCache.root(changed, None) as options:
+            assert '--no-clean' not in options
+            assert options[options.index('--uniqueext') + 1] != old_key
+
+        assert not scrubbed
+        # a failed build invalidates and scrubs the root
+        with pytest.raises(RuntimeError):
+            with MockRootCache.root(changed, None) as options:
+                assert '--no-clean' in options
+                raise RuntimeError()
+        changed_key = options[options.index('--uniqueext') + 1]
+        assert scrubbed == [changed_key]
+        with MockRootCache.root(changed, None) as options:
+            assert '--no-clean' not in options
+
+        scrubbed.clear()
+        MockRootCache.MAX_ROOTS = 1
+        try:
+            with MockRootCache.root(changed, None):
+                pass
+        finally:
+            MockRootCache.MAX_ROOTS = 2
+        assert scrubbed == [old_key]
+        assert len(os.listdir(MockRootCache.get_cache_dir('default'))) == 1
+
+
+class TestCompilerCache:
+    @pytest.mark.parametrize('tool, output, stats', [
+        ('ccache', 'cache_miss\t3\ndirect_cache_hit\t5\npreprocessed_cache_hit\t2\n', dict(hits=7, misses=3)),
+        ('sccache', '{"stats": {"cache_hits": {"counts": {"C/C++": 4, "Rust": 1}}, '
+                    '"cache_misses": {"counts": {"C/C++": 2}}}}', dict(hits=5, misses=2)),
+        ('sccache', 'not json', None),
+    ])
+    def test_get_stats(self, monkeypatch, tmp_path, tool, output, stats):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        calls = []
+
+        def run_subprocess_env(cmd, env=None, output_file=None, **_):
+            calls.append(cmd)
+            assert env[tool.upper() + '_DIR'] == str(tmp_path / 'rebase-helper' / 'compiler-cache' / tool / 'test')
+            output_file.write(output)
+            return 0
+
+        monkeypatch.setattr(ProcessHelper, 'run_subprocess_env', run_subprocess_env)
+        spec = types.SimpleNamespace(spec=types.SimpleNamespace(expanded_name='test'))
+        cache = CompilerCache.from_options(spec, app_kwargs=dict(compiler_cache=tool))
+        assert os.path.isdir(cache.path)
+        cache.zero_stats()
+        assert cache.get_stats() == stats
+        assert calls[0] == [tool, '--zero-stats']
+        assert CompilerCache.from_options(spec, app_kwargs={}) is None
+
+    def test_get_mock_options(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        cache = CompilerCache('ccache', 'test')
+        assert cache.get_mock_options() == ['--enable-plugin=ccache',
+                                            '--plugin-option=ccache:dir={}'.format(cache.path)]
+        assert CompilerCache('sccache', 'test').get_mock_options() == []
+
+
+class TestBuildScheduler:
+    @pytest.fixture
+    def scheduler(self, monkeypatch):
+        monkeypatch.setattr(BuildScheduler, '_free_cpus', None)
+        monkeypatch.setattr(BuildScheduler, 'get_host_cpus', staticmethod(lambda: 4))
+        monkeypatch.setattr(BuildScheduler, 'get_host_memory', staticmethod(lambda: 3 * BuildScheduler.MEMORY_PER_CPU))
+        DiskUsage = collections.namedtuple('DiskUsage', ['total', 'used', 'free'])
+        monkeypatch.setattr(shutil, 'disk_usage', lambda _: DiskUsage(0, 0, BuildScheduler.MIN_FREE_DISK))
+        return BuildScheduler
+
+    def test_job(self, scheduler, workdir):
+        jobs = {}
+
+        def build(name, **kwargs):
+            with scheduler.job(name, workdir, **kwargs) as job:
+                jobs[name] = job
+
+        with scheduler.job('first', workdir, max_cpus=2) as first:
+            assert first.cpus == 2
+            assert first.get_rpm_options() == ['--define', '_smp_build_ncpus 2', '--define', '_smp_mflags -j2']
+            # memory is left only for a single CPU
+            thread = threading.Thread(target=build, args=('second',))
+            thread.start()
+            thread.join()
+            assert jobs['second'].cpus == 1
+            with scheduler.job('third', workdir) as third:
+                # there is no memory left, wait for the running builds to finish
+                thread = threading.Thread(target=build, args=('fourth',))
+                thread.start()
+                time.sleep(0.1)
+                assert 'fourth' not in jobs
+            thread.join()
+            assert jobs['fourth'].cpus == 1
+            assert jobs['fourth'].wait_time >= 0.1
+        assert third.cpus == 1
+        assert set(first.get_stats()) == {'cpus', 'wait_time', 'run_time'}
+
+    def test_job_alone(self, scheduler, workdir):
+        jobs = {}
+
+        def build(name, **kwargs):
+            with scheduler.job(name, workdir, **kwargs) as job:
+                jobs[name] = job
+
+        with scheduler.job('first', workdir) as first:
+            # a single build is not limited by memory nor by rpm options
+            assert first.cpus == 4
+            assert first.get_rpm_options() == []
+            thread = threading.Thread(target=build, args=('second',))
+            thread.start()
+            time.sleep(0.1)
+            assert 'second' not in jobs
+        thread.join()
+        assert jobs['second'].get_rpm_options() == []
+
+
+class TestRpmbuild:
+    @pytest.mark.parametrize('log, result', [
+        ('Executing(%install): /bin/sh -e /var/tmp/rpm-tmp.1\n'
+         'Processing files: test-1.0-1.fc40.x86_64\n'
+         'error: File not found: /builddir/usr/bin/test\n', True),
+        ('Executing(%install): /bin/sh -e /var/tmp/rpm-tmp.1\n'
+         'error: Bad exit status from /var/tmp/rpm-tmp.1 (%install)\n', False),
+        (None, False),
+    ], ids=[
+        'files',
+        'install',
+        'no_log',
+    ])
+    def test_failed_in_packaging(self, workdir, log, result):
+        build_log = os.path.join(workdir, 'build.log')
+        if log is not None:
+            with open(build_log, 'w', encoding=ENCODING) as f:
+                f.write(log)
+        assert Rpmbuild.failed_in_packaging(build_log) is result
@@ -22,12 +22,19 @@
 #          Nikola Forró <nforro@redhat.com>
 #          František Nečas <fifinecas@seznam.cz>
 
+import inspect
+import types
 from textwrap import dedent
 
 import pytest  # type: ignore
 from specfile.macros import Macro, MacroLevel
 
+from rebasehelper.plugins.spec_hooks import BaseSpecHook, SpecHookCollection
 from rebasehelper.plugins.spec_hooks.typo_fix import TypoFix
+from rebasehelper.plugins.spec_hooks.commit_hash_updater import CommitHashUpdater
+from rebasehelper.plugins.spec_hooks.ruby_helper import RubyHelper
+from rebasehelper.helpers.download_helper import DownloadHelper
+from rebasehelper.helpers.process_helper import ProcessHelper
 from rebasehelper.plugins.spec_hooks.pypi_url_fix import PyPIURLFix
 from rebasehelper.plugins.spec_hooks.escape_macros import EscapeMacros
 from rebasehelper.plugins.spec_hooks.replace_old_version import ReplaceOldVersion
@@ -175,3 +182,168 @@ class TestSpecHook:
         tags = mocked_spec_object.spec.tags().content # pylint: disable=no-member
         for tag, value in expected.items():
             assert value == getattr(tags, tag).value
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                %build
+                make # chnagelog of %{name}
+
+                %files
+                /usr/bin/test
+                """),
+            'macros':
+                [
+                    Macro('_bindir', None, '/usr/bin', MacroLevel.MACROFILES, False),
+                ]
+        }
+    ])
+    def test_spec_hook_collection(self, mocked_spec_object):
+        saved = []
+        mocked_spec_object.spec.save = lambda: saved.append(str(mocked_spec_object.spec))
+        mocked_spec_object._derived['category'] = None  # pylint: disable=protected-access
+        seen = []
+
+        class Recorder(BaseSpecHook):
+            @classmethod
+            def run(cls, spec_file, rebase_spec_file, **kwargs):
+                seen.append(str(rebase_spec_file.spec))
+
+        collection = SpecHookCollection.__new__(SpecHookCollection)
+        collection.plugins = {
+            'typo-fix': TypoFix,
+            'recorder': Recorder,
+            'pypi-url-fix': PyPIURLFix,
+            'paths-to-rpm-macros': PathsToRPMMacros,
+            'escape-macros': EscapeMacros,
+        }
+        collection.run(mocked_spec_object, mocked_spec_object, spec_hook_blacklist=['pypi-url-fix'])
+        # hooks see changes made by line spec hooks preceding them, but not by the following ones
+        assert seen == [dedent("""\
+            %build
+            make # changelog of %{name}
+
+            %files
+            /usr/bin/test
+            """)]
+        assert saved == [dedent("""\
+            %build
+            make # changelog of %%{name}
+
+            %files
+            %{_bindir}/test
+            """)]
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                Version: 1.0.2
+                Release: 1
+                # chnagelog of %{name}
+                Source0: https://test.com/%{name}-1.0.2.tar.gz
+
+                %build
+                make # version 1.0.2 of %{name}
+
+                %files
+                /usr/bin/test-1.0.2
+                """),
+            'macros':
+                [
+                    Macro('_bindir', None, '/usr/bin', MacroLevel.MACROFILES, False),
+                ]
+        }
+    ])
+    def test_spec_hook_collection_single_pass(self, mocked_spec_object, mocked_spec_object_copy):
+        mocked_spec_object_copy.spec.version = '1.1.0'
+        mocked_spec_object._derived['category'] = None  # pylint: disable=protected-access
+        # snapshots taken at the end of the transaction are not a traversal done by the hooks
+        mocked_spec_object_copy.get_sections_snapshot = lambda: {}
+        calls = []
+        sections = mocked_spec_object_copy.spec.sections
+        def counting_sections():
+            # count only traversals done by rebase-helper, not tag lookups of specfile
+            if inspect.currentframe().f_back.f_globals['__name__'].startswith('rebasehelper'):
+                calls.append('sections')
+            return sections()
+        mocked_spec_object_copy.spec.sections = counting_sections
+        mocked_spec_object_copy.save = lambda: calls.append('save')
+        saved = []
+        mocked_spec_object_copy.spec.save = lambda: saved.append(str(mocked_spec_object_copy.spec))
+        collection = SpecHookCollection.__new__(SpecHookCollection)
+        collection.plugins = {
+            'typo-fix': TypoFix,
+            'paths-to-rpm-macros': PathsToRPMMacros,
+            'escape-macros': EscapeMacros,
+            'replace-old-version': ReplaceOldVersion,
+        }
+        collection.run(mocked_spec_object, mocked_spec_object_copy)
+        assert calls == ['sections', 'save']
+        assert saved == [dedent("""\
+            Version: 1.1.0
+            Release: 1
+            # changelog of %%{name}
+            Source0: https://test.com/%{name}-1.1.0.tar.gz
+
+            %build
+            make # version 1.0.2 of %%{name}
+
+            %files
+            %{_bindir}/test-1.1.0
+            """)]
+
+    def test_commit_hash_updater_github_lookup(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        baseurl = 'https://api.github.com/repos/test/test'
+        pages = {
+            baseurl + '/releases?per_page=100': (
+                [{'name': 'Test 1.0.3', 'tag_name': 'release-1.0.3'}, {'name': None, 'tag_name': 'v1.0.2'}],
+                None,
+            ),
+            baseurl + '/tags?per_page=100': (
+                [{'name': 'release-1.0.3', 'commit': {'sha': 'a' * 40}}],
+                baseurl + '/tags?per_page=100&page=2',
+            ),
+            baseurl + '/tags?per_page=100&page=2': (
+                [{'name': 'v1.0.2', 'commit': {'sha': 'b' * 40}}],
+                None,
+            ),
+        }
+        requests_made = []
+
+        def request(url, session=None, headers=None, **_):
+            requests_made.append((url, headers))
+            data, next_url = pages[url]
+            etag = '"{}"'.format(url)
+            if headers and headers.get('If-None-Match') == etag:
+                return types.SimpleNamespace(status_code=304, ok=False, headers={})
+            return types.SimpleNamespace(
+                status_code=200,
+                ok=True,
+                headers={'ETag': etag},
+                json=lambda: data,
+                links={'next': {'url': next_url}} if next_url else {},
+            )
+
+        monkeypatch.setattr(DownloadHelper, 'request', request)
+        spec_file = types.SimpleNamespace(get_raw_main_source=lambda: 'https://github.com/test/test/archive/a.tar.gz')
+        expected = {'1.0.3': 'a' * 40, '1.0.2': 'b' * 40}
+        assert CommitHashUpdater._get_commit_hashes(spec_file, ['1.0.3', '1.0.2']) == expected  # pylint: disable=protected-access
+        assert len(requests_made) == 3
+        assert not any(headers for _, headers in requests_made)
+        requests_made.clear()
+        # responses are revalidated
+        assert CommitHashUpdater._get_commit_hashes(spec_file, ['1.0.3', '1.0.2']) == expected  # pylint: disable=protected-access
+        assert len(requests_made) == 3
+        assert all(headers == {'If-None-Match': '"{}"'.format(url)} for url, headers in requests_made)
+
+    def test_ruby_helper_source_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+        source = tmp_path / 'test-1.0.gem'
+        instructions = ['echo test > "{}"'.format(source)]
+        RubyHelper._build_source_from_instructions(instructions, source, str(tmp_path / 'log'))  # pylint: disable=protected-access
+        assert source.read_text() == 'test\n'
+        source.unlink()
+        monkeypatch.setattr(ProcessHelper, 'run_subprocess_cwd', lambda *_, **__: pytest.fail('source recreated'))
+        RubyHelper._build_source_from_instructions(instructions, source, str(tmp_path / 'log'))  # pylint: disable=protected-access
+        assert source.read_text() == 'test\n'
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# This tool helps you rebase your package to the latest version
+# Copyright (C) 2013-2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Authors: Petr Hráček <phracek@redhat.com>
+#          Tomáš Hozza <thozza@redhat.com>
+#          Nikola Forró <nforro@redhat.com>
+#          František Nečas <fifinecas@seznam.cz>
+
+import os
+import platform
+import types
+
+from rebasehelper.artifact_store import ArtifactStore
+from rebasehelper.constants import ENCODING
+
+
+class TestArtifactStore:
+    @staticmethod
+    def write(path, content):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding=ENCODING) as f:
+            f.write(content)
+        return os.path.abspath(path)
+
+    def test_store(self, workdir, monkeypatch):
+        monkeypatch.setenv('XDG_CACHE_HOME', os.path.join(workdir, 'cache'))
+        source = self.write('test-1.0.tar.gz', 'source')
+        patch = types.SimpleNamespace(path=self.write('fix.patch', 'patch'))
+        spec = types.SimpleNamespace(
+            spec=types.SimpleNamespace(path=self.write('test.spec', 'Name: test')),
+            get_sources=lambda: [source],
+            get_patches=lambda: [patch],
+        )
+        key = ArtifactStore.get_key(spec, 'rpm', 'mock', None)
+        assert key != ArtifactStore.get_key(spec, 'rpm', 'mock', '--nocheck')
+        assert key != ArtifactStore.get_key(spec, 'srpm', 'mock', None)
+        assert ArtifactStore.retrieve(key, workdir) is None
+
+        build_dict = dict(
+            rpm=[self.write('build/test-1.0-1.noarch.rpm', 'rpm')],
+            logs=[self.write('build/build.log', 'log')],
+        )
+        ArtifactStore.store(key, build_dict)
+        # the key is stable
+        assert ArtifactStore.get_key(spec, 'rpm', 'mock', None) == key
+
+        results_dir = os.path.join(workdir, 'results')
+        os.makedirs(results_dir)
+        stored = ArtifactStore.retrieve(key, results_dir)
+        assert stored == dict(rpm=[os.path.join(results_dir, 'test-1.0-1.noarch.rpm')],
+                              logs=[os.path.join(results_dir, 'build.log')])
+        with open(stored['rpm'][0], encoding=ENCODING) as f:
+            assert f.read() == 'rpm'
+
+        # changed patch results in a different key
+        self.write('fix.patch', 'changed patch')
+        assert ArtifactStore.get_key(spec, 'rpm', 'mock', None) != key
+
+    def test_get_key(self, workdir, monkeypatch):
+        spec = types.SimpleNamespace(
+            spec=types.SimpleNamespace(path=self.write('test.spec', 'Name: test')),
+            get_sources=lambda: [],
+            get_patches=lambda: [],
+        )
+        config_dir = os.path.join(workdir, 'mock')
+        monkeypatch.setattr(ArtifactStore, 'MOCK_CONFIG_DIR', config_dir)
+        self.write('mock/fedora-rawhide-x86_64.cfg', 'rawhide')
+        self.write('mock/epel-9-x86_64.cfg', 'epel')
+        os.symlink('fedora-rawhide-x86_64.cfg', os.path.join(config_dir, 'default.cfg'))
+        key = ArtifactStore.get_key(spec, 'rpm', 'mock', None)
+        assert ArtifactStore.get_key(spec, 'rpm', 'mock', None) == key
+        # the default configuration is resolved
+        os.unlink(os.path.join(config_dir, 'default.cfg'))
+        os.symlink('epel-9-x86_64.cfg', os.path.join(config_dir, 'default.cfg'))
+        assert ArtifactStore.get_key(spec, 'rpm', 'mock', None) != key
+        os.unlink(os.path.join(config_dir, 'default.cfg'))
+        os.symlink('fedora-rawhide-x86_64.cfg', os.path.join(config_dir, 'default.cfg'))
+        assert ArtifactStore.get_key(spec, 'rpm', 'mock', None) == key
+        # changed configuration results in a different key
+        self.write('mock/fedora-rawhide-x86_64.cfg', 'rawhide changed')
+        changed = ArtifactStore.get_key(spec, 'rpm', 'mock', None)
+        assert changed != key
+        assert ArtifactStore.get_key(spec, 'rpm', 'mock', None, {'dist': '.fc40'}) != changed
+        monkeypatch.setattr(platform, 'machine', lambda: 'aarch64')
+        assert ArtifactStore.get_key(spec, 'rpm', 'mock', None) != changed
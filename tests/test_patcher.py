@@ -138,3 +138,114 @@ class TestPatcher:
             assert 'From: {0} <{1}>\n'.format(self.USER, self.EMAIL) in content
             assert 'Subject: [PATCH] P2\n' in content
             assert Patcher.decorate_patch_name(os.path.basename(self.PATCH2)) not in content
+
+    def test__git_rebase_untouched(self, rebased_sources, old_sources, new_sources, old_repo, new_repo):
+        # add a patch creating a file that doesn't exist in either of upstream versions
+        with open(os.path.join(old_sources, 'README'), 'w', encoding=ENCODING) as f:
+            f.write('Downstream notes\n')
+        old_repo.git.add(all=True)
+        old_repo.index.commit(Patcher.insert_patch_name('P5', '5.patch'), skip_hooks=True)
+        Patcher.cont = False
+        Patcher.non_interactive = True
+        Patcher.kwargs = dict(rebased_sources_dir=rebased_sources)
+        Patcher.old_sources = old_sources
+        Patcher.new_sources = new_sources
+        Patcher.old_repo = old_repo
+        Patcher.new_repo = new_repo
+        Patcher.favor_on_conflict = None
+        Patcher.patches = [PatchObject(os.path.basename(getattr(self, 'PATCH{0}'.format(n))), n, 1)
+                           for n in range(1, 5)]
+        Patcher.patches.append(PatchObject('5.patch', 5, 1))
+        patches = Patcher._git_rebase()  # pylint: disable=protected-access
+        assert Patcher.skipped_patches == ['5.patch']
+        assert patches['untouched'] == [os.path.basename(self.PATCH1), '5.patch']
+        assert patches['modified'] == [os.path.basename(self.PATCH2)]
+        assert patches['deleted'] == [os.path.basename(self.PATCH4)]
+        assert patches['inapplicable'] == [os.path.basename(self.PATCH3)]
+        assert not os.path.exists(os.path.join(rebased_sources, '5.patch'))
+        # changes of the skipped patch are present in the rebased tree
+        assert old_repo.git.show('HEAD:README') == 'Downstream notes'
+        assert Patcher.extract_patch_name(old_repo.head.commit.message) == '5.patch'
+
+    def test__git_rebase_continue(self, rebased_sources, old_sources, new_sources, old_repo, new_repo):
+        with open(os.path.join(old_sources, 'README'), 'w', encoding=ENCODING) as f:
+            f.write('Downstream notes\n')
+        old_repo.git.add(all=True)
+        old_repo.index.commit(Patcher.insert_patch_name('P5', '5.patch'), skip_hooks=True)
+        Patcher.cont = False
+        Patcher.non_interactive = True
+        Patcher.kwargs = dict(rebased_sources_dir=rebased_sources)
+        Patcher.old_sources = old_sources
+        Patcher.new_sources = new_sources
+        Patcher.old_repo = old_repo
+        Patcher.new_repo = new_repo
+        Patcher.favor_on_conflict = None
+        Patcher.patches = [PatchObject(os.path.basename(getattr(self, 'PATCH{0}'.format(n))), n, 1)
+                           for n in range(1, 5)]
+        Patcher.patches.append(PatchObject('5.patch', 5, 1))
+        # start the rebase and stop at the first conflict like an interrupted run would
+        old_repo.create_remote('new_upstream', url=new_sources).fetch()
+        upstream_branch = 'new_upstream/{}'.format(new_repo.heads.pop().name)
+        root_commit = old_repo.git.rev_list('HEAD', max_parents=0)
+        last_commit = old_repo.commit('HEAD')
+        commits, skipped_patches = Patcher._index_patches(  # pylint: disable=protected-access
+            root_commit, last_commit.hexsha, upstream_branch)
+        Patcher._save_skipped_patches(old_repo, skipped_patches)  # pylint: disable=protected-access
+        Patcher.skipped_patches = skipped_patches
+        ret_code, _ = Patcher._start_rebase(old_repo, None, root_commit,  # pylint: disable=protected-access
+                                            last_commit, commits, upstream_branch)
+        assert ret_code != 0
+        assert os.path.isdir(os.path.join(old_repo.git_dir, 'rebase-merge'))
+        # state of a new process
+        Patcher.skipped_patches = []
+        Patcher.replayed_patches = []
+        patches = Patcher._git_rebase()  # pylint: disable=protected-access
+        assert patches['untouched'] == [os.path.basename(self.PATCH1), '5.patch']
+        assert patches['inapplicable'] == [os.path.basename(self.PATCH3)]
+        assert old_repo.git.show('HEAD:README') == 'Downstream notes'
+
+    def test__export_patches(self, rebased_sources, old_sources, old_repo):
+        with open(os.path.join(old_sources, 'README'), 'w', encoding=ENCODING) as f:
+            f.write('Downstream notes\n')
+        old_repo.git.add(all=True)
+        old_repo.index.commit(Patcher.decorate_patch_name('5.patch'), skip_hooks=True)
+        commits = list(old_repo.iter_commits(max_count=3))
+        Patcher._export_patches(old_repo, {  # pylint: disable=protected-access
+            commits[0].hexsha: ('5.patch', True),
+            commits[2].hexsha: ('3.patch', False),
+        }, rebased_sources)
+        with open(os.path.join(rebased_sources, '5.patch'), encoding=ENCODING) as f:
+            content = f.read()
+            assert content.startswith('diff --git a/README b/README\n')
+            assert '+Downstream notes\n' in content
+        with open(os.path.join(rebased_sources, '3.patch'), encoding=ENCODING) as f:
+            content = f.read()
+            assert 'Subject: [PATCH] P3\n' in content
+            assert Patcher.decorate_patch_name('3.patch') not in content
+            assert 'README' not in content
+        assert not os.path.exists(os.path.join(rebased_sources, '4.patch'))
+
+    def test__git_rebase_auto(self, rebased_sources, old_sources, new_sources, old_repo, new_repo):
+        Patcher.cont = False
+        Patcher.non_interactive = True
+        Patcher.kwargs = dict(rebased_sources_dir=rebased_sources)
+        Patcher.old_sources = old_sources
+        Patcher.new_sources = new_sources
+        Patcher.old_repo = old_repo
+        Patcher.new_repo = new_repo
+        Patcher.favor_on_conflict = 'auto'
+        Patcher.patches = [PatchObject(os.path.basename(getattr(self, 'PATCH{0}'.format(n))), n, 1)
+                           for n in range(1, 5)]
+        patches = Patcher._git_rebase()  # pylint: disable=protected-access
+        # favoring downstream leaves no inapplicable patches and deletes fewer patches than favoring upstream
+        assert Patcher.strategy_results['chosen'] == 'downstream'
+        assert set(Patcher.strategy_results['trials']) == {'off', 'downstream', 'upstream'}
+        assert Patcher.strategy_results['trials']['off']['inapplicable'] == 1
+        assert Patcher.strategy_results['trials']['downstream']['modified'] == 2
+        assert Patcher.strategy_results['trials']['upstream']['deleted'] == 2
+        assert patches['modified'] == [os.path.basename(self.PATCH2), os.path.basename(self.PATCH3)]
+        assert patches['deleted'] == [os.path.basename(self.PATCH4)]
+        assert 'inapplicable' not in patches
+        for patch in patches['modified']:
+            assert os.path.isfile(os.path.join(rebased_sources, patch))
+        assert old_repo.git.worktree('list').count('\n') == 0
@@ -24,7 +24,7 @@
 
 import pytest  # type: ignore
 
-from typing import Dict, List, Union
+from typing import Any, Dict, List, Union
 
 from rebasehelper.results_store import ResultsStore
 
@@ -44,6 +44,13 @@ class TestResultsStore:
         'deleted': ['del_patch1.patch', 'del_patch2.patch'],
         'modified': ['mod_patch1.patch', 'mod_patch2.patch']
     }
+    conflict_strategy_data: Dict[str, Any] = {
+        'chosen': 'upstream',
+        'trials': {
+            'off': {'deleted': 1, 'modified': 1, 'inapplicable': 1, 'untouched': 1, 'modified_size': 1024},
+            'upstream': {'deleted': 2, 'modified': 1, 'inapplicable': 0, 'untouched': 1, 'modified_size': 1024},
+        },
+    }
     info_data: Dict[str, str] = {'Information text': 'some information text'}
     info_data2: Dict[str, str] = {'Next Information': 'some another information text'}
 
@@ -53,6 +60,7 @@ class TestResultsStore:
         rs.set_info_text('Information text', 'some information text')
         rs.set_info_text('Next Information', 'some another information text')
         rs.set_patches_results(self.patches_data)
+        rs.set_conflict_strategy_results(self.conflict_strategy_data)
         rs.set_build_data('old', self.old_rpm_data)
         rs.set_build_data('new', self.new_rpm_data)
         return rs
@@ -78,6 +86,9 @@ class TestResultsStore:
         expected_patches = self.patches_data
         assert patch_results == expected_patches
 
+    def test_base_output_conflict_strategy(self, results_store):
+        assert results_store.get_conflict_strategy() == self.conflict_strategy_data
+
     def test_base_output_builds_old(self, results_store):
         """
         Test Output logger old builds
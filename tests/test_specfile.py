@@ -23,13 +23,18 @@
 #          František Nečas <fifinecas@seznam.cz>
 
 import os
+import types
 from typing import List
 from textwrap import dedent
 
 import pytest  # type: ignore
+from specfile import Specfile
 from specfile.macros import Macro, MacroLevel
 
-from rebasehelper.specfile import SpecFile
+from rebasehelper.constants import ENCODING
+from rebasehelper.exceptions import DownloadError
+from rebasehelper.helpers.download_helper import DownloadHelper
+from rebasehelper.specfile import SpecFile, PackageCategory, MacroTrie
 
 
 class TestSpecFile:
@@ -71,6 +76,19 @@ class TestSpecFile:
         spec_object.save()
         assert spec_object.spec.expanded_version == NEW_VERSION
 
+    def test_copy(self, spec_object):
+        applied_patches = spec_object.get_applied_patches()
+        new_spec_object = spec_object.copy('test-copy.spec')
+        assert new_spec_object.spec.path == spec_object.spec.path.parent / 'test-copy.spec'
+        assert str(new_spec_object.spec) == str(spec_object.spec)
+        assert new_spec_object.category == spec_object.category
+        assert [p.path for p in new_spec_object.get_applied_patches()] == [p.path for p in applied_patches]
+        new_spec_object.set_version('1.2.3')
+        assert new_spec_object.spec.expanded_version == '1.2.3'
+        assert spec_object.spec.expanded_version == '1.0.2'
+        new_spec_object.reload()
+        assert new_spec_object.spec.expanded_version == '1.2.3'
+
     @pytest.mark.parametrize('spec_attributes, sources', [
         (
             {
@@ -205,6 +223,335 @@ class TestSpecFile:
     def test_is_test_suite_enabled(self, mocked_spec_object, is_enabled):
         assert mocked_spec_object.is_test_suite_enabled() is is_enabled
 
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                Name:    test
+                Version: 1.0.2
+                Source0: %{name}-%{version}.tar.xz
+
+                %prep
+                %autosetup
+
+                %files
+                %doc README
+
+                %changelog
+                * Mon Jan 01 2024 John Doe <john.doe@example.com> - 1.0.2-1
+                - Initial package
+                """),
+        }
+    ])
+    def test__invalidate(self, mocked_spec_object):
+        # pylint: disable=protected-access
+        derived = dict(category=None, sources=(0, [], []), prep_section='', patches={})
+        mocked_spec_object._derived.update(derived)
+        with mocked_spec_object.spec.sections() as sections:
+            sections.changelog.insert(0, '- New upstream release')
+            sections.files.append('%license COPYING')
+        mocked_spec_object._invalidate(full=False)
+        assert set(mocked_spec_object._derived) == set(derived)
+        with mocked_spec_object.spec.sections() as sections:
+            sections.prep.append('rm -rf bundled')
+        mocked_spec_object._invalidate(full=False)
+        assert set(mocked_spec_object._derived) == {'category', 'sources'}
+        with mocked_spec_object.spec.sections() as sections:
+            sections.package[1] = 'Version: 1.0.3'
+        mocked_spec_object._invalidate(full=False)
+        assert not mocked_spec_object._derived
+        mocked_spec_object._derived.update(derived)
+        mocked_spec_object._invalidate()
+        assert not mocked_spec_object._derived
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                Name:    test
+                Version: 1.0.2
+                """),
+            'macros':
+                [
+                    Macro('name', None, 'test', MacroLevel.SPEC, False),
+                    Macro('version', None, '1.0.2', MacroLevel.SPEC, False),
+                ],
+        }
+    ])
+    def test_expand(self, mocked_spec_object):
+        calls = []
+        expand = mocked_spec_object.spec.expand
+        def counting_expand(expression, **kwargs):
+            calls.append(expression)
+            return expand(expression, **kwargs)
+        mocked_spec_object.spec.expand = counting_expand
+        assert mocked_spec_object.expand('%{name}-%{version}') == 'test-1.0.2'
+        assert mocked_spec_object.expand('%{name}-%{version}') == 'test-1.0.2'
+        assert len(calls) == 1
+        mocked_spec_object.spec._parser.macros = [('dist', '.fc40')]  # pylint: disable=protected-access
+        mocked_spec_object.expand('%{name}-%{version}')
+        assert len(calls) == 2
+        with mocked_spec_object.spec.sections() as sections:
+            sections.package[1] = 'Version: 1.0.3'
+        mocked_spec_object._invalidate(full=False)  # pylint: disable=protected-access
+        mocked_spec_object.expand('%{name}-%{version}')
+        assert len(calls) == 3
+        mocked_spec_object.expand('%{name}-%{version}')
+        assert len(calls) == 3
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                Name:    test
+                Version: 1.0.2
+                Patch0:  https://example.com/test-fix.patch
+                Patch1:  https://example.com/test-build.patch
+                Patch2:  https://example.com/missing.patch
+                """),
+        }
+    ])
+    def test_get_initial_patches(self, mocked_spec_object, workdir, monkeypatch):
+        calls = []
+
+        def download_files(downloads, *_, **__):
+            calls.append(downloads)
+            for url, destination in downloads:
+                if 'missing' not in url:
+                    with open(destination, 'w', encoding=ENCODING) as f:
+                        f.write(url)
+            return {url: DownloadError('Not Found') for url, _ in downloads if 'missing' in url}
+
+        monkeypatch.setattr(DownloadHelper, 'download_files', download_files)
+        monkeypatch.setattr(mocked_spec_object, '_get_patch_strip_options', lambda: {0: 1})
+        mocked_spec_object.spec.sourcedir = workdir
+        patches = mocked_spec_object._get_initial_patches()  # pylint: disable=protected-access
+        # all remote patches are downloaded at once
+        assert len(calls) == 1
+        assert [d[1] for d in calls[0]] == [
+            os.path.join(workdir, 'test-fix.patch'),
+            os.path.join(workdir, 'test-build.patch'),
+            os.path.join(workdir, 'missing.patch'),
+        ]
+        assert [p.get_patch_name() for p in patches['applied']] == ['test-fix.patch']
+        assert [p.get_patch_name() for p in patches['not_applied']] == ['test-build.patch']
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                Name:    test
+                Version: 1.0.2
+                Source0: %{name}-%{version}.tar.xz
+                Source1: test-tests.sh
+                Patch0:  test-fix.patch
+                Patch3:  test-build.patch
+                """),
+        }
+    ])
+    def test_source_index(self, mocked_spec_object):
+        assert mocked_spec_object.main_source_number == 0
+        assert mocked_spec_object.get_source_by_number(1).location == 'test-tests.sh'
+        assert mocked_spec_object.get_source_by_number(2) is None
+        assert mocked_spec_object.get_patch_by_number(3).location == 'test-build.patch'
+        assert mocked_spec_object.get_patch_by_number(1) is None
+        patch = mocked_spec_object.get_patch_by_number(0)
+        assert mocked_spec_object.get_corresponding_source(patch) is patch
+        source = mocked_spec_object.get_source_by_number(0)
+        assert mocked_spec_object.get_corresponding_source(source) is source
+
+    @pytest.mark.parametrize('spec_attributes', [{'spec_content': 'Name: test\n'}])
+    @pytest.mark.parametrize('packages, category', [
+        ([('test', [])], None),
+        ([('test', ['test', 'perl(Test)'])], None),
+        ([('test', ['test', 'python3-test', 'ruby-test'])], PackageCategory.python),
+        ([('test', ['rubygem-test', 'perl-test'])], PackageCategory.perl),
+        ([('test', []), ('R-test', ['rust-test'])], PackageCategory.R),
+    ], ids=[
+        'none',
+        'no_match',
+        'provide',
+        'category_order',
+        'subpackage',
+    ])
+    def test_category(self, monkeypatch, mocked_spec_object, packages, category):
+        rpm_spec = types.SimpleNamespace(packages=[
+            types.SimpleNamespace(header=types.SimpleNamespace(
+                name=name.encode(),
+                providename=[p.encode() for p in provides],
+            ))
+            for name, provides in packages
+        ])
+        monkeypatch.setattr(Specfile, 'rpm_spec', property(lambda _: rpm_spec))
+        monkeypatch.setattr(SpecFile, '_category_cache', {})
+        assert mocked_spec_object.category == category
+        mocked_spec_object._invalidate()  # pylint: disable=protected-access
+        rpm_spec.packages = []
+        # category of the same content is cached
+        assert mocked_spec_object.category == category
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': 'Name: test\n',
+            'macros': [Macro('_builddir', None, '/builddir', MacroLevel.MACROFILES, True)],
+        }
+    ])
+    def test_prep_lines(self, mocked_spec_object):
+        mocked_spec_object._derived['prep_section'] = dedent("""\
+            cd '/builddir'
+            rm -rf 'test-1.0.2'
+            tar -xf documentation.tar.xz \\
+              -C doc
+            cd test-1.0.2
+            /usr/bin/gzip -dc "misc.tar.gz" |
+              /usr/bin/tar -xof - -C 'misc
+            files'
+            /usr/bin/patch -p2 -s --fuzz=0 --no-backup-if-mismatch -f < test-fix.patch""")  # pylint: disable=protected-access
+        lines = mocked_spec_object.prep_lines
+        assert [line.line for line in lines] == [
+            "cd '/builddir'",
+            "rm -rf 'test-1.0.2'",
+            'tar -xf documentation.tar.xz   -C doc',
+            'cd test-1.0.2',
+            '/usr/bin/gzip -dc "misc.tar.gz" |  /usr/bin/tar -xof - -C \'miscfiles\'',
+            '/usr/bin/patch -p2 -s --fuzz=0 --no-backup-if-mismatch -f < test-fix.patch',
+        ]
+        assert [c.name for c in lines[4].commands] == ['gzip', 'tar']
+        assert lines[4].commands[1].args == ['-xof', '-', '-C', 'miscfiles']
+        assert lines[4].commands[1].basedir == '/builddir/test-1.0.2'
+        assert mocked_spec_object.get_prep_section() == [line.line for line in lines]
+        assert mocked_spec_object.find_archive_target_in_prep('documentation.tar.xz') == 'doc'
+        assert mocked_spec_object.find_archive_target_in_prep('misc.tar.gz') == 'test-1.0.2/miscfiles'
+        assert mocked_spec_object.find_archive_target_in_prep('other.tar.gz') is None
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                Name:    test
+                Version: 1.0.2
+                Release: 1%{?dist}
+                """),
+        }
+    ])
+    def test_transaction(self, mocked_spec_object):
+        saved = []
+        mocked_spec_object.spec.save = lambda: saved.append(str(mocked_spec_object.spec))
+        del mocked_spec_object.save
+        with mocked_spec_object.transaction():
+            mocked_spec_object.set_version('1.0.3')
+            with mocked_spec_object.transaction():
+                mocked_spec_object.set_release('2', preserve_macros=False)
+            assert not saved
+        assert saved == ['Name:    test\nVersion: 1.0.3\nRelease: 2%{?dist}\n']
+        with pytest.raises(RuntimeError):
+            with mocked_spec_object.transaction():
+                mocked_spec_object.set_version('1.0.4')
+                raise RuntimeError
+        assert len(saved) == 1
+        assert str(mocked_spec_object.spec) == saved[0]
+        with mocked_spec_object.transaction():
+            pass
+        assert len(saved) == 1
+        # reloading would discard changes made within the transaction
+        with mocked_spec_object.transaction():
+            mocked_spec_object.set_version('1.0.5')
+            with pytest.raises(RuntimeError):
+                mocked_spec_object.update()
+            with pytest.raises(RuntimeError):
+                mocked_spec_object.reload()
+        assert saved[-1] == 'Name:    test\nVersion: 1.0.5\nRelease: 2%{?dist}\n'
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                Name:    test
+                Version: 1.0.2
+                Release: 1%{?dist}
+
+                %files
+                %{_bindir}/test
+
+                %files devel
+                %{_includedir}/test.h
+                """),
+        }
+    ])
+    def test_get_changed_sections(self, mocked_spec_object):
+        snapshot = mocked_spec_object.get_sections_snapshot()
+        assert mocked_spec_object.get_changed_sections(snapshot) == set()
+        with mocked_spec_object.spec.sections() as sections:
+            sections.get('files devel').append('%{_libdir}/libtest.so')
+        assert mocked_spec_object.get_changed_sections(snapshot) == {'files'}
+        mocked_spec_object.set_release('2')
+        assert mocked_spec_object.get_changed_sections(snapshot) == {'files', 'package'}
+
+    @pytest.mark.parametrize('path, expected', [
+        ('/usr/share/man/man1/test.1', '%{_mandir}/man1/test.1'),
+        ('/usr/share/doc/test', '%{_datadir}/doc/test'),
+        ('/usr/bin/test /usr/bin/test2', '%{_bindir}/test %{_bindir}/test2'),
+        ('/opt/usr/lib', '/opt%{_prefix}/lib'),
+        ('/usr', '%{_prefix}'),
+        ('/etc/test', '/etc/test'),
+    ])
+    def test_macro_trie(self, path, expected):
+        trie = MacroTrie([
+            ('_prefix', '/usr'),
+            ('_datadir', '/usr/share'),
+            ('_mandir', '/usr/share/man'),
+            ('_bindir', '/usr/bin'),
+            ('_exec_prefix', '/usr'),
+            ('_empty', ''),
+        ])
+        assert trie.substitute(path) == expected
+
+    @pytest.mark.parametrize('path, expected', [
+        # longer body takes precedence even if a shorter one starts earlier
+        ('/var/usr/share', '/var%{_datadir}'),
+        # bodies of the same length take precedence in the specified order
+        ('/var/lib/data', '/var/%{_libdata}'),
+        ('/var/lib/test', '%{_sharedstatedir}/test'),
+        ('/var/usr/lib/data', '%{_varusr}/%{_libdata}'),
+    ])
+    def test_macro_trie_overlapping(self, path, expected):
+        trie = MacroTrie([
+            ('_prefix', '/usr'),
+            ('_datadir', '/usr/share'),
+            ('_libdata', 'lib/data'),
+            ('_sharedstatedir', '/var/lib'),
+            ('_varusr', '/var/usr'),
+        ])
+        assert trie.substitute(path) == expected
+
+    @pytest.mark.parametrize('spec_attributes', [
+        {
+            'spec_content': dedent("""\
+                %files
+                /usr/bin/test
+                """),
+            'macros':
+                [
+                    Macro('_prefix', None, '/usr', MacroLevel.MACROFILES, False),
+                    Macro('_bindir', None, '%{_prefix}/bin', MacroLevel.MACROFILES, False),
+                ],
+        }
+    ])
+    def test_substitute_path_with_macros(self, mocked_spec_object):
+        calls = []
+        get_active_macros = mocked_spec_object.spec.get_active_macros
+        expand = mocked_spec_object.spec.expand
+        def counting_get_active_macros():
+            calls.append('get_active_macros')
+            return get_active_macros()
+        def counting_expand(expression, **kwargs):
+            calls.append(expression)
+            return expand(expression, **kwargs)
+        mocked_spec_object.spec.get_active_macros = counting_get_active_macros
+        mocked_spec_object.spec.expand = counting_expand
+        assert mocked_spec_object.substitute_path_with_macros('/usr/bin/test') == '%{_bindir}/test'
+        count = len(calls)
+        for path in ['/usr/bin/test2', '/usr/share/test', '/usr/bin/test']:
+            mocked_spec_object.substitute_path_with_macros(path)
+        assert len(calls) == count
+        mocked_spec_object.spec._parser.macros = [('dist', '.fc40')]  # pylint: disable=protected-access
+        assert mocked_spec_object.substitute_path_with_macros('/usr/bin/test2') == '%{_bindir}/test2'
+        assert len(calls) > count
+
     def test_set_extra_version(self, spec_object):
         spec_object.set_version('1.0.3')
         spec_object.set_extra_version('beta1', True)
@@ -25,7 +25,10 @@
 import os
 import tempfile
 
+import pytest  # type: ignore
+
 from rebasehelper.constants import ENCODING
+from rebasehelper.plugins.build_tools import RpmbuildTemporaryEnvironment
 from rebasehelper.temporary_environment import TemporaryEnvironment
 
 
@@ -98,3 +101,67 @@ class TestTemporaryEnvironment:
             assert f.read() == path
 
         os.unlink(tmp_path)
+
+    def test_build_environment_pool(self, workdir):
+        for name in ['source.tar.gz', 'fix.patch', 'test.spec']:
+            with open(name, 'w', encoding=ENCODING) as f:
+                f.write(name)
+        results_dir = os.path.join(workdir, 'results')
+        os.makedirs(results_dir)
+
+        with RpmbuildTemporaryEnvironment(['source.tar.gz'], ['fix.patch'], 'test.spec', results_dir) as temp:
+            env = temp.env()
+            path = temp.path()
+            assert os.path.isfile(os.path.join(env[temp.TEMPDIR_SOURCES], 'fix.patch'))
+            os.makedirs(os.path.join(env[temp.TEMPDIR_BUILD], 'source', 'tests'))
+            os.makedirs(os.path.join(env[temp.TEMPDIR_RPMS], 'noarch'))
+            for artifact in [os.path.join(env[temp.TEMPDIR_RPMS], 'noarch', 'test-1.0-1.noarch.rpm'),
+                             os.path.join(env[temp.TEMPDIR_RESULTS], 'build.log'),
+                             # files in build trees are not artifacts
+                             os.path.join(env[temp.TEMPDIR_BUILD], 'source', 'tests', 'fixture.rpm'),
+                             os.path.join(env[temp.TEMPDIR_BUILD], 'source', 'config.log')]:
+                with open(artifact, 'w', encoding=ENCODING):
+                    pass
+
+        # the directory structure is emptied and kept for the next environment
+        assert os.path.isdir(env[RpmbuildTemporaryEnvironment.TEMPDIR_BUILD])
+        assert not os.listdir(env[RpmbuildTemporaryEnvironment.TEMPDIR_BUILD])
+        assert sorted(os.listdir(results_dir)) == ['build.log', 'test-1.0-1.noarch.rpm']
+
+        with RpmbuildTemporaryEnvironment(['source.tar.gz'], [], 'test.spec', results_dir) as temp:
+            assert temp.path() == path
+            assert os.listdir(temp.env()[temp.TEMPDIR_SOURCES]) == ['source.tar.gz']
+
+        RpmbuildTemporaryEnvironment.clear_pool()
+        assert not os.path.exists(path)
+
+    def test_build_environment_keep(self, workdir):
+        for name in ['source.tar.gz', 'test.spec']:
+            with open(name, 'w', encoding=ENCODING) as f:
+                f.write(name)
+        results_dir = os.path.join(workdir, 'results')
+        os.makedirs(results_dir)
+
+        with pytest.raises(RuntimeError):
+            with RpmbuildTemporaryEnvironment(['source.tar.gz'], [], 'test.spec', results_dir,
+                                              key='test.spec') as temp:
+                assert not temp.reused
+                path = temp.path()
+                build_tree = os.path.join(temp.env()[temp.TEMPDIR_BUILD], 'test-1.0')
+                os.makedirs(build_tree)
+                temp.keep()
+                raise RuntimeError()
+
+        # kept environment is reused including its content
+        with RpmbuildTemporaryEnvironment(['source.tar.gz'], [], 'test.spec', results_dir, key='test.spec') as temp:
+            assert temp.reused
+            assert temp.path() == path
+            assert os.path.isdir(build_tree)
+        assert not os.path.exists(build_tree)
+
+        with RpmbuildTemporaryEnvironment(['source.tar.gz'], [], 'test.spec', results_dir, key='test.spec') as temp:
+            assert not temp.reused
+            temp.keep()
+        RpmbuildTemporaryEnvironment.discard_kept('test.spec')
+        assert not os.path.exists(temp.path())
+        RpmbuildTemporaryEnvironment.clear_pool()